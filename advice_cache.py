@@ -0,0 +1,75 @@
+"""Persistente, content-addressed cache voor LLM-advies.
+
+Sleutel = sha256 van modelnaam + genormaliseerde prompt; de waarde is de lijst
+geparste "VERVANG"-regels, zodat een hit zowel generatie als regex-parsing
+overslaat. Opslag in SQLite (overleeft herstarts, deelbaar tussen processen)
+met LRU-eviction op `last_used` zodra er meer dan `max_entries` regels zijn.
+"""
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional, Union
+
+DEFAULT_PATH = Path(__file__).resolve().parent / "data" / "cache" / "advice.sqlite"
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Witruimte per regel samenvoegen en lege regels weglaten."""
+    lines = (re.sub(r"\s+", " ", ln).strip() for ln in prompt.splitlines())
+    return "\n".join(ln for ln in lines if ln)
+
+
+def cache_key(prompt: str, model: str) -> str:
+    return hashlib.sha256(f"{model}\0{normalize_prompt(prompt)}".encode("utf-8")).hexdigest()
+
+
+class AdviceCache:
+    def __init__(self, path: Union[str, Path] = DEFAULT_PATH, max_entries: int = 10_000):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Streamlit draait reruns op verschillende threads; toegang loopt via self._lock.
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False, timeout=10)
+        with self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("""CREATE TABLE IF NOT EXISTS advice (
+                                    key TEXT PRIMARY KEY, model TEXT NOT NULL,
+                                    lines TEXT NOT NULL, created REAL NOT NULL,
+                                    last_used REAL NOT NULL)""")
+            self._db.execute("CREATE INDEX IF NOT EXISTS advice_last_used ON advice(last_used)")
+
+    def get(self, prompt: str, model: str) -> Optional[List[str]]:
+        key = cache_key(prompt, model)
+        with self._lock, self._db:
+            row = self._db.execute("SELECT lines FROM advice WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE advice SET last_used = ? WHERE key = ?", (time.time(), key))
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, prompt: str, model: str, lines: List[str]) -> None:
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO advice VALUES (?, ?, ?, ?, ?)",
+                             (cache_key(prompt, model), model, json.dumps(lines, ensure_ascii=False),
+                              now, now))
+            self._db.execute("""DELETE FROM advice WHERE key IN (
+                                    SELECT key FROM advice ORDER BY last_used DESC
+                                    LIMIT -1 OFFSET ?)""", (self.max_entries,))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM advice").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
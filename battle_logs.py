@@ -0,0 +1,422 @@
+"""Stroomsgewijze analyse van battle-logs: kaartgebruik, winrates en scores.
+
+Invoer is JSONL met één match per regel. Herkende vormen:
+
+  {"decks": [[8 kaarten], [8 kaarten]], "winner": 0}        winner = index, null = gelijkspel
+  {"team": [{"cards": [{"name": ...}, ...], "crowns": 3}],   vorm van de Clash Royale-API;
+   "opponent": [{"cards": [...], "crowns": 1}]}              winnaar volgt uit de crowns
+
+Kaarten mogen strings of objecten met "name" zijn. Namen worden tegen CARD_DB
+gelegd, eerst exact en dan zonder hoofdletters/leestekens ("mini pekka" ->
+"Mini P.E.K.K.A"). Onbekende namen worden geteld (niet stil weggelaten zoals
+normalize_deck doet); matches met een deck zonder 8 unieke bekende kaarten
+tellen als 'incomplete' en doen verder niet mee.
+
+Bestanden worden in byte-ranges van --chunk-mb opgeknipt (gzip per bestand)
+en over een process pool verdeeld; elke range wordt in blokken van BATCH
+matches met evaluate_decks_batch gescoord (exact gelijk aan evaluate_deck).
+Alle aggregaten hebben een vaste grootte, onafhankelijk van de invoer:
+
+- per kaart: gebruik, gelijke spelen en winsten;
+- per metric (overall en elk deelcijfer): winrate per bucket;
+- hoe vaak het deck met de hoogste overall wint;
+- top-N decks en onbekende namen via een Space-Saving-sketch (benaderend:
+  'count' is een bovengrens, 'count - error' een ondergrens).
+
+    python -m battle_logs logs/*.jsonl.gz -o report.json --workers 16 --top 50
+"""
+import argparse
+import gzip
+import json
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from card_index import CARD_ID, CARD_NAMES, DB_VERSION, N_CARDS
+from deck_corpus import EMPTY, pack_rows
+from heuristics import BATCH_FIELDS, evaluate_decks_batch
+
+BATCH = 50_000
+CHUNK_MB = 64
+BINS = 20
+SKETCH_FACTOR = 20  # sketch-capaciteit = top * SKETCH_FACTOR
+COUNTERS = ("lines", "bad_lines", "matches", "draws", "incomplete", "unknown_cards")
+
+
+def _norm(name: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "", name.casefold())
+
+
+_LOOKUP: Dict[str, int] = {_norm(n): i for i, n in enumerate(CARD_NAMES)}
+# Ruwe naam -> ID (-1 = onbekend), zodat elke spelling maar één keer genormaliseerd wordt.
+_MEMO: Dict[str, int] = dict(CARD_ID)
+_MEMO_MAX = 100_000
+
+
+def _resolve(name: str) -> int:
+    i = _LOOKUP.get(_norm(name), -1)
+    if len(_MEMO) < _MEMO_MAX:
+        _MEMO[name] = i
+    return i
+
+
+def card_id(name: Any) -> Optional[int]:
+    """Kaart-ID voor een naam uit een log (exact of genormaliseerd), None als onbekend."""
+    if isinstance(name, dict):
+        name = name.get("name")
+    if not isinstance(name, str):
+        return None
+    i = _MEMO.get(name)
+    if i is None:
+        i = _resolve(name)
+    return i if i >= 0 else None
+
+
+def bucket_edges(field: str, bins: int = BINS) -> np.ndarray:
+    """Bucketgrenzen per veld: [0, 1] voor de metrics, [1, 9] elixir voor avg_elixir."""
+    lo, hi = (1.0, 9.0) if field == "avg_elixir" else (0.0, 1.0)
+    return np.linspace(lo, hi, bins + 1)
+
+
+def _side_cards(side: Any) -> list:
+    if isinstance(side, list):
+        side = side[0] if side and isinstance(side[0], dict) else side
+    return side.get("cards", []) if isinstance(side, dict) else side
+
+
+def parse_match(obj: Any) -> Tuple[list, list, Optional[int]]:
+    """(kaarten A, kaarten B, winnaar 0/1 of None bij gelijkspel) uit één logregel."""
+    if not isinstance(obj, dict):
+        raise ValueError("match is geen object")
+    if "decks" in obj:
+        a, b = obj["decks"]
+        winner = obj.get("winner")
+        if winner not in (0, 1, None):
+            raise ValueError(f"ongeldige winner: {winner!r}")
+        return a, b, winner
+    team, opp = obj["team"], obj["opponent"]
+    ca = sum(p.get("crowns", 0) for p in team) if isinstance(team, list) else team.get("crowns", 0)
+    cb = sum(p.get("crowns", 0) for p in opp) if isinstance(opp, list) else opp.get("crowns", 0)
+    return _side_cards(team), _side_cards(opp), None if ca == cb else int(cb > ca)
+
+
+# ---------- heavy hitters ----------
+class SpaceSaving:
+    """Mergebare Space-Saving-sketch met vaste capaciteit, blokgewijs bijgewerkt.
+
+    Per sleutel een geschatte telling (bovengrens), de maximale overschatting
+    en een meegetelde bijwaarde (winsten). Een sleutel die niet in de sketch
+    zit kan hooguit de kleinste telling van een volle sketch gehad hebben; die
+    wordt bij samenvoegen als overschatting opgeteld.
+    """
+
+    def __init__(self, capacity: int, dtype: Any = np.uint64):
+        self.capacity = capacity
+        self.keys = np.empty(0, dtype=dtype)
+        self.counts = np.empty(0, dtype=np.int64)
+        self.errors = np.empty(0, dtype=np.int64)
+        self.extra = np.empty(0, dtype=np.int64)
+        self.floor = 0  # telling die een ontbrekende sleutel hooguit had
+
+    def update(self, keys: np.ndarray, extra: Optional[np.ndarray] = None) -> None:
+        """Telt een blok sleutels (met optioneel per sleutel een bijwaarde) exact op en voegt samen."""
+        if not len(keys):
+            return
+        uniq, inv = np.unique(keys, return_inverse=True)
+        block = SpaceSaving(self.capacity, self.keys.dtype)
+        block.keys = uniq
+        block.counts = np.bincount(inv, minlength=len(uniq)).astype(np.int64)
+        block.errors = np.zeros(len(uniq), dtype=np.int64)
+        block.extra = (np.bincount(inv, weights=extra, minlength=len(uniq)).astype(np.int64)
+                       if extra is not None else np.zeros(len(uniq), dtype=np.int64))
+        block._truncate()
+        self.merge(block)
+
+    def merge(self, other: "SpaceSaving") -> None:
+        in_other = np.isin(self.keys, other.keys)
+        in_self = np.isin(other.keys, self.keys)
+        keys = np.concatenate([self.keys, other.keys])
+        bonus = np.concatenate([np.where(in_other, 0, other.floor),
+                                np.where(in_self, 0, self.floor)])
+        uniq, inv = np.unique(keys, return_inverse=True)
+
+        def total(a, b):
+            return np.bincount(inv, weights=np.concatenate([a, b]),
+                               minlength=len(uniq)).astype(np.int64)
+        # Een sleutel die in beide zit krijgt geen bonus; in één van beide precies één keer.
+        b = np.bincount(inv, weights=bonus, minlength=len(uniq)).astype(np.int64)
+        self.keys = uniq
+        self.counts = total(self.counts, other.counts) + b
+        self.errors = total(self.errors, other.errors) + b
+        self.extra = total(self.extra, other.extra)
+        self.floor += other.floor
+        self._truncate()
+
+    def _truncate(self) -> None:
+        if len(self.keys) <= self.capacity:
+            return
+        keep = np.argpartition(-self.counts, self.capacity - 1)[:self.capacity]
+        self.floor = max(self.floor, int(self.counts[keep].min()))
+        self.keys, self.counts = self.keys[keep], self.counts[keep]
+        self.errors, self.extra = self.errors[keep], self.extra[keep]
+
+    def top(self, n: int) -> List[Tuple[Any, int, int, int]]:
+        """(sleutel, telling, overschatting, bijwaarde), hoogste telling eerst."""
+        order = np.lexsort((self.keys, -self.counts))[:n]
+        return [(self.keys[i], int(self.counts[i]), int(self.errors[i]), int(self.extra[i]))
+                for i in order]
+
+
+# ---------- aggregaat ----------
+class Aggregate:
+    """Alle tellingen van (een deel van) de logs; vaste grootte, optelbaar via merge()."""
+
+    def __init__(self, top: int = 50, bins: int = BINS):
+        self.top, self.bins = top, bins
+        self.counts: Dict[str, int] = dict.fromkeys(COUNTERS, 0)
+        self.card_games = np.zeros(N_CARDS, dtype=np.int64)
+        self.card_draws = np.zeros(N_CARDS, dtype=np.int64)
+        self.card_wins = np.zeros(N_CARDS, dtype=np.int64)
+        self.edges = {f: bucket_edges(f, bins) for f in BATCH_FIELDS}
+        shape = (len(BATCH_FIELDS), bins)
+        self.bucket_games = np.zeros(shape, dtype=np.int64)
+        self.bucket_draws = np.zeros(shape, dtype=np.int64)
+        self.bucket_wins = np.zeros(shape, dtype=np.int64)
+        self.favorite = np.zeros(2, dtype=np.int64)  # [beslist met ongelijke overall, hoogste won]
+        self.decks = SpaceSaving(top * SKETCH_FACTOR)
+        self.unknown = SpaceSaving(top * SKETCH_FACTOR, dtype=object)
+
+    def add_batch(self, idx_a: np.ndarray, idx_b: np.ndarray, winner: np.ndarray) -> None:
+        """Scoort een blok matches; winner per match 0, 1 of -1 (gelijkspel)."""
+        n = len(winner)
+        sa, sb = evaluate_decks_batch(idx_a), evaluate_decks_batch(idx_b)
+        idx = np.concatenate([idx_a, idx_b])
+        won = np.concatenate([winner == 0, winner == 1])
+        draw = np.concatenate([winner < 0, winner < 0])
+
+        self.card_games += np.bincount(idx.ravel(), minlength=N_CARDS)
+        self.card_draws += np.bincount(idx[draw].ravel(), minlength=N_CARDS)
+        self.card_wins += np.bincount(idx[won].ravel(), minlength=N_CARDS)
+        for f, field in enumerate(BATCH_FIELDS):
+            vals = np.concatenate([sa[field], sb[field]])
+            b = np.clip(np.searchsorted(self.edges[field], vals, side="right") - 1,
+                        0, self.bins - 1)
+            self.bucket_games[f] += np.bincount(b, minlength=self.bins)
+            self.bucket_draws[f] += np.bincount(b[draw], minlength=self.bins)
+            self.bucket_wins[f] += np.bincount(b[won], minlength=self.bins)
+
+        decided = (winner >= 0) & (sa["overall"] != sb["overall"])
+        self.favorite[0] += int(decided.sum())
+        fav = np.where(sa["overall"] > sb["overall"], 0, 1)
+        self.favorite[1] += int((decided & (winner == fav)).sum())
+
+        self.decks.update(pack_rows(idx).view("<u8").ravel(), won.astype(np.int64))
+        self.counts["matches"] += n
+        self.counts["draws"] += int((winner < 0).sum())
+
+    def merge(self, other: "Aggregate") -> None:
+        for k, v in other.counts.items():
+            self.counts[k] += v
+        for name in ("card_games", "card_draws", "card_wins", "bucket_games", "bucket_draws",
+                     "bucket_wins", "favorite"):
+            getattr(self, name).__iadd__(getattr(other, name))
+        self.decks.merge(other.decks)
+        self.unknown.merge(other.unknown)
+
+    def report(self) -> Dict[str, Any]:
+        def rate(wins, games, draws):
+            decided = games - draws
+            return float(wins / decided) if decided else None
+
+        decks = 2 * self.counts["matches"]
+        cards = [{"card": CARD_NAMES[i], "games": int(self.card_games[i]),
+                  "usage": float(self.card_games[i] / decks),
+                  "win_rate": rate(self.card_wins[i], self.card_games[i], self.card_draws[i])}
+                 for i in np.argsort(-self.card_games, kind="stable") if self.card_games[i]]
+        buckets = {
+            field: [{"lo": float(e[j]), "hi": float(e[j + 1]),
+                     "games": int(self.bucket_games[f, j]),
+                     "win_rate": rate(self.bucket_wins[f, j], self.bucket_games[f, j],
+                                      self.bucket_draws[f, j])}
+                    for j in range(self.bins) if self.bucket_games[f, j]]
+            for f, (field, e) in enumerate(self.edges.items())}
+        top_decks = []
+        for key, count, err, wins in self.decks.top(self.top):
+            row = np.frombuffer(key.tobytes(), dtype=np.uint8)
+            top_decks.append({"deck": [CARD_NAMES[c] for c in row if c != EMPTY],
+                              "count": count, "error": err, "wins": wins})
+        return {
+            "db_version": DB_VERSION, **self.counts,
+            "favorite_win_rate": (float(self.favorite[1] / self.favorite[0])
+                                  if self.favorite[0] else None),
+            "cards": cards, "buckets": buckets, "top_decks": top_decks,
+            "unknown_names": [{"name": k, "count": c, "error": e}
+                              for k, c, e, _ in self.unknown.top(self.top)],
+        }
+
+
+# ---------- invoer ----------
+def plan_chunks(paths: Sequence[str], chunk_bytes: int) -> List[Tuple[str, int, int]]:
+    """Verdeelt de bestanden in (pad, start, eind)-ranges; gzip-bestanden als geheel (eind -1)."""
+    chunks = []
+    for path in paths:
+        if path.endswith(".gz"):
+            chunks.append((path, 0, -1))
+            continue
+        size = os.path.getsize(path)
+        chunks.extend((path, s, min(s + chunk_bytes, size)) for s in range(0, size, chunk_bytes))
+    return chunks
+
+
+def _lines(path: str, start: int, end: int) -> Iterator[bytes]:
+    """Regels die in [start, end) beginnen; een range begint na de eerste newline."""
+    if end < 0:
+        with gzip.open(path, "rb") as f:
+            yield from f
+        return
+    with open(path, "rb") as f:
+        pos = start
+        if start:
+            f.seek(start - 1)
+            pos = start - 1 + len(f.readline())
+        while pos < end:
+            line = f.readline()
+            if not line:
+                return
+            pos += len(line)
+            yield line
+
+
+def _deck_row(cards: Any, unknown: List[str]) -> Optional[List[int]]:
+    if not isinstance(cards, list):
+        return None
+    ids = []
+    for c in cards:
+        if c.__class__ is dict:
+            c = c.get("name")
+        i = _MEMO.get(c) if c.__class__ is str else -1
+        if i is None:
+            i = _resolve(c)
+        if i < 0:
+            unknown.append(str(c))
+        else:
+            ids.append(i)
+    return ids if len(ids) == len(cards) == 8 and len(set(ids)) == 8 else None
+
+
+def match_batches(path: str, start: int = 0, end: Optional[int] = None,
+                  counts: Optional[Dict[str, int]] = None, unknown: Optional[List[str]] = None,
+                  batch: int = BATCH) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """Blokken (idx_a, idx_b, winner) uit een logbestand of byte-range; winner -1 = gelijkspel.
+
+    Zonder end wordt het hele bestand gelezen. counts (lines, bad_lines,
+    incomplete) en unknown (onbekende namen) worden bijgewerkt als ze meegegeven zijn.
+    """
+    if end is None:
+        end = -1 if path.endswith(".gz") else os.path.getsize(path)
+    counts = dict.fromkeys(COUNTERS, 0) if counts is None else counts
+    unknown = [] if unknown is None else unknown
+    rows_a: List[List[int]] = []
+    rows_b: List[List[int]] = []
+    winners: List[int] = []
+
+    def block():
+        out = (np.array(rows_a, dtype=np.int16), np.array(rows_b, dtype=np.int16),
+               np.array(winners, dtype=np.int8))
+        rows_a.clear(), rows_b.clear(), winners.clear()
+        return out
+
+    for line in _lines(path, start, end):
+        if not line.strip():
+            continue
+        counts["lines"] += 1
+        try:
+            a, b, winner = parse_match(json.loads(line))
+        except (KeyError, TypeError, ValueError, AttributeError, IndexError):
+            counts["bad_lines"] += 1
+            continue
+        ra, rb = _deck_row(a, unknown), _deck_row(b, unknown)
+        if ra is None or rb is None:
+            counts["incomplete"] += 1
+            continue
+        rows_a.append(ra)
+        rows_b.append(rb)
+        winners.append(-1 if winner is None else winner)
+        if len(winners) >= batch:
+            yield block()
+    if winners:
+        yield block()
+
+
+def scan_chunk(path: str, start: int, end: int, top: int = 50, bins: int = BINS) -> Aggregate:
+    """Verwerkt één byte-range (of gzip-bestand) tot een Aggregate."""
+    agg = Aggregate(top, bins)
+    unknown: List[str] = []
+
+    def flush_unknown():
+        if unknown:
+            agg.counts["unknown_cards"] += len(unknown)
+            agg.unknown.update(np.array(unknown, dtype=object))
+            unknown.clear()
+
+    for idx_a, idx_b, winner in match_batches(path, start, end, agg.counts, unknown):
+        agg.add_batch(idx_a, idx_b, winner)
+        flush_unknown()
+    flush_unknown()
+    return agg
+
+
+def analyze(paths: Sequence[str], workers: Optional[int] = None, chunk_mb: int = CHUNK_MB,
+            top: int = 50, bins: int = BINS) -> Dict[str, Any]:
+    """Verwerkt alle logs over een process pool en geeft het samengevoegde rapport."""
+    for p in paths:
+        if not Path(p).is_file():
+            raise ValueError(f"bestand niet gevonden: {p}")
+    chunks = plan_chunks(paths, chunk_mb << 20)
+    total = Aggregate(top, bins)
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        futures = [ex.submit(scan_chunk, path, s, e, top, bins) for path, s, e in chunks]
+        for i, fut in enumerate(as_completed(futures), 1):
+            total.merge(fut.result())
+            print(f"chunk {i}/{len(chunks)} klaar", file=sys.stderr)
+    report = total.report()
+    report["files"] = list(paths)
+    return report
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    p = argparse.ArgumentParser(description="Kaartgebruik, winrates en scores uit battle-logs (JSONL).")
+    p.add_argument("logs", nargs="+", help="JSONL-bestanden (.jsonl of .jsonl.gz)")
+    p.add_argument("-o", "--output", default="-", help="rapport (JSON); '-' = stdout")
+    p.add_argument("--workers", type=int, default=None, help="default: alle cores")
+    p.add_argument("--chunk-mb", type=int, default=CHUNK_MB, help="grootte van een werkeenheid")
+    p.add_argument("--top", type=int, default=50, help="aantal top-decks en onbekende namen")
+    p.add_argument("--bins", type=int, default=BINS, help="buckets per metric")
+    args = p.parse_args(argv)
+
+    try:
+        if args.chunk_mb < 1 or args.top < 1 or args.bins < 1:
+            raise ValueError("--chunk-mb, --top en --bins moeten positief zijn.")
+        report = analyze(args.logs, args.workers, args.chunk_mb, args.top, args.bins)
+    except (OSError, ValueError) as e:
+        print(f"Fout: {e}", file=sys.stderr)
+        return 2
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output == "-":
+        print(text)
+    else:
+        Path(args.output).write_text(text, encoding="utf-8")
+    fav = report["favorite_win_rate"]
+    print(f"{report['matches']} matches ({report['incomplete']} incompleet, "
+          f"{report['bad_lines']} onleesbaar), {report['unknown_cards']} onbekende kaarten; "
+          f"hoogste overall wint {'-' if fav is None else f'{100 * fav:.1f}%'}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
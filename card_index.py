@@ -0,0 +1,65 @@
+"""Gecompileerde weergave van CARD_DB: integer-ID's, bitmaskers en elixir-arrays.
+
+Wordt één keer bij import opgebouwd; alle snelle evaluators (bitmasker, batch,
+solver) werken op deze tabellen in plaats van op de dicts uit card_db.
+"""
+import hashlib
+import json
+from typing import Dict, Iterable, List, Tuple
+
+from card_db import CARD_DB
+
+# Kaart-ID = positie in CARD_DB (insertion order).
+CARD_NAMES: Tuple[str, ...] = tuple(CARD_DB.keys())
+CARD_ID: Dict[str, int] = {n: i for i, n in enumerate(CARD_NAMES)}
+N_CARDS = len(CARD_NAMES)
+
+TAGS: Tuple[str, ...] = tuple(sorted({t for c in CARD_DB.values() for t in c["tags"]}))
+ROLES: Tuple[str, ...] = tuple(sorted({r for c in CARD_DB.values() for r in c["roles"]}))
+TAG_BIT: Dict[str, int] = {t: 1 << i for i, t in enumerate(TAGS)}
+ROLE_BIT: Dict[str, int] = {r: 1 << i for i, r in enumerate(ROLES)}
+
+
+def _mask(items: Iterable[str], bits: Dict[str, int]) -> int:
+    m = 0
+    for x in items:
+        m |= bits[x]
+    return m
+
+
+TAG_MASK: List[int] = [_mask(CARD_DB[n]["tags"], TAG_BIT) for n in CARD_NAMES]
+ROLE_MASK: List[int] = [_mask(CARD_DB[n]["roles"], ROLE_BIT) for n in CARD_NAMES]
+ELIXIR: List[int] = [CARD_DB[n]["elixir"] for n in CARD_NAMES]
+
+# Per-kaart bijdragen aan de tellers van role_balance_score / win_condition_score.
+OFFENSE: List[int] = [int("offense" in CARD_DB[n]["roles"]) for n in CARD_NAMES]
+DEFENSE: List[int] = [int("defense" in CARD_DB[n]["roles"]) + int("building" in CARD_DB[n]["tags"])
+                      for n in CARD_NAMES]
+WINCON: List[int] = [int("wincon" in CARD_DB[n]["tags"]) for n in CARD_NAMES]
+
+# Tags die in een metric meetellen, als compact masker: samen met offense−defense,
+# wincon-telling en elixirsom bepalen ze alle scores (de "signatuur" van een deck).
+SCORE_TAGS: Tuple[str, ...] = ("anti_air", "splash", "building", "tank_killer",
+                               "small_spell", "medium_spell", "big_spell", "swarm", "wincon")
+SCORE_BIT: Dict[str, int] = {t: 1 << i for i, t in enumerate(SCORE_TAGS)}
+SCORE_MASK: List[int] = [_mask((t for t in CARD_DB[n]["tags"] if t in SCORE_BIT), SCORE_BIT)
+                         for n in CARD_NAMES]
+
+# Verandert zodra CARD_DB inhoudelijk verandert; gebruikt voor caches en bestanden op schijf.
+DB_VERSION: str = hashlib.sha1(
+    json.dumps(CARD_DB, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def tag_bit(tag: str) -> int:
+    """Bit van een tag, 0 als geen enkele kaart de tag heeft."""
+    return TAG_BIT.get(tag, 0)
+
+
+def to_ids(names: Iterable[str]) -> List[int]:
+    """Zelfde semantiek als normalize_deck: onbekende namen vallen weg, max 8 kaarten."""
+    ids = [CARD_ID[n] for n in names if n in CARD_ID]
+    return ids[:8]
+
+
+def to_names(ids: Iterable[int]) -> List[str]:
+    return [CARD_NAMES[i] for i in ids]
@@ -0,0 +1,389 @@
+"""Compact deckcorpus-formaat (.decks) met memory-mapped laden.
+
+Indeling van een bestand:
+
+  8 bytes   magic b"CRDECK1\\0"
+  8 bytes   lengte van de header (uint64, little endian)
+  header    JSON: db_version, score_version, card_names, n_decks, en per kolom
+            dtype/shape/offset
+  kolommen  elk op een 64-byte grens, kolom voor kolom
+
+Kolommen:
+  cards              (N, 8) uint8 kaart-ID's, per rij oplopend gesorteerd, 255 = leeg slot.
+                     Omdat de rij canoniek is, is cards.view("<u8") een 64-bit sleutel per deck
+                     (keys()); de oorspronkelijke kaartvolgorde wordt niet bewaard.
+  <metric>           optioneel, float64 per BATCH_FIELDS-veld (avg_elixir, balance, ... overall)
+  name_offsets/name_data   optioneel, decknamen als uint64-offsets plus utf-8-bytes
+
+load_corpus() opent alle kolommen via numpy.memmap: openen kost alleen het
+lezen van de header, ook bij 100M decks. De header bevat DB_VERSION en de
+kaartnamen; wijkt CARD_DB af, dan weigert load_corpus het bestand tenzij
+remap=True (dan worden de ID's in het geheugen omgezet). Opgeslagen metrics
+van een andere CARD_DB worden genegeerd; is alleen SCORE_VERSION anders (nieuwe
+gewichten), dan wordt overall uit de opgeslagen deelcijfers herberekend.
+
+    python -m deck_corpus pack data/benchmark_decks.csv -o data/benchmark.decks --score
+    python -m deck_corpus unpack data/benchmark.decks -o decks.jsonl
+    python -m deck_corpus info data/benchmark.decks
+"""
+import argparse
+import io
+import json
+import os
+import shutil
+import struct
+import sys
+from itertools import islice
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+
+from card_index import CARD_ID, CARD_NAMES, DB_VERSION, N_CARDS
+from heuristics import (BATCH_FIELDS, SCORE_VERSION, evaluate_decks_batch, names_to_indices,
+                        overall_batch)
+
+MAGIC = b"CRDECK1\0"
+FORMAT_VERSION = 1
+EMPTY = 255
+ALIGN = 64
+CHUNK = 1_000_000
+
+PathLike = Union[str, Path]
+
+
+def pack_rows(indices: np.ndarray) -> np.ndarray:
+    """(n, <=8) kaart-ID's (-1 = leeg) -> canonieke (n, 8) uint8-rijen."""
+    idx = np.asarray(indices)
+    out = np.full((len(idx), 8), EMPTY, dtype=np.uint8)
+    out[:, :idx.shape[1]] = np.where(idx >= 0, idx, EMPTY)
+    out.sort(axis=1)
+    return out
+
+
+def unpack_rows(cards: np.ndarray) -> np.ndarray:
+    """Canonieke uint8-rijen -> (n, 8) int16 met -1 voor lege slots."""
+    idx = cards.astype(np.int16)
+    idx[cards == EMPTY] = -1
+    return idx
+
+
+def _align(n: int) -> int:
+    return -(-n // ALIGN) * ALIGN
+
+
+class CorpusWriter:
+    """Schrijft een .decks-bestand stroomsgewijs; kolommen gaan eerst naar tijdelijke bestanden."""
+
+    def __init__(self, path: PathLike, metrics: bool = False, names: bool = False):
+        if N_CARDS >= EMPTY:
+            raise ValueError(f"CARD_DB heeft {N_CARDS} kaarten; uint8-ID's gaan tot {EMPTY - 1}")
+        self.path = Path(path)
+        self.n = 0
+        self.columns: Dict[str, Tuple[str, Tuple[int, ...]]] = {"cards": ("|u1", (8,))}
+        if metrics:
+            self.columns.update({f: ("<f8", ()) for f in BATCH_FIELDS})
+        if names:
+            self.columns["name_data"] = ("|u1", ())
+        self._names = names
+        self._name_bytes = 0
+        self._name_offsets: List[np.ndarray] = []
+        self._tmp = {c: open(self._tmp_path(c), "wb") for c in self.columns}
+
+    def _tmp_path(self, column: str) -> Path:
+        return self.path.with_name(f"{self.path.name}.{column}.tmp")
+
+    def write(self, cards: np.ndarray, metrics: Optional[np.ndarray] = None,
+              names: Optional[List[str]] = None) -> None:
+        """Voegt canonieke rijen toe (zie pack_rows); metrics als BATCH_DTYPE-array."""
+        self._tmp["cards"].write(np.ascontiguousarray(cards, dtype=np.uint8).tobytes())
+        if "overall" in self.columns:
+            if metrics is None:
+                raise ValueError("deze corpus heeft metric-kolommen; geef metrics mee")
+            for f in BATCH_FIELDS:
+                self._tmp[f].write(np.ascontiguousarray(metrics[f], dtype="<f8").tobytes())
+        if self._names:
+            if names is None or len(names) != len(cards):
+                raise ValueError("deze corpus heeft namen; geef er één per deck mee")
+            encoded = [s.encode("utf-8") for s in names]
+            lengths = np.fromiter((len(b) for b in encoded), dtype=np.uint64, count=len(encoded))
+            self._name_offsets.append(self._name_bytes + np.cumsum(lengths, dtype=np.uint64))
+            self._name_bytes += int(lengths.sum())
+            self._tmp["name_data"].write(b"".join(encoded))
+        self.n += len(cards)
+
+    def abort(self) -> None:
+        for f in self._tmp.values():
+            f.close()
+        for c in list(self.columns) + ["name_offsets"]:
+            self._tmp_path(c).unlink(missing_ok=True)
+
+    def close(self) -> Path:
+        for f in self._tmp.values():
+            f.close()
+        shapes = {c: (self.n,) + extra for c, (_, extra) in self.columns.items()}
+        sources = {c: self._tmp_path(c) for c in self.columns}
+        if self._names:
+            shapes["name_data"] = (self._name_bytes,)
+            offsets = np.concatenate([np.zeros(1, dtype=np.uint64)] + self._name_offsets)
+            off_path = self._tmp_path("name_offsets")
+            offsets.astype("<u8").tofile(off_path)
+            self.columns["name_offsets"] = ("<u8", ())
+            shapes["name_offsets"] = (self.n + 1,)
+            sources["name_offsets"] = off_path
+
+        # Offsets hangen af van de headerlengte: opbouwen tot die niet meer verandert.
+        layout: Dict[str, Dict[str, Any]] = {}
+        header_len = 0
+        while True:
+            pos = _align(len(MAGIC) + 8 + header_len)
+            for c, (dtype, _) in self.columns.items():
+                size = int(np.prod(shapes[c])) * np.dtype(dtype).itemsize
+                layout[c] = {"dtype": dtype, "shape": list(shapes[c]), "offset": pos}
+                pos = _align(pos + size)
+            header = json.dumps({"format": "crdeck", "version": FORMAT_VERSION,
+                                 "db_version": DB_VERSION, "score_version": SCORE_VERSION,
+                                 "card_names": list(CARD_NAMES),
+                                 "n_decks": self.n, "canonical": True,
+                                 "columns": layout}).encode("utf-8")
+            if len(header) == header_len:
+                break
+            header_len = len(header)
+
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp, "wb") as out:
+            out.write(MAGIC + struct.pack("<Q", len(header)) + header)
+            for c in self.columns:
+                out.write(b"\0" * (layout[c]["offset"] - out.tell()))
+                with open(sources[c], "rb") as src:
+                    shutil.copyfileobj(src, out, 16 << 20)
+        for p in sources.values():
+            p.unlink()
+        os.replace(tmp, self.path)
+        return self.path
+
+
+class DeckCorpus:
+    """Read-only, memory-mapped .decks-bestand."""
+
+    def __init__(self, path: PathLike, header: Dict[str, Any], columns: Dict[str, np.ndarray]):
+        self.path = Path(path)
+        self.header = header
+        self._columns = columns
+        self.cards: np.ndarray = columns["cards"]
+
+    def __len__(self) -> int:
+        return self.header["n_decks"]
+
+    @property
+    def metric_fields(self) -> List[str]:
+        """Metrics die het bestand levert; overall ook als het uit de deelcijfers volgt."""
+        if "balance" not in self._columns:
+            return []
+        return list(BATCH_FIELDS)
+
+    @property
+    def has_names(self) -> bool:
+        return "name_data" in self._columns
+
+    def column(self, name: str) -> np.ndarray:
+        return self._columns[name]
+
+    def keys(self) -> np.ndarray:
+        """Unieke 64-bit sleutel per deck (zero-copy view op de cards-kolom)."""
+        return self.cards.view("<u8").reshape(len(self))
+
+    def indices(self, start: int = 0, stop: Optional[int] = None) -> np.ndarray:
+        """(n, 8) int16 kaart-ID's met -1 voor lege slots, voor evaluate_decks_batch."""
+        return unpack_rows(self.cards[start:stop])
+
+    def name(self, i: int) -> str:
+        off = self._columns["name_offsets"]
+        return bytes(self._columns["name_data"][int(off[i]):int(off[i + 1])]).decode("utf-8")
+
+    def names(self, start: int = 0, stop: Optional[int] = None) -> List[str]:
+        stop = len(self) if stop is None else stop
+        if not self.has_names:
+            return [str(i + 1) for i in range(start, stop)]
+        off = self._columns["name_offsets"][start:stop + 1].astype(np.int64)
+        blob = bytes(self._columns["name_data"][off[0]:off[-1]])
+        return [blob[a - off[0]:b - off[0]].decode("utf-8") for a, b in zip(off[:-1], off[1:])]
+
+    def metrics(self, start: int = 0, stop: Optional[int] = None) -> np.ndarray:
+        """Opgeslagen metrics als BATCH_DTYPE-array, of berekend als het bestand ze niet heeft."""
+        if not self.metric_fields:
+            return evaluate_decks_batch(self.indices(start, stop))
+        stop = len(self) if stop is None else stop
+        out = np.empty(stop - start, dtype=[(f, np.float64) for f in BATCH_FIELDS])
+        for f in BATCH_FIELDS[:-1]:
+            out[f] = self._columns[f][start:stop]
+        if "overall" in self._columns:
+            out["overall"] = self._columns["overall"][start:stop]
+        else:
+            out["overall"] = overall_batch(*(out[f] for f in BATCH_FIELDS[1:-1]),
+                                           out["avg_elixir"])
+        return out
+
+
+def load_corpus(path: PathLike, remap: bool = False) -> DeckCorpus:
+    """Opent een .decks-bestand; alle kolommen zijn np.memmap's (behalve na remap)."""
+    path = Path(path)
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is geen .decks-bestand")
+        (header_len,) = struct.unpack("<Q", f.read(8))
+        header = json.loads(f.read(header_len).decode("utf-8"))
+    if header.get("version") != FORMAT_VERSION:
+        raise ValueError(f"{path}: formaatversie {header.get('version')} niet ondersteund")
+    columns = {}
+    for name, c in header["columns"].items():
+        shape = tuple(c["shape"])
+        if not np.prod(shape):
+            columns[name] = np.empty(shape, dtype=c["dtype"])
+        else:
+            columns[name] = np.memmap(path, dtype=c["dtype"], mode="r", offset=c["offset"],
+                                      shape=shape)
+    if header["db_version"] != DB_VERSION:
+        # Opgeslagen metrics horen bij een oude CARD_DB; metrics() rekent ze opnieuw uit.
+        for f in BATCH_FIELDS:
+            columns.pop(f, None)
+    elif header.get("score_version") != SCORE_VERSION:
+        # Andere gewichten: de deelcijfers kloppen nog, overall rekent metrics() opnieuw uit.
+        columns.pop("overall", None)
+    if header["card_names"] != list(CARD_NAMES):
+        if not remap:
+            raise ValueError(f"{path} is geschreven met een andere CARD_DB "
+                             f"({header['db_version']}, nu {DB_VERSION}); gebruik remap=True")
+        table = np.full(256, EMPTY, dtype=np.uint8)
+        for old, name in enumerate(header["card_names"]):
+            if name in CARD_ID:
+                table[old] = CARD_ID[name]
+        columns["cards"] = pack_rows(unpack_rows(table[columns["cards"]]))
+    return DeckCorpus(path, header, columns)
+
+
+# ---------- converters ----------
+def pack_decks(decks: Iterable[Tuple[str, List[str]]], path: PathLike, score: bool = False,
+               names: bool = True, chunk_size: int = CHUNK) -> int:
+    """Schrijft (naam, kaarten)-paren naar een .decks-bestand; geeft het aantal decks."""
+    writer = CorpusWriter(path, metrics=score, names=names)
+    it = iter(decks)
+    try:
+        while True:
+            chunk = list(islice(it, chunk_size))
+            if not chunk:
+                break
+            idx = names_to_indices([cards for _, cards in chunk])
+            writer.write(pack_rows(idx), evaluate_decks_batch(idx) if score else None,
+                         [n for n, _ in chunk] if names else None)
+    except BaseException:
+        writer.abort()
+        raise
+    writer.close()
+    return writer.n
+
+
+def iter_corpus(corpus: DeckCorpus,
+                chunk_size: int = CHUNK) -> Iterator[Tuple[str, List[str], Optional[tuple]]]:
+    """(naam, kaarten, metric-rij of None) per deck, in BATCH_FIELDS-volgorde."""
+    for start in range(0, len(corpus), chunk_size):
+        stop = min(start + chunk_size, len(corpus))
+        names = corpus.names(start, stop)
+        rows = corpus.metrics(start, stop).tolist() if corpus.metric_fields else [None] * len(names)
+        for name, cards, row in zip(names, corpus.cards[start:stop].tolist(), rows):
+            yield name, [CARD_NAMES[i] for i in cards if i != EMPTY], row
+
+
+def write_csv(corpus: DeckCorpus, f, chunk_size: int = CHUNK) -> int:
+    """Deck,Cards (zoals benchmark_decks.csv) plus de metric-kolommen van score_decks."""
+    import csv
+    from score_decks import COLUMNS, round_row
+    w = csv.writer(f, lineterminator="\n")
+    with_metrics = bool(corpus.metric_fields)
+    w.writerow(["Deck", "Cards"] + (COLUMNS[1:] if with_metrics else []))
+    n = 0
+    for name, cards, row in iter_corpus(corpus, chunk_size):
+        out = [name, ";".join(cards)]
+        if with_metrics:
+            avg, bal, cov, spl, wc, syn, ovr = row
+            out += ["%g" % v for v in round_row((name, avg, ovr, bal, cov, spl, wc, syn))[1:]]
+        w.writerow(out)
+        n += 1
+    return n
+
+
+def write_jsonl(corpus: DeckCorpus, f, chunk_size: int = CHUNK) -> int:
+    """{"name", "cards"[, "avg_elixir", "metrics"]} per regel (invoer voor score_decks)."""
+    n = 0
+    for name, cards, row in iter_corpus(corpus, chunk_size):
+        obj: Dict[str, Any] = {"name": name, "cards": cards}
+        if row is not None:
+            obj["avg_elixir"] = row[0]
+            obj["metrics"] = dict(zip(BATCH_FIELDS[1:], row[1:]))
+        f.write(json.dumps(obj, ensure_ascii=False) + "\n")
+        n += 1
+    return n
+
+
+def _text_format(path: str, explicit: Optional[str]) -> str:
+    return explicit or ("jsonl" if path.endswith((".jsonl", ".json")) else "csv")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    from score_decks import read_decks
+
+    p = argparse.ArgumentParser(description="Converteer deckcorpora van/naar het .decks-formaat.")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    pk = sub.add_parser("pack", help="CSV/JSONL -> .decks")
+    pk.add_argument("input", help="invoerbestand, of - voor stdin")
+    pk.add_argument("-o", "--output", required=True)
+    pk.add_argument("--in-format", choices=("csv", "jsonl"))
+    pk.add_argument("--score", action="store_true", help="metric-kolommen meeschrijven")
+    pk.add_argument("--no-names", action="store_true", help="decknamen niet opslaan")
+    up = sub.add_parser("unpack", help=".decks -> CSV/JSONL")
+    up.add_argument("input")
+    up.add_argument("-o", "--output", default="-")
+    up.add_argument("--out-format", choices=("csv", "jsonl"))
+    info = sub.add_parser("info", help="header en kolommen tonen")
+    info.add_argument("input")
+    args = p.parse_args(argv)
+
+    try:
+        if args.cmd == "pack":
+            src = (io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8-sig") if args.input == "-"
+                   else open(args.input, encoding="utf-8-sig", newline=""))
+            with src:
+                n = pack_decks(read_decks(src, _text_format(args.input, args.in_format)),
+                               args.output, score=args.score, names=not args.no_names)
+            print(f"{n} decks geschreven naar {args.output}.", file=sys.stderr)
+        elif args.cmd == "unpack":
+            corpus = load_corpus(args.input, remap=True)
+            fmt = _text_format(args.output, args.out_format)
+            # Zelfde BOM als score_decks voor CSV-bestanden, niet op stdout.
+            out = (sys.stdout if args.output == "-" else
+                   open(args.output, "w", encoding="utf-8-sig" if fmt == "csv" else "utf-8",
+                        newline=""))
+            try:
+                n = (write_jsonl if fmt == "jsonl" else write_csv)(corpus, out)
+            finally:
+                if out is not sys.stdout:
+                    out.close()
+            print(f"{n} decks uitgepakt.", file=sys.stderr)
+        else:
+            corpus = load_corpus(args.input, remap=True)
+            h = corpus.header
+            print(json.dumps({"n_decks": h["n_decks"], "db_version": h["db_version"],
+                              "db_current": h["db_version"] == DB_VERSION,
+                              "score_current": h.get("score_version") == SCORE_VERSION,
+                              "columns": {c: v["dtype"] for c, v in h["columns"].items()},
+                              "bytes": corpus.path.stat().st_size}, indent=2))
+    except BrokenPipeError:
+        return 0
+    except (OSError, ValueError) as e:
+        print(f"Fout: {e}", file=sys.stderr)
+        return 2
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,455 @@
+"""Zoekindex voor (bijna-)gelijke decks over grote deckcorpora.
+
+Een deck is een verzameling van 8 kaart-ID's. Per uniek deck bewaart de index:
+
+  hkey     64-bit hash: de som (mod 2^64) van een vaste random waarde per kaart.
+           Omdat de som niet van de volgorde afhangt, is de hash van "deck min
+           kaart a plus kaart x" gewoon hkey - H[a] + H[x].
+  key      canonieke sleutel (gesorteerde uint8-ID's als uint64, zoals deck_corpus)
+  count    aantal keer gezien; results/wins: aantal met bekende uitslag en gewonnen
+
+Segmenten zijn gesorteerd op hkey en staan als losse .npy-kolommen op schijf
+(geopend met mmap), met een bitmapfilter van FILTER_BITS bits per deck. add()
+schrijft een nieuw segment en voegt segmenten van vergelijkbare grootte samen
+(zoals een LSM-tree), dus de index groeit incrementeel.
+
+Zoeken naar "deelt >= 6 kaarten" is exact: alle decks op afstand 1 of 2
+(8*101 + 28*5050 hashes) worden door optellen opgesomd, door het filter
+gehaald en de paar overblijvers worden met searchsorted opgezocht en tegen de
+canonieke sleutel gecontroleerd. Dat kost milliseconden, los van de grootte
+van de index. Lagere drempels en onvolledige decks vallen terug op een
+lineaire scan.
+
+    python -m deck_index build runs/ladder.idx ladder.decks
+    python -m deck_index build runs/ladder.idx --battle-logs logs/*.jsonl.gz
+    python -m deck_index query runs/ladder.idx "Hog Rider;Musketeer;Cannon;Fireball;..." -k 10
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+from itertools import combinations, islice
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from card_index import CARD_ID, CARD_NAMES, DB_VERSION, N_CARDS
+from deck_corpus import EMPTY, pack_rows
+
+FORMAT = "deck_index"
+FORMAT_VERSION = 1
+COLUMNS = ("hkey", "key", "count", "results", "wins")
+FILTER_BITS = 16     # filterbits per deck (~6% valse positieven)
+MERGE_RATIO = 2      # voeg samen zolang het vorige segment <= 2x het nieuwste is
+BATCH = 5_000_000    # decks per segment bij het bouwen
+SCAN_CHUNK = 1_000_000
+
+_MASK64 = (1 << 64) - 1
+
+
+def _splitmix64(x: int) -> int:
+    x = (x + 0x9E3779B97F4A7C15) & _MASK64
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return x ^ (x >> 31)
+
+
+# Hashwaarde per uint8-kaart-ID; lege slots (EMPTY) en ongebruikte ID's tellen als 0.
+HASH = np.zeros(256, dtype=np.uint64)
+HASH[:N_CARDS] = [_splitmix64(i + 1) for i in range(N_CARDS)]
+
+_PAIRS8 = np.array(list(combinations(range(8), 2)))                    # (28, 2)
+_KEEP6 = np.array([[i for i in range(8) if i not in p] for p in _PAIRS8])  # (28, 6)
+_OTHER_PAIRS = np.array(list(combinations(range(N_CARDS - 8), 2)))     # (5050, 2)
+
+
+def deck_hash(rows: np.ndarray) -> np.ndarray:
+    """hkey per canonieke uint8-rij (of per rij kaart-ID's)."""
+    return HASH[rows].sum(axis=1, dtype=np.uint64)
+
+
+def _query_rows(cards: Sequence[str]) -> np.ndarray:
+    unknown = [c for c in cards if c not in CARD_ID]
+    if unknown:
+        raise ValueError(f"Onbekende kaart(en): {', '.join(unknown)}")
+    if len(set(cards)) != len(cards) or not 0 < len(cards) <= 8:
+        raise ValueError("Een deck bestaat uit 1 tot 8 unieke kaarten.")
+    return pack_rows(np.array([[CARD_ID[c] for c in cards]], dtype=np.int16))
+
+
+class DeckStats(NamedTuple):
+    key: int
+    shared: int
+    count: int
+    results: int
+    wins: int
+
+    @property
+    def cards(self) -> List[str]:
+        row = np.frombuffer(np.uint64(self.key).tobytes(), dtype=np.uint8)
+        return [CARD_NAMES[c] for c in row if c != EMPTY]
+
+    @property
+    def win_rate(self) -> Optional[float]:
+        return self.wins / self.results if self.results else None
+
+
+# ---------- segmenten ----------
+def _reduce(hkey, key, count, results, wins) -> Tuple[np.ndarray, ...]:
+    """Sorteert op (hkey, key) en telt dubbele decks op."""
+    order = np.lexsort((key, hkey))
+    hkey, key = hkey[order], key[order]
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = (hkey[1:] != hkey[:-1]) | (key[1:] != key[:-1])
+    starts = np.flatnonzero(first)
+    return (hkey[starts], key[starts],
+            *(np.add.reduceat(np.asarray(c, dtype=np.int64)[order], starts)
+              for c in (count, results, wins)))
+
+
+class _Segment:
+    def __init__(self, path: Path):
+        self.path = path
+        # Gewone ndarray-views op de mmap: fancy indexing via np.memmap is merkbaar trager.
+        cols = {c: np.asarray(np.load(path / f"{c}.npy", mmap_mode="r"))
+                for c in COLUMNS + ("filter",)}
+        self.hkey, self.key = cols["hkey"], cols["key"]
+        self.count, self.results, self.wins = cols["count"], cols["results"], cols["wins"]
+        self.filter = cols["filter"]
+        self.shift = np.uint64(64 - (len(self.filter) * 8).bit_length() + 1)
+
+    def __len__(self) -> int:
+        return len(self.hkey)
+
+    @staticmethod
+    def write(path: Path, hkey, key, count, results, wins) -> "_Segment":
+        bits = max(1 << 10, 1 << int(np.ceil(np.log2(max(1, len(hkey)) * FILTER_BITS))))
+        filt = np.zeros(bits // 8, dtype=np.uint8)
+        top = hkey >> np.uint64(64 - bits.bit_length() + 1)
+        np.bitwise_or.at(filt, (top >> np.uint64(3)).astype(np.int64),
+                         np.left_shift(1, (top & np.uint64(7)).astype(np.uint8)).astype(np.uint8))
+        tmp = path.with_name(path.name + ".tmp")
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir(parents=True)
+        for name, arr in zip(COLUMNS + ("filter",), (hkey, key, count, results, wins, filt)):
+            np.save(tmp / f"{name}.npy", np.ascontiguousarray(arr))
+        os.replace(tmp, path)
+        return _Segment(path)
+
+    def find(self, h: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """(index in h, positie) voor elke hkey-treffer; bij hash-botsingen meerdere posities."""
+        if not len(self):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        top = h >> self.shift
+        bit = (self.filter[(top >> np.uint64(3)).astype(np.int64)]
+               >> (top & np.uint64(7)).astype(np.uint8)) & 1
+        cand = np.flatnonzero(bit)
+        cand = cand[np.argsort(h[cand], kind="stable")]  # gesorteerd zoeken is cache-vriendelijk
+        hc = h[cand]
+        lo = np.searchsorted(self.hkey, hc)
+        last = len(self) - 1
+        n = (self.hkey[np.minimum(lo, last)] == hc).astype(np.int64)
+        # Hash-botsingen: tel gelijke hkeys direct na de eerste treffer mee (zeldzaam).
+        more, k = np.flatnonzero(n), 1
+        while len(more):
+            more = more[lo[more] + k <= last]
+            more = more[self.hkey[lo[more] + k] == hc[more]]
+            n[more] += 1
+            k += 1
+        idx = np.repeat(cand, n)
+        pos = np.repeat(lo, n) + np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n)
+        return idx, pos
+
+
+# ---------- index ----------
+class DeckIndex:
+    """Map met segmenten en manifest.json; open() maakt een lege index aan als die ontbreekt."""
+
+    def __init__(self, path: Path, manifest: Dict[str, Any]):
+        self.path = path
+        self.manifest = manifest
+        self.segments = [_Segment(path / name) for name in manifest["segments"]]
+
+    @classmethod
+    def open(cls, path, create: bool = False) -> "DeckIndex":
+        path = Path(path)
+        mpath = path / "manifest.json"
+        if not mpath.exists():
+            if not create:
+                raise ValueError(f"{path} is geen deck-index (manifest.json ontbreekt)")
+            path.mkdir(parents=True, exist_ok=True)
+            index = cls(path, {"format": FORMAT, "version": FORMAT_VERSION,
+                               "db_version": DB_VERSION, "card_names": list(CARD_NAMES),
+                               "segments": [], "next_segment": 0})
+            index._save_manifest()
+            return index
+        manifest = json.loads(mpath.read_text(encoding="utf-8"))
+        if manifest.get("format") != FORMAT or manifest.get("version") != FORMAT_VERSION:
+            raise ValueError(f"{path}: onbekend indexformaat")
+        if manifest["card_names"] != list(CARD_NAMES):
+            raise ValueError(f"{path} is gebouwd met een andere CARD_DB "
+                             f"({manifest['db_version']}, nu {DB_VERSION}); bouw hem opnieuw")
+        return cls(path, manifest)
+
+    def __len__(self) -> int:
+        """Opgeslagen rijen; een deck in meerdere segmenten telt tot compact() vaker mee."""
+        return sum(len(s) for s in self.segments)
+
+    def _save_manifest(self) -> None:
+        tmp = self.path / "manifest.json.tmp"
+        tmp.write_text(json.dumps(self.manifest, indent=2), encoding="utf-8")
+        os.replace(tmp, self.path / "manifest.json")
+
+    def _set_segments(self, segments: List[_Segment]) -> None:
+        old = {s.path.name for s in self.segments} - {s.path.name for s in segments}
+        self.segments = segments
+        self.manifest["segments"] = [s.path.name for s in segments]
+        self._save_manifest()
+        for name in old:
+            shutil.rmtree(self.path / name, ignore_errors=True)
+
+    def _new_segment(self, *cols) -> _Segment:
+        name = f"seg_{self.manifest['next_segment']:06d}"
+        self.manifest["next_segment"] += 1
+        return _Segment.write(self.path / name, *cols)
+
+    # ---------- schrijven ----------
+    def add_rows(self, rows: np.ndarray, won: Optional[np.ndarray] = None) -> None:
+        """Voegt canonieke uint8-rijen toe; won per deck 1, 0 of -1 (onbekend/gelijkspel)."""
+        if not len(rows):
+            return
+        ones = np.ones(len(rows), dtype=np.int64)
+        won = np.full(len(rows), -1) if won is None else np.asarray(won)
+        cols = _reduce(deck_hash(rows), np.ascontiguousarray(rows).view("<u8").ravel(),
+                       ones, won >= 0, won == 1)
+        self._set_segments(self.segments + [self._new_segment(*cols)])
+        while (len(self.segments) >= 2
+               and len(self.segments[-2]) <= MERGE_RATIO * len(self.segments[-1])):
+            self._merge(len(self.segments) - 2)
+
+    def add(self, indices: np.ndarray, won: Optional[np.ndarray] = None) -> None:
+        """Voegt (n, <=8) kaart-ID's toe (-1 = leeg slot)."""
+        self.add_rows(pack_rows(indices), won)
+
+    def _merge(self, start: int) -> None:
+        parts = self.segments[start:]
+        cols = _reduce(*(np.concatenate([getattr(s, c) for s in parts]) for c in COLUMNS))
+        self._set_segments(self.segments[:start] + [self._new_segment(*cols)])
+
+    def compact(self) -> None:
+        """Voegt alle segmenten samen tot één (elk deck dan precies één keer)."""
+        if len(self.segments) > 1:
+            self._merge(0)
+
+    # ---------- zoeken ----------
+    def _collect(self, h: np.ndarray, decode) -> Tuple[np.ndarray, np.ndarray]:
+        """Zoekt de hashes h op in alle segmenten; decode(i) geeft de verwachte rijen.
+
+        Geeft de gevonden indexen in h en per index (count, results, wins) over alle segmenten.
+        """
+        hits, stats = [], []
+        for seg in self.segments:
+            idx, pos = seg.find(h)
+            if not len(idx):
+                continue
+            ok = seg.key[pos] == decode(idx).view("<u8").ravel()
+            idx, pos = idx[ok], pos[ok]
+            hits.append(idx)
+            stats.append(np.stack([seg.count[pos], seg.results[pos], seg.wins[pos]], axis=1))
+        if not hits:
+            return np.empty(0, dtype=np.int64), np.empty((0, 3), dtype=np.int64)
+        idx, inv = np.unique(np.concatenate(hits), return_inverse=True)
+        tot = np.zeros((len(idx), 3), dtype=np.int64)
+        np.add.at(tot, inv, np.concatenate(stats))
+        return idx, tot
+
+    def lookup(self, cards: Sequence[str]) -> Optional[DeckStats]:
+        """Exacte statistieken van één deck, of None als het niet in de index staat."""
+        rows = _query_rows(cards)
+        idx, tot = self._collect(deck_hash(rows), lambda i: rows[i])
+        if not len(idx):
+            return None
+        key = int(rows.view("<u8")[0, 0])
+        return DeckStats(key, int(np.count_nonzero(rows != EMPTY)), *map(int, tot[0]))
+
+    def similar(self, cards: Sequence[str], k: int = 10, min_shared: int = 6) -> List[DeckStats]:
+        """Top-k decks met minstens min_shared gemeenschappelijke kaarten (meeste gedeeld, dan
+        meest gespeeld). Het deck zelf komt mee met shared=8."""
+        if not 1 <= min_shared <= 8:
+            raise ValueError("min_shared moet tussen 1 en 8 liggen.")
+        rows = _query_rows(cards)
+        if len(cards) < 8 or min_shared < 6:
+            keys, shared, tot = self._scan(rows[0], min_shared)
+        else:
+            h, decode, shared_of = _neighbours(rows[0], min_shared)
+            idx, tot = self._collect(h, decode)
+            keys, shared = decode(idx).view("<u8").ravel(), shared_of(idx)
+        top = np.lexsort((keys, -tot[:, 0], -shared))[:k]
+        return [DeckStats(int(keys[i]), int(shared[i]), *map(int, tot[i])) for i in top]
+
+    def _scan(self, row: np.ndarray, min_shared: int) -> Tuple[np.ndarray, ...]:
+        """Lineaire scan: (keys, shared, stats) van alle decks met >= min_shared gedeeld."""
+        member = np.zeros(256, dtype=bool)
+        member[row[row != EMPTY]] = True
+        keys, stats = [], []
+        for seg in self.segments:
+            for s in range(0, len(seg), SCAN_CHUNK):
+                key = seg.key[s:s + SCAN_CHUNK]
+                shared = member[key.view(np.uint8).reshape(-1, 8)].sum(axis=1)
+                sel = np.flatnonzero(shared >= min_shared)
+                keys.append(key[sel])
+                stats.append(np.stack([seg.count[s:s + SCAN_CHUNK][sel],
+                                       seg.results[s:s + SCAN_CHUNK][sel],
+                                       seg.wins[s:s + SCAN_CHUNK][sel], shared[sel]], axis=1))
+        if not keys:
+            return (np.empty(0, dtype=np.uint64), np.empty(0, dtype=np.int64),
+                    np.empty((0, 3), dtype=np.int64))
+        uniq, inv = np.unique(np.concatenate(keys), return_inverse=True)
+        stats = np.concatenate(stats)
+        tot = np.zeros((len(uniq), 3), dtype=np.int64)
+        np.add.at(tot, inv, stats[:, :3])
+        shared = np.zeros(len(uniq), dtype=np.int64)
+        shared[inv] = stats[:, 3]
+        return uniq, shared, tot
+
+
+def _neighbours(row: np.ndarray, min_shared: int):
+    """Alle volledige decks met >= min_shared (6..8) kaarten gemeen met row, als
+    (hashes, decode(i) -> canonieke rijen, shared_of(i) -> aantal gedeelde kaarten)."""
+    q = row.astype(np.int64)
+    others = np.setdiff1d(np.arange(N_CARDS), q)
+    hq = HASH[q].sum(dtype=np.uint64)
+    parts = [np.array([hq])]
+    if min_shared <= 7:
+        parts.append((hq - HASH[q][:, None] + HASH[others][None, :]).ravel())
+    if min_shared <= 6:
+        parts.append((hq - HASH[q[_PAIRS8]].sum(axis=1, dtype=np.uint64)[:, None]
+                      + HASH[others[_OTHER_PAIRS]].sum(axis=1, dtype=np.uint64)[None, :]).ravel())
+    starts = np.cumsum([0] + [len(p) for p in parts])[1:-1]  # begin van de 7- en 6-delen
+    n_other = len(others)
+
+    def shared_of(i: np.ndarray) -> np.ndarray:
+        return 8 - np.searchsorted(starts, i, side="right")
+
+    def decode(i: np.ndarray) -> np.ndarray:
+        out = np.empty((len(i), 8), dtype=np.int64)
+        level = shared_of(i)
+        out[level == 8] = q
+        m = level == 7
+        if m.any():
+            j = i[m] - starts[0]
+            r, a = j // n_other, j % n_other
+            d = np.repeat(q[None, :], len(j), axis=0)
+            d[np.arange(len(j)), r] = others[a]
+            out[m] = d
+        m = level == 6
+        if m.any():
+            j = i[m] - starts[1]
+            r, a = j // len(_OTHER_PAIRS), j % len(_OTHER_PAIRS)
+            out[m] = np.concatenate([q[_KEEP6[r]], others[_OTHER_PAIRS[a]]], axis=1)
+        return pack_rows(out)
+
+    return np.concatenate(parts), decode, shared_of
+
+
+# ---------- bouwen ----------
+def _source_batches(path: str, battle_logs: bool,
+                    batch: int) -> Iterator[Tuple[np.ndarray, Optional[np.ndarray]]]:
+    """(canonieke rijen, won) per blok uit een .decks-corpus, decklijst of battle-log."""
+    if battle_logs:
+        from battle_logs import match_batches
+        for idx_a, idx_b, winner in match_batches(path, batch=batch // 2):
+            won = np.concatenate([np.where(winner < 0, -1, winner == 0),
+                                  np.where(winner < 0, -1, winner == 1)])
+            yield pack_rows(np.concatenate([idx_a, idx_b])), won
+        return
+    if path.endswith(".decks"):
+        from deck_corpus import load_corpus
+        corpus = load_corpus(path, remap=True)
+        for s in range(0, len(corpus), batch):
+            yield np.asarray(corpus.cards[s:s + batch]), None
+        return
+    from heuristics import names_to_indices
+    from score_decks import read_decks
+    fmt = "jsonl" if path.endswith((".jsonl", ".json")) else "csv"
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        decks = read_decks(f, fmt)
+        while True:
+            chunk = list(islice(decks, batch))
+            if not chunk:
+                return
+            yield pack_rows(names_to_indices([cards for _, cards in chunk])), None
+
+
+def build(index_path: str, sources: Iterable[str], battle_logs: bool = False,
+          batch: int = BATCH) -> DeckIndex:
+    """Voegt alle bronnen toe aan de index (maakt hem aan als hij nog niet bestaat)."""
+    index = DeckIndex.open(index_path, create=True)
+    for path in sources:
+        n = 0
+        for rows, won in _source_batches(path, battle_logs, batch):
+            index.add_rows(rows, won)
+            n += len(rows)
+        print(f"{path}: {n} decks toegevoegd", file=sys.stderr)
+    return index
+
+
+def _format_stats(d: DeckStats) -> str:
+    wr = "-" if d.win_rate is None else f"{100 * d.win_rate:.1f}%"
+    return f"{d.shared}/8  {d.count:>8}x  winrate {wr:>6}  {';'.join(d.cards)}"
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    p = argparse.ArgumentParser(description="Zoekindex voor gelijke en bijna-gelijke decks.")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    pb = sub.add_parser("build", help="decks toevoegen (maakt de index aan als die ontbreekt)")
+    pb.add_argument("index")
+    pb.add_argument("sources", nargs="+", help=".decks, CSV/JSONL-decklijst of battle-log")
+    pb.add_argument("--battle-logs", action="store_true",
+                    help="bronnen zijn battle-logs (zie battle_logs.py); telt ook winsten")
+    pb.add_argument("--batch", type=int, default=BATCH, help="decks per nieuw segment")
+    pb.add_argument("--compact", action="store_true", help="daarna alles samenvoegen")
+    pq = sub.add_parser("query", help="exacte en vergelijkbare decks opzoeken")
+    pq.add_argument("index")
+    pq.add_argument("cards", help='"Kaart1;Kaart2;..."')
+    pq.add_argument("-k", type=int, default=10)
+    pq.add_argument("--min-shared", type=int, default=6)
+    pq.add_argument("--json", action="store_true")
+    pc = sub.add_parser("compact", help="alle segmenten samenvoegen")
+    pc.add_argument("index")
+    pi = sub.add_parser("info", help="segmenten en aantallen tonen")
+    pi.add_argument("index")
+    args = p.parse_args(argv)
+
+    try:
+        if args.cmd == "build":
+            index = build(args.index, args.sources, args.battle_logs, args.batch)
+            if args.compact:
+                index.compact()
+        elif args.cmd == "query":
+            index = DeckIndex.open(args.index)
+            cards = [c.strip() for c in args.cards.split(";") if c.strip()]
+            found = index.similar(cards, args.k, args.min_shared)
+            if args.json:
+                print(json.dumps([{**d._asdict(), "cards": d.cards, "win_rate": d.win_rate}
+                                  for d in found], indent=2, ensure_ascii=False))
+            else:
+                print("\n".join(_format_stats(d) for d in found) or "Geen decks gevonden.")
+            return 0
+        elif args.cmd == "compact":
+            index = DeckIndex.open(args.index)
+            index.compact()
+        else:
+            index = DeckIndex.open(args.index)
+    except (OSError, KeyError, ValueError) as e:
+        print(f"Fout: {e}", file=sys.stderr)
+        return 2
+    print(f"{args.index}: {len(index)} decks in {len(index.segments)} segment(en)",
+          file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
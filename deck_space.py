@@ -0,0 +1,260 @@
+"""Deck-space verkenning over meerdere cores: scoreverdeling en leaderboards.
+
+Een run bestaat uit deterministische shards die elk een deel van de
+deck-ruimte scoren:
+
+- sample: uniform willekeurige decks; shard i gebruikt rng(seed, i).
+- enumerate: alle aanvullingen van de vaste kaarten; de ruimte wordt verdeeld
+  op de kleinste vrije kaart (alleen zinvol met genoeg --lock kaarten).
+
+Elke shard schrijft top-K, een histogram van overall en per-kaart som/telling
+naar RUN_DIR/shard_XXXXX.npz. Bestaande shards worden overgeslagen, dus een
+afgebroken run hervat gewoon met hetzelfde commando. Daarna worden alle shards
+samengevoegd tot RUN_DIR/report.json.
+
+    python -m deck_space run runs/space --decks 20000000 --shards 64
+    python -m deck_space report runs/space
+"""
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import combinations, islice
+from math import comb
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from card_index import CARD_ID, CARD_NAMES, DB_VERSION, N_CARDS
+from heuristics import evaluate_decks_batch
+
+HIST_BINS = 1000
+BLOCK = 100_000
+MAX_ENUMERATE = 5_000_000_000
+
+
+def _manifest(args: argparse.Namespace) -> Dict[str, Any]:
+    locked = sorted(CARD_ID[n] for n in args.lock)
+    if len(set(locked)) != len(locked) or len(locked) > 8:
+        raise ValueError("--lock: maximaal 8 unieke kaarten.")
+    pool = [i for i in range(N_CARDS) if i not in set(locked)]
+    r = 8 - len(locked)
+    if args.mode == "enumerate":
+        total = comb(len(pool), r)
+        if total > MAX_ENUMERATE:
+            raise ValueError(f"Te veel decks om op te sommen ({total:.3g}); "
+                             "gebruik --mode sample of meer --lock kaarten.")
+    else:
+        total = args.decks
+    return {"db_version": DB_VERSION, "mode": args.mode, "seed": args.seed,
+            "shards": args.shards, "decks": total, "locked": locked, "top_k": args.top_k}
+
+
+def _shard_units(manifest: Dict[str, Any], shard: int) -> List[int]:
+    """enumerate: de kleinste vrije kaarten (posities in de pool) die bij deze shard horen."""
+    pool_size = N_CARDS - len(manifest["locked"])
+    r = 8 - len(manifest["locked"])
+    if r == 0:
+        return [0] if shard == 0 else []
+    # Grootste eenheden eerst naar de minst beladen shard: deterministisch en gebalanceerd.
+    units = sorted(range(pool_size - r + 1), key=lambda a: -comb(pool_size - a - 1, r - 1))
+    load = [0] * manifest["shards"]
+    owner = {}
+    for a in units:
+        s = min(range(len(load)), key=lambda j: (load[j], j))
+        owner[a] = s
+        load[s] += comb(pool_size - a - 1, r - 1)
+    return sorted(a for a in units if owner[a] == shard)
+
+
+def _blocks(manifest: Dict[str, Any], shard: int):
+    """Genereert (n, 8) blokken kaart-ID's voor één shard."""
+    locked = np.array(manifest["locked"], dtype=np.int16)
+    pool = np.array([i for i in range(N_CARDS) if i not in set(manifest["locked"])], dtype=np.int16)
+    r = 8 - len(locked)
+
+    def with_locked(free):
+        return np.hstack([np.broadcast_to(locked, (len(free), len(locked))), pool[free]])
+
+    if manifest["mode"] == "sample":
+        per, extra = divmod(manifest["decks"], manifest["shards"])
+        n = per + (shard < extra)
+        rng = np.random.default_rng([manifest["seed"], shard])
+        while n > 0:
+            m = min(BLOCK, n)
+            free = rng.random((m, len(pool))).argpartition(r, axis=1)[:, :r] if r else \
+                np.empty((m, 0), dtype=np.int64)
+            yield with_locked(free)
+            n -= m
+        return
+    for a in _shard_units(manifest, shard):
+        if r == 0:
+            yield locked[None, :]
+        elif r == 1:
+            yield with_locked(np.array([[a]]))
+        else:
+            rest = combinations(range(a + 1, len(pool)), r - 1)
+            while chunk := list(islice(rest, BLOCK)):
+                tail = np.array(chunk, dtype=np.int64)
+                yield with_locked(np.hstack([np.full((len(tail), 1), a), tail]))
+
+
+def _top_merge(scores, decks, new_scores, new_decks, k):
+    scores = np.concatenate([scores, new_scores])
+    decks = np.concatenate([decks, new_decks])
+    keep = np.argsort(-scores, kind="stable")[:k]
+    return scores[keep], decks[keep]
+
+
+def run_shard(run_dir: str, manifest: Dict[str, Any], shard: int) -> str:
+    """Scoort één shard en schrijft het resultaat atomisch weg."""
+    path = Path(run_dir) / f"shard_{shard:05d}.npz"
+    if path.exists():
+        return str(path)
+    k = manifest["top_k"]
+    top_s, top_d = np.empty(0), np.empty((0, 8), dtype=np.int16)
+    hist = np.zeros(HIST_BINS, dtype=np.int64)
+    card_sum = np.zeros(N_CARDS)
+    card_n = np.zeros(N_CARDS, dtype=np.int64)
+    total = 0.0
+    total_sq = 0.0
+    for idx in _blocks(manifest, shard):
+        ov = evaluate_decks_batch(idx)["overall"]
+        part = np.argpartition(-ov, min(k, len(ov)) - 1)[:k] if len(ov) > k else np.arange(len(ov))
+        top_s, top_d = _top_merge(top_s, top_d, ov[part], idx[part].astype(np.int16), k)
+        hist += np.bincount(np.minimum((ov * HIST_BINS).astype(np.int64), HIST_BINS - 1),
+                            minlength=HIST_BINS)
+        flat = idx.ravel()
+        card_sum += np.bincount(flat, weights=np.repeat(ov, idx.shape[1]), minlength=N_CARDS)
+        card_n += np.bincount(flat, minlength=N_CARDS)
+        total += ov.sum()
+        total_sq += (ov * ov).sum()
+    tmp = path.with_name(path.name + ".tmp.npz")
+    np.savez(tmp, top_scores=top_s, top_decks=top_d, hist=hist, card_sum=card_sum,
+             card_n=card_n, moments=np.array([total, total_sq]))
+    os.replace(tmp, path)
+    return str(path)
+
+
+def _percentile(hist: np.ndarray, x: float) -> float:
+    """Aandeel decks met een lagere overall dan x (half meegeteld binnen de eigen bin)."""
+    b = min(int(x * HIST_BINS), HIST_BINS - 1)
+    n = hist.sum()
+    return float((hist[:b].sum() + 0.5 * hist[b]) / n) if n else 0.0
+
+
+def merge(run_dir: str, benchmarks: Optional[Sequence] = None) -> Dict[str, Any]:
+    """Voegt alle shards van een run samen tot één rapport."""
+    manifest = json.loads((Path(run_dir) / "manifest.json").read_text(encoding="utf-8"))
+    k = manifest["top_k"]
+    top_s, top_d = np.empty(0), np.empty((0, 8), dtype=np.int16)
+    hist = np.zeros(HIST_BINS, dtype=np.int64)
+    card_sum = np.zeros(N_CARDS)
+    card_n = np.zeros(N_CARDS, dtype=np.int64)
+    moments = np.zeros(2)
+    done = 0
+    for shard in range(manifest["shards"]):
+        path = Path(run_dir) / f"shard_{shard:05d}.npz"
+        if not path.exists():
+            continue
+        with np.load(path) as z:
+            top_s, top_d = _top_merge(top_s, top_d, z["top_scores"], z["top_decks"], k)
+            hist += z["hist"]
+            card_sum += z["card_sum"]
+            card_n += z["card_n"]
+            moments += z["moments"]
+        done += 1
+    n = int(hist.sum())
+    mean = moments[0] / n if n else 0.0
+    std = float(np.sqrt(max(0.0, moments[1] / n - mean * mean))) if n else 0.0
+    cdf = np.cumsum(hist)
+    quantiles = {f"p{q}": (int(np.searchsorted(cdf, q / 100 * n)) + 0.5) / HIST_BINS
+                 for q in (1, 10, 25, 50, 75, 90, 99)} if n else {}
+    cards = [{"card": CARD_NAMES[i], "decks": int(card_n[i]),
+              "avg_overall": float(card_sum[i] / card_n[i])}
+             for i in np.argsort(-(card_sum / np.maximum(card_n, 1))) if card_n[i]]
+    report: Dict[str, Any] = {
+        "manifest": manifest, "shards_done": done, "decks": n,
+        "mean": float(mean), "std": std, "quantiles": quantiles,
+        "histogram": {"bins": HIST_BINS, "counts": hist.tolist()},
+        "top": [{"overall": float(s), "deck": [CARD_NAMES[i] for i in d]}
+                for s, d in zip(top_s, top_d)],
+        "cards": cards,
+    }
+    if benchmarks:
+        report["benchmarks"] = [{"deck": name, "overall": score, "percentile": _percentile(hist, score)}
+                                for name, score in benchmarks]
+    return report
+
+
+def _benchmark_scores() -> List:
+    """(naam, overall) voor data/benchmark_decks.csv, als dat bestand er is."""
+    from heuristics import evaluate_deck
+    from score_decks import read_csv
+    path = Path(__file__).resolve().parent / "data" / "benchmark_decks.csv"
+    if not path.exists():
+        return []
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        return [(name, evaluate_deck(cards)["metrics"]["overall"]) for name, cards in read_csv(f)]
+
+
+def run(run_dir: str, manifest: Dict[str, Any], workers: Optional[int] = None) -> Dict[str, Any]:
+    """Draait alle ontbrekende shards over een process pool en schrijft report.json."""
+    d = Path(run_dir)
+    d.mkdir(parents=True, exist_ok=True)
+    mpath = d / "manifest.json"
+    if mpath.exists():
+        existing = json.loads(mpath.read_text(encoding="utf-8"))
+        if existing != manifest:
+            raise ValueError(f"{mpath} hoort bij een andere run; kies een nieuwe RUN_DIR.")
+    else:
+        mpath.write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+    todo = [s for s in range(manifest["shards"]) if not (d / f"shard_{s:05d}.npz").exists()]
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        futures = [ex.submit(run_shard, run_dir, manifest, s) for s in todo]
+        for i, fut in enumerate(as_completed(futures), 1):
+            fut.result()
+            print(f"shard {i}/{len(todo)} klaar", file=sys.stderr)
+    report = merge(run_dir, _benchmark_scores())
+    (d / "report.json").write_text(json.dumps(report, indent=2), encoding="utf-8")
+    return report
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    p = argparse.ArgumentParser(description="Scoreverdeling en leaderboards over de deck-ruimte.")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    pr = sub.add_parser("run", help="shards draaien (hervat een bestaande run)")
+    pr.add_argument("run_dir")
+    pr.add_argument("--mode", choices=("sample", "enumerate"), default="sample")
+    pr.add_argument("--decks", type=int, default=10_000_000, help="aantal decks (sample)")
+    pr.add_argument("--shards", type=int, default=64)
+    pr.add_argument("--workers", type=int, default=None, help="default: alle cores")
+    pr.add_argument("--seed", type=int, default=0)
+    pr.add_argument("--lock", action="append", default=[], help="vaste kaart (herhaalbaar)")
+    pr.add_argument("--top-k", type=int, default=100)
+    rp = sub.add_parser("report", help="shards (opnieuw) samenvoegen tot report.json")
+    rp.add_argument("run_dir")
+    args = p.parse_args(argv)
+
+    try:
+        if args.cmd == "run":
+            report = run(args.run_dir, _manifest(args), args.workers)
+        else:
+            report = merge(args.run_dir, _benchmark_scores())
+            (Path(args.run_dir) / "report.json").write_text(json.dumps(report, indent=2),
+                                                            encoding="utf-8")
+    except (KeyError, ValueError) as e:
+        print(f"Fout: {e}", file=sys.stderr)
+        return 2
+    print(f"{report['decks']} decks, mean {report['mean']:.3f}, "
+          f"mediaan {report['quantiles'].get('p50', 0):.3f}", file=sys.stderr)
+    for b in report.get("benchmarks", []):
+        print(f"  {b['deck']}: {b['overall']:.3f} (percentiel {100 * b['percentile']:.1f})",
+              file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
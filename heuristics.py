@@ -1,6 +1,12 @@
+import hashlib
+import json
 from typing import List, Dict, Any
 from statistics import mean
+import numpy as np
 from card_db import CARD_DB  # geen alias meer
+from card_index import (DB_VERSION, ELIXIR, OFFENSE, DEFENSE, WINCON, TAG_MASK, N_CARDS, SCORE_BIT,
+                        SCORE_MASK, SCORE_TAGS, tag_bit, to_ids)
+from instrument import timed
 
 
 def normalize_deck(names: List[str]) -> List[Dict[str, Any]]:
@@ -73,20 +79,35 @@ def synergy_score(deck: List[Dict[str, Any]], avg_elixir: float) -> float:
     return max(0.0, min(1.0, s))
 
 
+# Gewichten en elixir-penalty van overall_score (herschatten: zie weights.py).
+OVERALL_WEIGHTS: Dict[str, float] = {
+    "balance": 0.25, "coverage": 0.20, "spells": 0.15, "wincon": 0.20, "synergy": 0.20}
+PENALTY_FROM = 4.5   # gemiddelde elixir waarboven de penalty begint
+PENALTY_SLOPE = 0.1  # penalty per elixir boven PENALTY_FROM
+PENALTY_MAX = 0.2
+# Verandert zodra CARD_DB of de gewichten van overall veranderen; voor alles wat
+# berekende metrics op schijf bewaart (score_table, history).
+SCORE_VERSION: str = hashlib.sha1(json.dumps(
+    [DB_VERSION, OVERALL_WEIGHTS, PENALTY_FROM, PENALTY_SLOPE, PENALTY_MAX],
+    sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
 def overall_score(metrics: Dict[str, float], avg_elixir: float) -> float:
+    w = OVERALL_WEIGHTS
     base = (
-        0.25 * metrics["balance"] +
-        0.20 * metrics["coverage"] +
-        0.15 * metrics["spells"] +
-        0.20 * metrics["wincon"] +
-        0.20 * metrics["synergy"]
+        w["balance"] * metrics["balance"] +
+        w["coverage"] * metrics["coverage"] +
+        w["spells"] * metrics["spells"] +
+        w["wincon"] * metrics["wincon"] +
+        w["synergy"] * metrics["synergy"]
     )
     penalty = 0.0
-    if avg_elixir > 4.5:
-        penalty = min(0.2, (avg_elixir - 4.5) * 0.1)
+    if avg_elixir > PENALTY_FROM:
+        penalty = min(PENALTY_MAX, (avg_elixir - PENALTY_FROM) * PENALTY_SLOPE)
     return max(0.0, min(1.0, base - penalty))
 
 
+@timed("evaluate_deck")
 def evaluate_deck(names: List[str]) -> Dict[str, Any]:
     deck = normalize_deck(names)
     avg = average_elixir(deck)
@@ -101,6 +122,182 @@ def evaluate_deck(names: List[str]) -> Dict[str, Any]:
     return {"deck": deck, "avg_elixir": avg, "metrics": m}
 
 
+# ---------- Snelle evaluatie op gecompileerde bitmaskers ----------
+_ANTI_AIR = tag_bit("anti_air")
+_SPLASH = tag_bit("splash")
+_BUILDING = tag_bit("building")
+_TANK_KILLER = tag_bit("tank_killer")
+_SMALL_SPELL = tag_bit("small_spell")
+_MEDIUM_SPELL = tag_bit("medium_spell")
+_BIG_SPELL = tag_bit("big_spell")
+_WINCON = tag_bit("wincon")
+_SWARM = tag_bit("swarm")
+_COVERAGE = _ANTI_AIR | _SPLASH | _BUILDING | _TANK_KILLER
+_SPELLS = _SMALL_SPELL | _MEDIUM_SPELL | _BIG_SPELL
+
+
+def average_elixir_sum(total: int, n: int) -> float:
+    """average_elixir op basis van som en aantal (zelfde int/float-gedrag als mean)."""
+    if not n:
+        return 0.0
+    return round(total // n if total % n == 0 else total / n, 2)
+
+
+def synergy_from_tags(tags: int, avg_elixir: float) -> float:
+    """synergy_score op basis van de OR van de tagmaskers."""
+    s = 0.0
+    if tags & _WINCON and tags & _BUILDING:
+        s += 0.2
+    if tags & _WINCON and tags & _SMALL_SPELL:
+        s += 0.2
+    if tags & _SPLASH and tags & _SWARM:
+        s += 0.1
+    if tags & _TANK_KILLER and tags & _SPLASH:
+        s += 0.1
+    if avg_elixir <= 3.1:
+        s += 0.2
+    elif avg_elixir <= 4.0:
+        s += 0.1
+    return max(0.0, min(1.0, s))
+
+
+def metrics_from_counts(offense: int, defense: int, wincons: int, tags: int,
+                        avg: float) -> Dict[str, float]:
+    """Alle metrics uit de tellers en de OR van de tagmaskers van een deck."""
+    m = {
+        "balance": max(0.0, min(1.0, 1.0 - abs(offense - defense) / 8.0)),
+        "coverage": (tags & _COVERAGE).bit_count() / 4.0,
+        "spells":   (tags & _SPELLS).bit_count() / 3.0,
+        "wincon":   min(1.0, wincons / 2.0),
+        "synergy":  synergy_from_tags(tags, avg),
+    }
+    m["overall"] = overall_score(m, avg)
+    return m
+
+
+def evaluate_ids(ids: List[int]) -> Dict[str, Any]:
+    """evaluate_deck voor kaart-ID's (zie card_index); geeft dezelfde metrics, zonder dicts."""
+    tags = offense = defense = wincons = total = 0
+    for i in ids:
+        tags |= TAG_MASK[i]
+        offense += OFFENSE[i]
+        defense += DEFENSE[i]
+        wincons += WINCON[i]
+        total += ELIXIR[i]
+    avg = average_elixir_sum(total, len(ids))
+    return {"ids": ids, "avg_elixir": avg,
+            "metrics": metrics_from_counts(offense, defense, wincons, tags, avg)}
+
+
+def evaluate_deck_fast(names: List[str]) -> Dict[str, Any]:
+    return evaluate_ids(to_ids(names))
+
+
+# ---------- Batch-evaluatie (NumPy) ----------
+BATCH_FIELDS = ["avg_elixir", "balance", "coverage", "spells", "wincon", "synergy", "overall"]
+BATCH_DTYPE = np.dtype([(f, np.float64) for f in BATCH_FIELDS])
+
+# Featurearrays per kaart-ID, met een extra nulrij (index N_CARDS) voor lege slots.
+_F_ELIXIR = np.array(ELIXIR + [0], dtype=np.int64)
+_F_DIFF = np.array([o - d for o, d in zip(OFFENSE, DEFENSE)] + [0], dtype=np.int64)
+_F_WINCON = np.array(WINCON + [0], dtype=np.int64)
+_F_SMASK = np.array(SCORE_MASK + [0], dtype=np.int64)
+# average_elixir per (aantal kaarten, elixirsom): zelfde afronding als de scalar-versie.
+_AVG_TABLE = np.array([[average_elixir_sum(t, n) for t in range(8 * max(ELIXIR) + 1)]
+                       for n in range(9)], dtype=np.float64)
+
+
+def _score_mask_tables():
+    """coverage, spells en het tag-deel van synergy per SCORE_MASK-waarde."""
+    size = 1 << len(SCORE_TAGS)
+    cov, spl, syn = np.zeros(size), np.zeros(size), np.zeros(size)
+    for m in range(size):
+        # Via de scalar-functies, zodat de floats bitgelijk zijn aan evaluate_deck.
+        tags = 0
+        for t, b in SCORE_BIT.items():
+            if m & b:
+                tags |= tag_bit(t)
+        cov[m] = (tags & _COVERAGE).bit_count() / 4.0
+        spl[m] = (tags & _SPELLS).bit_count() / 3.0
+        syn[m] = synergy_from_tags(tags, 99.0)  # elixirbonus komt er apart bij
+    return cov, spl, syn
+
+
+_S_COV, _S_SPL, _S_SYN = _score_mask_tables()
+
+
+def elixir_penalty(avg, start: float = PENALTY_FROM, slope: float = PENALTY_SLOPE,
+                   cap: float = PENALTY_MAX) -> np.ndarray:
+    """De elixir-penalty van overall_score voor een array gemiddelden."""
+    return np.where(avg > start, np.minimum(cap, (avg - start) * slope), 0.0)
+
+
+def overall_batch(balance, coverage, spells, wincon, synergy, avg) -> np.ndarray:
+    """overall_score voor arrays van deelcijfers (zelfde optelvolgorde)."""
+    w = OVERALL_WEIGHTS
+    base = (
+        w["balance"] * balance +
+        w["coverage"] * coverage +
+        w["spells"] * spells +
+        w["wincon"] * wincon +
+        w["synergy"] * synergy
+    )
+    return np.clip(base - elixir_penalty(avg), 0.0, 1.0)
+
+
+def signature_metrics(diff, wincons, score_mask, avg) -> Dict[str, np.ndarray]:
+    """Alle metrics voor arrays van signaturen (offense−defense, wincons, SCORE_MASK, avg)."""
+    balance = np.clip(1.0 - np.abs(diff) / 8.0, 0.0, 1.0)
+    coverage = _S_COV[score_mask]
+    spells = _S_SPL[score_mask]
+    wincon = np.minimum(1.0, wincons / 2.0)
+    # Zelfde optelvolgorde als synergy_score: eerst de tagparen, dan de elixirbonus.
+    synergy = np.clip(_S_SYN[score_mask] + np.where(avg <= 3.1, 0.2, np.where(avg <= 4.0, 0.1, 0.0)),
+                      0.0, 1.0)
+    return {"balance": balance, "coverage": coverage, "spells": spells, "wincon": wincon,
+            "synergy": synergy,
+            "overall": overall_batch(balance, coverage, spells, wincon, synergy, avg)}
+
+
+def names_to_indices(decks: List[List[str]]) -> np.ndarray:
+    """(N, 8) int16-matrix met kaart-ID's; onbekende/ontbrekende kaarten worden -1."""
+    out = np.full((len(decks), 8), -1, dtype=np.int16)
+    for r, names in enumerate(decks):
+        ids = to_ids(names)
+        out[r, :len(ids)] = ids
+    return out
+
+
+@timed("evaluate_decks_batch")
+def evaluate_decks_batch(indices: np.ndarray, as_frame: bool = False):
+    """Scoort N decks tegelijk; indices is een (N, <=8) matrix van kaart-ID's (-1 = leeg slot).
+
+    Geeft een structured array met BATCH_FIELDS (of een DataFrame bij as_frame=True),
+    met per rij exact dezelfde waarden als evaluate_deck.
+    """
+    idx = np.asarray(indices)
+    if idx.ndim != 2 or idx.shape[1] > 8:
+        raise ValueError(f"verwacht een (N, <=8) matrix, kreeg shape {idx.shape}")
+    if idx.size and idx.max() >= N_CARDS:
+        raise ValueError("onbekend kaart-ID in indices")
+    valid = idx >= 0
+    g = np.where(valid, idx, N_CARDS)
+
+    avg = _AVG_TABLE[valid.sum(axis=1), _F_ELIXIR[g].sum(axis=1)]
+    m = signature_metrics(_F_DIFF[g].sum(axis=1), _F_WINCON[g].sum(axis=1),
+                          np.bitwise_or.reduce(_F_SMASK[g], axis=1), avg)
+
+    out = np.empty(len(idx), dtype=BATCH_DTYPE)
+    out["avg_elixir"] = avg
+    for f in BATCH_FIELDS[1:]:
+        out[f] = m[f]
+    if as_frame:
+        import pandas as pd
+        return pd.DataFrame(out)
+    return out
+
+
+@timed("suggest_improvements")
 def suggest_improvements(deck, metrics, avg_elixir):
     # Verzamel tags en simpele archetype-detectie
     tags = {t for c in deck for t in c["tags"]}
@@ -0,0 +1,375 @@
+"""Geschiedenis van alle analyses in SQLite (WAL).
+
+Elke analyse in de app wordt één rij: canonieke deck-sleutel (dezelfde 8-byte
+sleutel als .decks en deck_index), kaarten, metrics, adviesregels, bron
+(LLM/Regels/Heuristiek), tijdsduur en SCORE_VERSION. Schrijven gebeurt buiten het
+request-pad: record() zet de rij in een queue en een achtergrondthread schrijft
+batches in één transactie. Tot dan is de rij al zichtbaar via latest(), analyses()
+en count(), zodat een herhaalde analyse van hetzelfde deck meteen uit de store
+komt; trend() en top_decks() zien alleen weggeschreven rijen.
+
+Indexen op (deck_key, created) en (created, overall, source) houden trends en
+per-deck opvragingen snel, ook bij honderdduizenden analyses. Exporteren naar Markdown of CSV:
+
+    python -m history stats
+    python -m history trend --days 30 --deck "Hog Rider;Musketeer;..."
+    python -m history export -o advies.md --limit 20
+    python -m history import-md docs/     # oude docs/ai_advice_*.md overnemen
+"""
+import argparse
+import csv
+import json
+import queue
+import re
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence, Union
+
+from card_index import CARD_ID
+from heuristics import SCORE_VERSION
+
+DEFAULT_PATH = Path(__file__).resolve().parent / "data" / "cache" / "history.sqlite"
+METRICS = ("balance", "coverage", "spells", "wincon", "synergy", "overall")
+_COLUMNS = ("created", "deck_key", "cards", "avg_elixir") + METRICS + (
+    "advice", "source", "elapsed_ms", "version")
+_INSERT = (f"INSERT INTO analyses ({', '.join(_COLUMNS)}) "
+           f"VALUES ({', '.join('?' * len(_COLUMNS))})")
+
+
+def deck_key(names: Sequence[str]) -> int:
+    """Canonieke sleutel (volgorde-onafhankelijk), als signed 64-bit voor SQLite.
+
+    Gelijk aan deck_corpus.pack_rows(...).view("<i8"), zonder NumPy per aanroep.
+    """
+    ids = sorted(CARD_ID[n] for n in names) + [255] * (8 - len(names))
+    return int.from_bytes(bytes(ids), "little", signed=True)
+
+
+class Analysis(NamedTuple):
+    created: float
+    deck_key: int
+    cards: List[str]
+    avg_elixir: float
+    metrics: Dict[str, float]
+    advice: List[str]
+    source: str
+    elapsed_ms: Optional[float]
+    version: str
+
+    def row(self) -> tuple:
+        return ((self.created, self.deck_key, ";".join(self.cards), self.avg_elixir)
+                + tuple(self.metrics[m] for m in METRICS)
+                + (json.dumps(self.advice, ensure_ascii=False), self.source, self.elapsed_ms,
+                   self.version))
+
+    @classmethod
+    def from_row(cls, r: Sequence[Any]) -> "Analysis":
+        return cls(r[0], r[1], r[2].split(";"), r[3], dict(zip(METRICS, r[4:10])),
+                   json.loads(r[10]), r[11], r[12], r[13])
+
+
+class History:
+    def __init__(self, path: Union[str, Path] = DEFAULT_PATH, batch_window: float = 0.05,
+                 max_batch: int = 512):
+        self.path = Path(path)
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        # Nog niet weggeschreven analyses per deck-sleutel, oudste eerst (read-your-writes).
+        self._pending: Dict[int, List[Analysis]] = {}
+        self._queue: "queue.Queue[Optional[Analysis]]" = queue.Queue()
+        # Leesverbinding voor alle threads (via self._lock); de writer heeft een eigen verbinding.
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False, timeout=10)
+        with self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(f"""CREATE TABLE IF NOT EXISTS analyses (
+                                     id INTEGER PRIMARY KEY, created REAL NOT NULL,
+                                     deck_key INTEGER NOT NULL, cards TEXT NOT NULL,
+                                     avg_elixir REAL NOT NULL,
+                                     {', '.join(f'{m} REAL NOT NULL' for m in METRICS)},
+                                     advice TEXT NOT NULL, source TEXT NOT NULL,
+                                     elapsed_ms REAL, version TEXT NOT NULL)""")
+            self._db.execute("CREATE INDEX IF NOT EXISTS analyses_deck "
+                             "ON analyses(deck_key, created)")
+            # Dekkend voor trend(): geen tabelopzoekingen per rij.
+            self._db.execute("CREATE INDEX IF NOT EXISTS analyses_created "
+                             "ON analyses(created, overall, source)")
+        self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+        self._thread.start()
+
+    # ---------- schrijven ----------
+    def record(self, cards: Sequence[str], avg_elixir: float, metrics: Dict[str, float],
+               advice: Sequence[str] = (), source: str = "", elapsed_ms: Optional[float] = None,
+               created: Optional[float] = None) -> Analysis:
+        """Zet een analyse in de schrijfqueue; blokkeert niet op de database."""
+        a = Analysis(time.time() if created is None else created, deck_key(cards), list(cards),
+                     float(avg_elixir), {m: float(metrics[m]) for m in METRICS}, list(advice),
+                     source, elapsed_ms, SCORE_VERSION)
+        with self._lock:
+            self._pending.setdefault(a.deck_key, []).append(a)
+        self._queue.put(a)
+        return a
+
+    def flush(self) -> None:
+        """Wacht tot alles in de queue weggeschreven is."""
+        self._queue.join()
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._thread.join()
+        with self._lock:
+            self._db.close()
+
+    def _collect(self) -> Optional[List[Analysis]]:
+        first = self._queue.get()
+        if first is None:
+            self._queue.task_done()
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.batch_window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.task_done()
+                self._queue.put(None)  # afsluiten na deze batch
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self) -> None:
+        db = sqlite3.connect(str(self.path), timeout=30)
+        try:
+            while True:
+                batch = self._collect()
+                if batch is None:
+                    return
+                # Commit en opruimen van _pending onder één lock: een lezer ziet een rij
+                # nooit zowel in de database als in _pending.
+                with self._lock:
+                    try:
+                        with db:
+                            db.executemany(_INSERT, [a.row() for a in batch])
+                    except sqlite3.Error as e:
+                        print(f"history: {len(batch)} analyse(s) niet opgeslagen: {e}",
+                              file=sys.stderr)
+                    for a in batch:
+                        queued = self._pending[a.deck_key]
+                        queued.remove(a)
+                        if not queued:
+                            del self._pending[a.deck_key]
+                for _ in batch:
+                    self._queue.task_done()
+        finally:
+            db.close()
+
+    # ---------- lezen ----------
+    def _query(self, sql: str, params: Sequence[Any] = ()) -> List[tuple]:
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    def latest(self, cards: Sequence[str],
+               version: Optional[str] = SCORE_VERSION) -> Optional[Analysis]:
+        """Laatste analyse van dit deck (in elke kaartvolgorde), met dezelfde SCORE_VERSION."""
+        key = deck_key(cards)
+        with self._lock:
+            queued = self._pending.get(key)
+            a = queued[-1] if queued else None
+        if a is not None and (version is None or a.version == version):
+            return a
+        sql = f"SELECT {', '.join(_COLUMNS)} FROM analyses WHERE deck_key = ?"
+        params: List[Any] = [key]
+        if version is not None:
+            sql += " AND version = ?"
+            params.append(version)
+        rows = self._query(sql + " ORDER BY created DESC LIMIT 1", params)
+        return Analysis.from_row(rows[0]) if rows else None
+
+    def analyses(self, cards: Optional[Sequence[str]] = None, since: Optional[float] = None,
+                 limit: Optional[int] = None) -> List[Analysis]:
+        """Analyses, nieuwste eerst; optioneel alleen van één deck en/of vanaf `since`.
+
+        Nog niet weggeschreven analyses tellen mee.
+        """
+        where, params = self._where(cards, since)
+        with self._lock:
+            queued = self._queued(cards, since)
+            rows = self._db.execute(f"SELECT {', '.join(_COLUMNS)} FROM analyses{where} "
+                                    f"ORDER BY created DESC LIMIT ?",
+                                    params + [-1 if limit is None else limit]).fetchall()
+        out = sorted(queued + [Analysis.from_row(r) for r in rows],
+                     key=lambda a: a.created, reverse=True)
+        return out if limit is None else out[:limit]
+
+    def count(self, cards: Optional[Sequence[str]] = None) -> int:
+        where, params = self._where(cards, None)
+        with self._lock:
+            return (len(self._queued(cards, None))
+                    + self._db.execute(f"SELECT COUNT(*) FROM analyses{where}",
+                                       params).fetchone()[0])
+
+    def _queued(self, cards: Optional[Sequence[str]], since: Optional[float]) -> List[Analysis]:
+        """Nog niet weggeschreven analyses (aanroeper houdt self._lock vast)."""
+        if cards is None:
+            queued = [a for lst in self._pending.values() for a in lst]
+        else:
+            queued = list(self._pending.get(deck_key(cards), ()))
+        return [a for a in queued if since is None or a.created >= since]
+
+    def trend(self, cards: Optional[Sequence[str]] = None, since: Optional[float] = None,
+              bucket_s: int = 86400) -> List[Dict[str, Any]]:
+        """Per tijdsbucket: aantal analyses, gemiddelde overall en aandeel LLM-advies."""
+        where, params = self._where(cards, since)
+        rows = self._query(f"""SELECT CAST(created / ? AS INTEGER) AS b, COUNT(*), AVG(overall),
+                                      AVG(source = 'LLM')
+                               FROM analyses{where} GROUP BY b ORDER BY b""",
+                           [bucket_s] + params)
+        return [{"start": b * bucket_s, "analyses": n, "overall": o, "llm_share": s}
+                for b, n, o, s in rows]
+
+    def top_decks(self, limit: int = 10, since: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Vaakst geanalyseerde decks met hun laatste overall."""
+        where, params = self._where(None, since)
+        # Tellen alleen op de index (deck_key, created); kaarten/overall voor de top-rijen.
+        rows = self._query(f"""SELECT a.cards, t.n, a.overall, t.last
+                               FROM (SELECT deck_key, COUNT(*) AS n, MAX(created) AS last
+                                     FROM analyses{where} GROUP BY deck_key
+                                     ORDER BY n DESC LIMIT ?) AS t
+                               JOIN analyses AS a ON a.deck_key = t.deck_key
+                                                 AND a.created = t.last
+                               GROUP BY t.deck_key ORDER BY t.n DESC""", params + [limit])
+        return [{"cards": c.split(";"), "analyses": n, "overall": o, "last": t}
+                for c, n, o, t in rows]
+
+    @staticmethod
+    def _where(cards: Optional[Sequence[str]], since: Optional[float]):
+        clauses, params = [], []
+        if cards is not None:
+            clauses.append("deck_key = ?")
+            params.append(deck_key(cards))
+        if since is not None:
+            clauses.append("created >= ?")
+            params.append(since)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+
+# ---------- export ----------
+def _stamp(t: float) -> str:
+    return datetime.fromtimestamp(t).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def to_markdown(analyses: Iterable[Analysis]) -> str:
+    """Zelfde opzet als de vroegere docs/ai_advice_*.md, één sectie per analyse."""
+    parts = []
+    for a in analyses:
+        lines = [f"# Advies ({_stamp(a.created)})", f"Deck: {', '.join(a.cards)}", "",
+                 f"Overall: {round(a.metrics['overall'] * 100):d} / 100 · "
+                 f"elixir {a.avg_elixir} · bron: {a.source or '-'}", "", "## Tips"]
+        parts.append("\n".join(lines + list(a.advice)) + "\n")
+    return "\n".join(parts)
+
+
+def write_csv(f, analyses: Iterable[Analysis]) -> int:
+    w = csv.writer(f, lineterminator="\n")
+    w.writerow(["Time", "Cards", "AvgElixir"] + [m.capitalize() for m in METRICS]
+               + ["Source", "ElapsedMs", "Advice"])
+    n = 0
+    for a in analyses:
+        w.writerow([_stamp(a.created), ";".join(a.cards), a.avg_elixir]
+                   + [round(a.metrics[m], 4) for m in METRICS]
+                   + [a.source, "" if a.elapsed_ms is None else round(a.elapsed_ms, 1),
+                      "\n".join(a.advice)])
+        n += 1
+    return n
+
+
+_MD_NAME = re.compile(r"ai_advice_(\d{8}-\d{6})\.md$")
+
+
+def import_markdown(history: History, paths: Iterable[Path]) -> int:
+    """Oude docs/ai_advice_<tijd>.md-bestanden als analyses overnemen (metrics opnieuw berekend)."""
+    from heuristics import evaluate_deck
+    n = 0
+    for path in paths:
+        m = _MD_NAME.search(path.name)
+        text = path.read_text(encoding="utf-8").splitlines()
+        deck = next((ln[len("Deck:"):] for ln in text if ln.startswith("Deck:")), None)
+        if not m or deck is None:
+            continue
+        cards = [c.strip() for c in deck.split(",") if c.strip()]
+        res = evaluate_deck(cards)
+        tips = [ln for ln in text if ln.startswith("- ")]
+        history.record(cards, res["avg_elixir"], res["metrics"], tips, "Markdown",
+                       created=datetime.strptime(m.group(1), "%Y%m%d-%H%M%S").timestamp())
+        n += 1
+    history.flush()
+    return n
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    p = argparse.ArgumentParser(description="Geschiedenis van deck-analyses.")
+    p.add_argument("--db", default=str(DEFAULT_PATH), help="SQLite-bestand")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("stats", help="totalen en de vaakst geanalyseerde decks")
+    t = sub.add_parser("trend", help="analyses en gemiddelde overall per dag")
+    e = sub.add_parser("export", help="naar Markdown (.md) of CSV")
+    e.add_argument("-o", "--output", default="-", help="'-' = stdout (Markdown)")
+    e.add_argument("--limit", type=int, default=None)
+    for s in (t, e):
+        s.add_argument("--deck", help='alleen dit deck: "Kaart1;Kaart2;..."')
+        s.add_argument("--days", type=float, default=None, help="alleen de laatste N dagen")
+    i = sub.add_parser("import-md", help="oude docs/ai_advice_*.md overnemen")
+    i.add_argument("dir", nargs="?", default="docs")
+    args = p.parse_args(argv)
+
+    try:
+        if not Path(args.db).exists() and args.cmd != "import-md":
+            raise FileNotFoundError(f"{args.db} bestaat niet.")
+        history = History(args.db)
+        try:
+            cards = getattr(args, "deck", None)
+            cards = [c.strip() for c in cards.split(";") if c.strip()] if cards else None
+            since = (time.time() - args.days * 86400
+                     if getattr(args, "days", None) is not None else None)
+            if args.cmd == "stats":
+                print(f"{history.count()} analyses")
+                for d in history.top_decks():
+                    print(f"{d['analyses']:>8}x  {round(d['overall'] * 100):>3d}  "
+                          f"{', '.join(d['cards'])}")
+            elif args.cmd == "trend":
+                for b in history.trend(cards, since):
+                    print(f"{_stamp(b['start'])[:10]}  {b['analyses']:>8}  "
+                          f"overall {b['overall']:.3f}  LLM {b['llm_share']:.0%}")
+            elif args.cmd == "export":
+                rows = history.analyses(cards, since, args.limit)
+                if args.output.endswith(".csv"):
+                    with open(args.output, "w", encoding="utf-8", newline="") as f:
+                        write_csv(f, rows)
+                elif args.output == "-":
+                    sys.stdout.write(to_markdown(rows))
+                else:
+                    Path(args.output).write_text(to_markdown(rows), encoding="utf-8")
+                print(f"{len(rows)} analyses geëxporteerd.", file=sys.stderr)
+            else:
+                n = import_markdown(history, sorted(Path(args.dir).glob("ai_advice_*.md")))
+                print(f"{n} bestand(en) overgenomen in {args.db}.", file=sys.stderr)
+        finally:
+            history.close()
+    except (OSError, KeyError, ValueError, sqlite3.Error) as e:
+        print(f"Fout: {e}", file=sys.stderr)
+        return 2
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,216 @@
+"""Lichte instrumentatie: tijd per stap, tellers en export.
+
+Staat uit tenzij CRDA_METRICS=1 (of enable()). Uitgeschakeld kost een
+stage()/timed()/inc()-aanroep alleen een vlagcontrole. Ingeschakeld worden
+gemeten:
+
+  crda_stage_seconds{stage=...}   histogram per stap (evaluate_deck, prompt, generate, ...)
+  crda_<naam>_total{...}          tellers (advice_cache, llm_fallback, exceptions, llm_tokens, ...)
+
+Export als Prometheus-tekst (prometheus_text) of JSON (snapshot); met
+CRDA_METRICS_PORT serveert serve_from_env() beide over HTTP op /metrics en
+/metrics.json. profile_request() draait één aanvraag onder cProfile als
+CRDA_PROFILE gezet is (bestanden in data/profiles, te openen met snakeviz of
+pstats).
+"""
+import cProfile
+import functools
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+PREFIX = "crda"
+BUCKETS: Tuple[float, ...] = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                              0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+PROFILE_DIR = Path(__file__).resolve().parent / "data" / "profiles"
+
+_enabled = os.environ.get("CRDA_METRICS", "0") == "1"
+_lock = threading.Lock()
+_NOOP = nullcontext()
+
+Labels = Tuple[Tuple[str, str], ...]
+_counters: Dict[Tuple[str, Labels], float] = {}
+_histograms: Dict[str, list] = {}  # stage -> [bucket_counts..., +Inf, sum, count]
+
+
+def enable(on: bool = True) -> None:
+    global _enabled
+    _enabled = on
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def reset() -> None:
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+
+# ---------- vastleggen ----------
+def inc(name: str, n: float = 1, **labels: str) -> None:
+    if not _enabled:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + n
+
+
+def observe(stage: str, seconds: float) -> None:
+    if not _enabled:
+        return
+    with _lock:
+        h = _histograms.get(stage)
+        if h is None:
+            h = _histograms[stage] = [0] * (len(BUCKETS) + 3)
+        h[bisect_left(BUCKETS, seconds)] += 1
+        h[-2] += seconds
+        h[-1] += 1
+
+
+class _Timer:
+    __slots__ = ("stage", "t0")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self) -> "_Timer":
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        observe(self.stage, time.perf_counter() - self.t0)
+        if exc_type is not None:
+            inc("exceptions", stage=self.stage, type=exc_type.__name__)
+
+
+def stage(name: str):
+    """Contextmanager die de duur van het blok onder `name` registreert (en fouten telt)."""
+    return _Timer(name) if _enabled else _NOOP
+
+
+def timed(name: str) -> Callable:
+    """Decorator-variant van stage()."""
+    def deco(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            with _Timer(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+
+# ---------- export ----------
+def snapshot() -> Dict[str, Any]:
+    with _lock:
+        counters = [{"name": n, "labels": dict(lb), "value": v}
+                    for (n, lb), v in sorted(_counters.items())]
+        stages = {}
+        for s, h in sorted(_histograms.items()):
+            stages[s] = {"count": h[-1], "sum": h[-2],
+                         "buckets": dict(zip([str(b) for b in BUCKETS] + ["+Inf"],
+                                             _cumulative(h[:-2])))}
+    return {"enabled": _enabled, "time": time.time(), "counters": counters, "stages": stages}
+
+
+def _cumulative(counts) -> list:
+    out, acc = [], 0
+    for c in counts:
+        acc += c
+        out.append(acc)
+    return out
+
+
+def _labels(lb: Dict[str, str]) -> str:
+    if not lb:
+        return ""
+
+    def esc(v: Any) -> str:
+        return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in lb.items()) + "}"
+
+
+def prometheus_text() -> str:
+    snap = snapshot()
+    lines = [f"# HELP {PREFIX}_stage_seconds Duur per verwerkingsstap.",
+             f"# TYPE {PREFIX}_stage_seconds histogram"]
+    for s, h in snap["stages"].items():
+        for le, c in h["buckets"].items():
+            lines.append(f"{PREFIX}_stage_seconds_bucket{_labels({'stage': s, 'le': le})} {c}")
+        lines.append(f"{PREFIX}_stage_seconds_sum{_labels({'stage': s})} {h['sum']}")
+        lines.append(f"{PREFIX}_stage_seconds_count{_labels({'stage': s})} {h['count']}")
+    seen = set()
+    for c in snap["counters"]:
+        metric = f"{PREFIX}_{c['name']}_total"
+        if metric not in seen:
+            seen.add(metric)
+            lines.append(f"# TYPE {metric} counter")
+        lines.append(f"{metric}{_labels(c['labels'])} {c['value']}")
+    return "\n".join(lines) + "\n"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        if self.path == "/metrics":
+            body, ctype = prometheus_text(), "text/plain; version=0.0.4"
+        elif self.path == "/metrics.json":
+            body, ctype = json.dumps(snapshot()), "application/json"
+        else:
+            self.send_error(404)
+            return
+        data = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+def serve(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Start een metrics-endpoint in een daemonthread."""
+    server = ThreadingHTTPServer((host, port), _Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+def serve_from_env() -> Optional[ThreadingHTTPServer]:
+    """serve() op CRDA_METRICS_PORT als die gezet is (zet de metrics dan ook aan)."""
+    port = os.environ.get("CRDA_METRICS_PORT")
+    if not port:
+        return None
+    enable()
+    return serve(int(port))
+
+
+# ---------- profiling ----------
+@contextmanager
+def profile_request(name: str) -> Iterator[None]:
+    """cProfile rond één aanvraag als CRDA_PROFILE gezet is; anders niets.
+
+    Voor sampling zonder overhead is geen hook nodig: py-spy haakt van buitenaf aan
+    (`py-spy record --pid <pid>`).
+    """
+    if not os.environ.get("CRDA_PROFILE"):
+        yield
+        return
+    prof = cProfile.Profile()
+    prof.enable()
+    try:
+        yield
+    finally:
+        prof.disable()
+        PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+        ts = time.strftime("%Y%m%d-%H%M%S")
+        prof.dump_stats(str(PROFILE_DIR / f"{name}_{ts}_{os.getpid()}.prof"))
@@ -0,0 +1,174 @@
+"""LLM-advies: prompt, parsing en een orchestrator met deadline.
+
+De app toont eerst direct het regelgebaseerde advies. AdviceOrchestrator start
+tegelijk de LLM-aanvraag via de gedeelde InferenceService; komt het antwoord
+binnen de deadline, dan vervangt de app het advies. Komt het te laat, dan
+wordt het resultaat alsnog verwerkt en in de AdviceCache gezet, zodat de
+volgende aanvraag voor hetzelfde deck een directe hit is.
+
+Twee modi: "score" (standaard) laat het model alleen de kandidaat-opties
+scoren op log-likelihood en rangschikt ze daarop: één forward pass, altijd
+geldige regels. "generate" is de oude vrije generatie met beam search en
+regex-parsing, aangevuld met kandidaten.
+"""
+import os
+import re
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from typing import Dict, List, Optional, Sequence
+
+import instrument
+from advice_cache import AdviceCache, cache_key
+from llm_service import InferenceService
+from recommender import Candidate
+
+MAX_TIPS = 4
+SCORE, GENERATE = "score", "generate"
+# "score": model rangschikt de kandidaat-swaps (snel); "generate": vrije generatie + parsing.
+LLM_MODE = os.environ.get("CRDA_LLM_MODE", SCORE)
+GEN_KWARGS = {"max_new_tokens": 200, "num_beams": 4, "do_sample": False, "no_repeat_ngram_size": 3}
+
+_VERVANG_RE = re.compile(
+    r"VERVANG:\s*([A-Za-z .’'&\-]+)\s*->\s*([A-Za-z .’'&\-]+)\s*(?:—|-)\s*reden:\s*([^\n\r]+)")
+
+
+@instrument.timed("prompt")
+def build_prompt(deck_names: Sequence[str], candidates: Sequence[Candidate]) -> str:
+    option_lines = [
+        f"{chr(65+i)}) VERVANG: {o} -> {i_} — reden: {r}" for i, (o, i_, r) in enumerate(candidates)
+    ]
+    return f"""Je bent een Clash Royale coach.
+Kies ALLE opties die het deck verbeteren (meerdere regels mogelijk).
+Geef UITSLUITEND regels in dit formaat:
+VERVANG: <KaartUit> -> <KaartIn> — reden: <korte reden>
+Deck: {', '.join(deck_names)}
+
+Opties:
+{chr(10).join(option_lines)}
+
+Antwoord:"""
+
+
+@instrument.timed("prompt")
+def build_score_prompt(deck_names: Sequence[str], candidates: Sequence[Candidate]) -> str:
+    """Meerkeuzeprompt; het antwoord is een van de optieregels (zie option_texts)."""
+    option_lines = [f"{chr(65+i)}) {t}" for i, t in enumerate(option_texts(candidates))]
+    return f"""Je bent een Clash Royale coach.
+Deck: {', '.join(deck_names)}
+Welke vervanging verbetert dit deck het meest?
+
+Opties:
+{chr(10).join(option_lines)}
+
+Beste vervanging:"""
+
+
+def option_texts(candidates: Sequence[Candidate]) -> List[str]:
+    return [f"VERVANG: {o} -> {i_} — reden: {r}" for (o, i_, r) in candidates]
+
+
+def rank_options(options: Sequence[str], scores: Sequence[float],
+                 max_tips: int = MAX_TIPS) -> List[str]:
+    """Opties van hoogste naar laagste score (bij gelijke score de kandidaatvolgorde)."""
+    order = sorted(range(len(options)), key=lambda i: -scores[i])
+    return [f"- {options[i]}" for i in order[:max_tips]]
+
+
+@instrument.timed("parse")
+def parse_advice(text: str) -> List[str]:
+    return [f"- VERVANG: {a.strip()} -> {b.strip()} — reden: {r.strip()}"
+            for (a, b, r) in _VERVANG_RE.findall(text)]
+
+
+def candidate_lines(candidates: Sequence[Candidate]) -> List[str]:
+    return [f"- VERVANG: {o} -> {i_} — reden: {r}" for (o, i_, r) in candidates]
+
+
+def fill_from_candidates(adv_lines: List[str], candidates: Sequence[Candidate],
+                         max_tips: int = MAX_TIPS) -> List[str]:
+    """Vul LLM-regels aan met kandidaten tot min(max_tips, #kandidaten) regels."""
+    adv_lines = list(adv_lines)
+    if len(adv_lines) < min(max_tips, len(candidates)):
+        for (o, i_, r) in candidates:
+            line = f"- VERVANG: {o} -> {i_} — reden: {r}"
+            if all(f" {o} -> {i_} " not in s for s in adv_lines):
+                adv_lines.append(line)
+            if len(adv_lines) >= max_tips:
+                break
+    return adv_lines
+
+
+class AdviceOrchestrator:
+    """Start LLM-aanvragen asynchroon; resultaten belanden altijd in de cache."""
+
+    def __init__(self, service: InferenceService, cache: AdviceCache, mode: str = SCORE):
+        if mode not in (SCORE, GENERATE):
+            raise ValueError(f"Onbekende LLM-modus: {mode!r}")
+        self.service = service
+        self.cache = cache
+        self.mode = mode
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def request(self, prompt: str, options: Optional[Sequence[str]] = None) -> Future:
+        """Future met de adviesregels; direct klaar bij een cache-hit.
+
+        Zonder `options` wordt vrij gegenereerd en geparsed; met `options` scoort
+        het model die opties en zijn de regels de gerangschikte opties.
+        Een tweede aanvraag voor dezelfde prompt terwijl de eerste nog loopt,
+        krijgt dezelfde Future (geen dubbele generatie).
+        """
+        cached = self.cache.get(prompt, self.service.model)
+        if cached is not None:
+            instrument.inc("advice_cache", result="hit")
+            fut: Future = Future()
+            fut.set_result(cached)
+            return fut
+        key = cache_key(prompt, self.service.model)
+        with self._lock:
+            if key in self._inflight:
+                instrument.inc("advice_cache", result="inflight")
+                return self._inflight[key]
+            out: Future = Future()
+            self._inflight[key] = out
+        instrument.inc("advice_cache", result="miss")
+        t0 = time.perf_counter()
+
+        def done(src: Future) -> None:
+            instrument.observe("generate" if options is None else "score",
+                               time.perf_counter() - t0)
+            try:
+                lines = (parse_advice(src.result()) if options is None
+                         else rank_options(options, src.result()))
+                self.cache.put(prompt, self.service.model, lines)
+                out.set_result(lines)
+            except Exception as e:
+                out.set_exception(e)
+            finally:
+                with self._lock:
+                    self._inflight.pop(key, None)
+
+        if options is None:
+            self.service.submit(prompt, **GEN_KWARGS).add_done_callback(done)
+        else:
+            self.service.score(prompt, options).add_done_callback(done)
+        return out
+
+    def advise(self, deck_names: Sequence[str], candidates: Sequence[Candidate],
+               deadline_s: float) -> Optional[List[str]]:
+        """LLM-regels (gerangschikt, of aangevuld met kandidaten) binnen `deadline_s`, anders None.
+
+        Fouten van het model worden doorgegeven; een late uitkomst wordt alleen gecachet.
+        """
+        if not candidates:
+            return ["- Dit deck is optimaal! 🎯"]
+        if self.mode == SCORE:
+            fut = self.request(build_score_prompt(deck_names, candidates), option_texts(candidates))
+        else:
+            fut = self.request(build_prompt(deck_names, candidates))
+        try:
+            lines = fut.result(timeout=deadline_s)
+        except FutureTimeout:
+            return None
+        return lines if self.mode == SCORE else fill_from_candidates(lines, candidates)
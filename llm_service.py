@@ -0,0 +1,216 @@
+"""Gedeelde inference-worker met dynamic batching.
+
+Eén achtergrondthread per proces bezit de text2text-pipeline. Aanvragen van
+alle Streamlit-sessies komen in een queue; de worker wacht na de eerste
+aanvraag maximaal `batch_window` seconden op meer en draait ze dan als één
+gebatchte `pipeline`-aanroep (per set generatie-argumenten). Elke aanroeper
+krijgt een Future en wacht daar met een timeout op.
+
+Naast vrije generatie kan de worker ook opties scoren (`score`): de
+conditionele log-likelihood van elke optie gegeven de prompt, voor alle
+aanvragen in de batch in één forward pass (encoder één keer per prompt,
+decoder teacher-forced over alle opties). Geen beam search en geen decodeerlus.
+
+transformers wordt pas in de worker geïmporteerd: bij de eerste aanvraag, of
+eerder via warm_up(). `state` (cold/loading/ready/failed) laat de UI zien of
+het model nog opwarmt. Met CRDA_LLM_PATH wordt het model van een lokaal pad
+geladen en staat de Hugging Face hub uit (offline).
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import instrument
+
+LLM_MODEL = "google/flan-t5-base"
+LLM_MODEL_PATH = os.environ.get("CRDA_LLM_PATH")
+
+COLD, LOADING, READY, FAILED = "cold", "loading", "ready", "failed"
+GENERATE, SCORE = "generate", "score"
+_WARMUP = object()  # queue-item: alleen het model laden
+
+
+def default_model() -> str:
+    """Lokaal modelpad als CRDA_LLM_PATH gezet is, anders de hub-naam."""
+    return LLM_MODEL_PATH or LLM_MODEL
+
+
+def _default_factory(model: str):
+    if os.path.isdir(model):
+        # Lokaal model: nooit de hub benaderen (moet vóór de import gezet zijn).
+        os.environ.setdefault("HF_HUB_OFFLINE", "1")
+        os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+    from transformers import pipeline
+    return pipeline("text2text-generation", model=model)
+
+
+def score_options(pipe, requests: Sequence[Tuple[str, Sequence[str]]]) -> List[List[float]]:
+    """Gemiddelde log-waarschijnlijkheid per token van elke optie gegeven zijn prompt.
+
+    `requests` = [(prompt, opties), ...]; alles gaat in één gebatchte forward pass
+    door `pipe.model` (encoder-decoder zoals flan-t5). Het gemiddelde i.p.v. de som
+    voorkomt dat korte opties altijd winnen.
+    """
+    import torch
+    model, tok = pipe.model, pipe.tokenizer
+    owner = [i for i, (_, opts) in enumerate(requests) for _ in opts]
+    options = [o for _, opts in requests for o in opts]
+    if not options:
+        return [[] for _ in requests]
+    device = model.device
+    enc = tok([p for p, _ in requests], return_tensors="pt", padding=True,
+              truncation=True).to(device)
+    tgt = tok(options, return_tensors="pt", padding=True, truncation=True).to(device)
+    labels = tgt.input_ids.masked_fill(tgt.attention_mask == 0, -100)
+    rows = torch.tensor(owner, device=device)
+    with torch.inference_mode():
+        hidden = model.get_encoder()(**enc).last_hidden_state
+        logits = model(encoder_outputs=(hidden[rows],), attention_mask=enc.attention_mask[rows],
+                       labels=labels).logits
+        logp = logits.log_softmax(-1).gather(-1, labels.clamp(min=0).unsqueeze(-1)).squeeze(-1)
+        mask = tgt.attention_mask.to(logp.dtype)
+        mean = ((logp * mask).sum(1) / mask.sum(1)).tolist()
+    out: List[List[float]] = [[] for _ in requests]
+    for i, v in zip(owner, mean):
+        out[i].append(v)
+    return out
+
+
+class InferenceService:
+    def __init__(self, model: str = LLM_MODEL, batch_window: float = 0.02, max_batch: int = 8,
+                 pipeline_factory: Optional[Callable[[str], Any]] = None):
+        self.model = model
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self._factory = pipeline_factory or _default_factory
+        self._pipe = None
+        self.state = COLD
+        self.load_error: Optional[BaseException] = None
+        self.load_seconds: Optional[float] = None
+        self._queue: "queue.Queue[Optional[Tuple[str, str, Any, Future]]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="llm-inference", daemon=True)
+        self._thread.start()
+
+    # ---------- API ----------
+    def submit(self, prompt: str, **gen_kwargs) -> Future:
+        fut: Future = Future()
+        self._queue.put((GENERATE, prompt, gen_kwargs, fut))
+        return fut
+
+    def score(self, prompt: str, options: Sequence[str]) -> Future:
+        """Future met per optie de gemiddelde log-likelihood (zelfde volgorde als `options`)."""
+        fut: Future = Future()
+        self._queue.put((SCORE, prompt, list(options), fut))
+        return fut
+
+    def generate(self, prompt: str, timeout: Optional[float] = None, **gen_kwargs) -> str:
+        """Blokkeert tot de tekst er is; TimeoutError na `timeout` seconden."""
+        return self.submit(prompt, **gen_kwargs).result(timeout=timeout)
+
+    def warm_up(self) -> None:
+        """Laat de worker het model op de achtergrond laden (idempotent)."""
+        if self.state in (COLD, FAILED):
+            self.state = LOADING
+            self._queue.put(_WARMUP)
+
+    @property
+    def ready(self) -> bool:
+        return self.state == READY
+
+    def status(self) -> Dict[str, Any]:
+        return {"model": self.model, "state": self.state, "load_seconds": self.load_seconds,
+                "error": None if self.load_error is None else repr(self.load_error)}
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._thread.join()
+
+    # ---------- worker ----------
+    def _load(self):
+        if self._pipe is None:
+            self.state = LOADING
+            t0 = time.perf_counter()
+            try:
+                self._pipe = self._factory(self.model)
+            except Exception as e:
+                self.state, self.load_error = FAILED, e
+                raise
+            self.load_seconds = time.perf_counter() - t0
+            instrument.observe("model_load", self.load_seconds)
+            self.state, self.load_error = READY, None
+        return self._pipe
+
+    def _count(self, prompts: List[str], texts: List[str], kind: str = "completion") -> None:
+        instrument.inc("llm_batches")
+        instrument.inc("llm_requests", len(prompts))
+        tok = getattr(self._pipe, "tokenizer", None)
+        if tok is not None:
+            instrument.inc("llm_tokens", sum(len(tok(p).input_ids) for p in prompts), kind="prompt")
+            instrument.inc("llm_tokens", sum(len(tok(t).input_ids) for t in texts), kind=kind)
+
+    def _collect(self) -> Optional[List[Tuple[str, str, Any, Future]]]:
+        first = self._queue.get()
+        if first is None:
+            return None
+        if first is _WARMUP:
+            try:
+                self._load()
+            except Exception:
+                pass  # staat in self.state/load_error; volgende aanvraag probeert opnieuw
+            return []
+        batch = [first]
+        deadline = time.monotonic() + self.batch_window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)  # afsluiten na deze batch
+                break
+            if item is _WARMUP:
+                continue  # model wordt hieronder toch geladen
+            batch.append(item)
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            # Alle scoor-aanvragen samen; generatie alleen met dezelfde argumenten samen.
+            groups: Dict[tuple, List[Tuple[str, Any, Future]]] = {}
+            for kind, prompt, payload, fut in batch:
+                if fut.set_running_or_notify_cancel():
+                    key = ((SCORE,) if kind == SCORE
+                           else (GENERATE,) + tuple(sorted(payload.items())))
+                    groups.setdefault(key, []).append((prompt, payload, fut))
+            for key, items in groups.items():
+                try:
+                    prompts = [p for p, _, _ in items]
+                    if key[0] == SCORE:
+                        with instrument.stage("llm_score"):
+                            results = score_options(self._load(), [(p, o) for p, o, _ in items])
+                        if instrument.enabled():
+                            options = [o for _, opts, _ in items for o in opts]
+                            self._count(prompts, options, "option")
+                    else:
+                        with instrument.stage("llm_batch"):
+                            outs = self._load()(prompts, batch_size=len(items), **dict(key[1:]))
+                        results = [(out[0] if isinstance(out, list) else out)["generated_text"]
+                                   for out in outs]
+                        if instrument.enabled():
+                            self._count(prompts, results)
+                    for (_, _, fut), res in zip(items, results):
+                        fut.set_result(res)
+                except Exception as e:  # fout naar alle wachtenden in deze groep
+                    instrument.inc("llm_errors", type=type(e).__name__)
+                    for _, _, fut in items:
+                        if not fut.done():
+                            fut.set_exception(e)
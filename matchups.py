@@ -0,0 +1,260 @@
+"""Deck-tegen-deck matchups over een hele meta.
+
+heuristics beoordeelt een deck los: heeft het anti-air, splash, een building?
+Hier wordt gekeken of die antwoorden passen bij wat de tegenstander brengt.
+Per dimensie in MATCHUP_RULES heeft een deck een dreiging T (wat het de
+tegenstander voorschotelt, verzadigd op `cap`) en een onbeantwoord deel U
+(1 - eigen antwoorden/`need`):
+
+  air      luchtaanvallers (luchtwincons dubbel)   vs anti_air
+  swarm    swarms en spawners                      vs splash / small spell
+  tank     zware grondwincons                      vs tank_killer
+  bridge   snelle grondwincons (Hog, Miner, ...)   vs building
+  siege    building-wincons (X-Bow, Mortar, Drill) vs medium/big spell
+  bait     spell-wincons (Goblin Barrel, Graveyard) vs small spell / splash
+
+  M[a, b] = 0.5 + sum_k w_k (T[a,k] U[b,k] - T[b,k] U[a,k]) / (2 sum_k w_k)
+
+M ligt in [0, 1], M[a, b] + M[b, a] = 1 en M[a, a] = 0.5. Omdat M bilineair
+is, is een blok van de matrix één matrixproduct van (n, 2K)-profielen. De
+volledige matrix wordt blok voor blok berekend (geheugen ~ block^2), alleen
+weggeschreven als daarom gevraagd wordt (np.memmap), en levert per deck de
+verwachte score tegen de meta (gewogen naar speelfrequentie), het aandeel van
+de meta waartegen het deck voorstaat en de slechtste matchup.
+
+Wie zelf iets over M wil aggregeren zonder de matrix op te slaan, gebruikt
+matchup_blocks(indices): een generator van (rij-start, kolom-start, blok) die
+M in blokken van `block` x `block` aflevert (float32).
+
+    python -m matchups runs/ladder.idx --top 20000 -o meta.csv
+    python -m matchups data/benchmark_decks.csv -o meta.csv --matrix matrix.npy
+"""
+import argparse
+import csv
+import sys
+from itertools import islice
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from card_db import CARD_DB
+from card_index import CARD_NAMES, N_CARDS
+from heuristics import evaluate_decks_batch, names_to_indices
+
+BLOCK = 4096
+TIE = 1e-4
+
+
+def _tags(c: Dict[str, Any]) -> set:
+    return set(c["tags"])
+
+
+def _is_wincon(c) -> bool:
+    return "wincon" in c["tags"]
+
+
+def _is_tank(c) -> bool:
+    t = _tags(c)
+    return ("wincon" in t and c["elixir"] >= 5 and not t & {"air_attacker", "building",
+                                                              "spell_like", "swarm"})
+
+
+def _is_bridge(c) -> bool:
+    t = _tags(c)
+    return "wincon" in t and not t & {"air_attacker", "building", "spell_like"} and not _is_tank(c)
+
+
+# (naam, dreiging per kaart, antwoord per kaart, cap, need, gewicht)
+MATCHUP_RULES: Tuple[Tuple[str, Callable, Callable, float, float, float], ...] = (
+    ("air", lambda c: ("air_attacker" in c["tags"]) * (1 + _is_wincon(c)),
+     lambda c: "anti_air" in c["tags"], 3, 2, 1.0),
+    ("swarm", lambda c: bool(_tags(c) & {"swarm", "spawner"}),
+     lambda c: bool(_tags(c) & {"splash", "small_spell"}), 2, 2, 1.0),
+    ("tank", _is_tank, lambda c: "tank_killer" in c["tags"], 1, 1, 1.0),
+    ("bridge", _is_bridge, lambda c: "building" in c["tags"], 1, 1, 1.0),
+    ("siege", lambda c: _is_wincon(c) and "building" in c["tags"],
+     lambda c: bool(_tags(c) & {"medium_spell", "big_spell"}), 1, 1, 0.75),
+    ("bait", lambda c: _is_wincon(c) and "spell_like" in c["tags"],
+     lambda c: bool(_tags(c) & {"small_spell", "splash"}), 1, 1, 0.75),
+)
+DIMENSIONS = tuple(r[0] for r in MATCHUP_RULES)
+
+
+def _card_matrix(col: int) -> np.ndarray:
+    """(N_CARDS + 1, K) per-kaartmatrix; de extra nulrij is voor lege slots (-1)."""
+    out = np.zeros((N_CARDS + 1, len(MATCHUP_RULES)))
+    for i, name in enumerate(CARD_NAMES):
+        for k, rule in enumerate(MATCHUP_RULES):
+            out[i, k] = float(rule[col](CARD_DB[name]))
+    return out
+
+
+THREAT = _card_matrix(1)
+ANSWER = _card_matrix(2)
+_CAP = np.array([r[3] for r in MATCHUP_RULES], dtype=np.float64)
+_NEED = np.array([r[4] for r in MATCHUP_RULES], dtype=np.float64)
+_W = np.array([r[5] for r in MATCHUP_RULES], dtype=np.float64)
+
+
+def deck_profiles(indices: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """(T, U) per deck: verzadigde dreiging en onbeantwoord deel, elk (n, K)."""
+    g = np.where(indices >= 0, indices, N_CARDS)
+    T = np.minimum(THREAT[g].sum(axis=1), _CAP) / _CAP
+    U = 1.0 - np.minimum(ANSWER[g].sum(axis=1), _NEED) / _NEED
+    return T, U
+
+
+def _factors(indices: np.ndarray, dtype=np.float32) -> Tuple[np.ndarray, np.ndarray]:
+    """X, Y met M = 0.5 + X @ Y.T: X = [wT, U] / 2W, Y = [U, -wT]."""
+    T, U = deck_profiles(indices)
+    wT = T * _W
+    X = np.hstack([wT, U]) / (2 * _W.sum())
+    Y = np.hstack([U, -wT])
+    return X.astype(dtype), Y.astype(dtype)
+
+
+def matchup_breakdown(deck_a: Sequence[str], deck_b: Sequence[str]) -> Dict[str, Any]:
+    """Matchup van A tegen B, met per dimensie de bijdrage (positief = voordeel A)."""
+    T, U = deck_profiles(names_to_indices([list(deck_a), list(deck_b)]))
+    contrib = _W * (T[0] * U[1] - T[1] * U[0]) / (2 * _W.sum())
+    return {"score": float(0.5 + contrib.sum()),
+            "dimensions": {d: float(v) for d, v in zip(DIMENSIONS, contrib) if v}}
+
+
+def _centred_blocks(X: np.ndarray, Y: np.ndarray,
+                    block: int) -> Iterator[Tuple[int, int, np.ndarray]]:
+    """Blokken van M - 0.5 in één hergebruikte buffer (geen verse block^2-allocaties)."""
+    n = len(X)
+    buf = np.empty((min(block, n), min(block, n)), dtype=X.dtype)
+    for i in range(0, n, block):
+        for j in range(0, n, block):
+            x, y = X[i:i + block], Y[j:j + block]
+            m = buf[:len(x), :len(y)]
+            np.matmul(x, y.T, out=m)
+            yield i, j, m
+
+
+def matchup_blocks(indices: np.ndarray,
+                   block: int = BLOCK) -> Iterator[Tuple[int, int, np.ndarray]]:
+    """Streaming-API: (rij-start, kolom-start, M-blok) voor de hele matrix, blok voor blok.
+
+    Elk blok is een nieuwe float32-array, dus mag bewaard worden; meta_report gebruikt
+    intern dezelfde blokken zonder de +0.5-kopie.
+    """
+    for i, j, m in _centred_blocks(*_factors(indices), block):
+        yield i, j, m + np.float32(0.5)
+
+
+def meta_report(indices: np.ndarray, weights: Optional[np.ndarray] = None, block: int = BLOCK,
+                matrix_path: Optional[str] = None) -> Dict[str, np.ndarray]:
+    """Per deck: verwachte score tegen de meta, aandeel van de meta dat het verslaat
+    (M > 0.5) en de slechtste matchup. Met matrix_path wordt M als .npy weggeschreven."""
+    n = len(indices)
+    p = np.ones(n) if weights is None else np.asarray(weights, dtype=np.float64)
+    pf = (p / p.sum()).astype(np.float32)
+    expected = np.zeros(n)
+    beats = np.zeros(n)
+    worst = np.full(n, np.inf, dtype=np.float32)
+    worst_idx = np.zeros(n, dtype=np.int64)
+    out = (np.lib.format.open_memmap(matrix_path, mode="w+", dtype=np.float32, shape=(n, n))
+           if matrix_path else None)
+    win = np.empty((min(block, n), min(block, n)), dtype=np.float32)
+    for i, j, m in _centred_blocks(*_factors(indices), block):
+        rows, cols = slice(i, i + m.shape[0]), slice(j, j + m.shape[1])
+        expected[rows] += m @ pf[cols]
+        w = win[:m.shape[0], :m.shape[1]]
+        # Gelijke profielen geven in float32 geen exacte 0; echte verschillen zijn >= ~0.01.
+        np.greater(m, TIE, out=w, casting="unsafe")
+        beats[rows] += w @ pf[cols]
+        arg = m.argmin(axis=1)
+        low = m[np.arange(len(m)), arg]
+        better = low < worst[rows]
+        worst[rows] = np.where(better, low, worst[rows])
+        worst_idx[rows] = np.where(better, arg + j, worst_idx[rows])
+        if out is not None:
+            np.add(m, np.float32(0.5), out=out[rows, cols])
+    if out is not None:
+        out.flush()
+    return {"expected": expected + 0.5, "beats": beats, "worst": worst + 0.5,
+            "worst_index": worst_idx}
+
+
+def expected_scores(indices: np.ndarray, weights: Optional[np.ndarray] = None) -> np.ndarray:
+    """Alleen de verwachte score: door de lineariteit is dat X @ (p @ Y), zonder matrix."""
+    X, Y = _factors(indices, np.float64)
+    p = np.ones(len(X)) if weights is None else np.asarray(weights, dtype=np.float64)
+    return 0.5 + X @ (p @ Y / p.sum())
+
+
+# ---------- meta inlezen ----------
+def load_meta(path: str, top: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray, List[str]]:
+    """(indices, gewichten, namen) uit een deck-index (gewicht = aantal keer gespeeld),
+    een .decks-corpus of een CSV/JSONL-decklijst (gewicht 1 per regel)."""
+    if Path(path).is_dir():
+        from deck_corpus import unpack_rows
+        from deck_index import DeckIndex
+        index = DeckIndex.open(path)
+        if not index.segments:
+            return np.empty((0, 8), dtype=np.int16), np.empty(0), []
+        keys, inv = np.unique(np.concatenate([s.key for s in index.segments]),
+                              return_inverse=True)
+        counts = np.bincount(inv, weights=np.concatenate([s.count for s in index.segments]))
+        order = np.argsort(-counts, kind="stable")[:top]
+        idx = unpack_rows(keys[order].view(np.uint8).reshape(-1, 8))
+        return idx, counts[order], [f"#{r + 1}" for r in range(len(idx))]
+    if path.endswith(".decks"):
+        from deck_corpus import load_corpus
+        corpus = load_corpus(path, remap=True)
+        n = len(corpus) if top is None else min(top, len(corpus))
+        return corpus.indices(0, n), np.ones(n), corpus.names(0, n)
+    from score_decks import read_decks
+    fmt = "jsonl" if path.endswith((".jsonl", ".json")) else "csv"
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        decks = list(islice(read_decks(f, fmt), top))
+    return names_to_indices([c for _, c in decks]), np.ones(len(decks)), [n for n, _ in decks]
+
+
+def write_report(f, names: Sequence[str], indices: np.ndarray, weights: np.ndarray,
+                 report: Dict[str, np.ndarray]) -> None:
+    overall = evaluate_decks_batch(indices)["overall"]
+    share = weights / weights.sum()
+    w = csv.writer(f, lineterminator="\n")
+    w.writerow(["Deck", "Cards", "MetaShare", "Expected", "Beats", "Overall", "WorstScore",
+                "WorstOpponent"])
+    for i in np.argsort(-report["expected"], kind="stable"):
+        cards = ";".join(CARD_NAMES[c] for c in indices[i] if c >= 0)
+        w.writerow([names[i], cards, "%.6g" % share[i], "%.4f" % report["expected"][i],
+                    "%.4f" % report["beats"][i], "%.3f" % overall[i],
+                    "%.3f" % report["worst"][i], names[report["worst_index"][i]]])
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    p = argparse.ArgumentParser(description="Matchupmatrix en verwachte score tegen de meta.")
+    p.add_argument("meta", help="deck-index (map), .decks-corpus of CSV/JSONL-decklijst")
+    p.add_argument("-o", "--output", default="-", help="CSV per deck; '-' = stdout")
+    p.add_argument("--top", type=int, default=None, help="alleen de N meest gespeelde decks")
+    p.add_argument("--matrix", help="volledige matrix als .npy (float32, n*n*4 bytes)")
+    p.add_argument("--block", type=int, default=BLOCK, help="blokgrootte (geheugen ~ block^2)")
+    args = p.parse_args(argv)
+
+    try:
+        indices, weights, names = load_meta(args.meta, args.top)
+        if not len(indices):
+            raise ValueError(f"{args.meta} bevat geen decks.")
+        report = meta_report(indices, weights, args.block, args.matrix)
+        if args.output == "-":
+            write_report(sys.stdout, names, indices, weights, report)
+        else:
+            with open(args.output, "w", encoding="utf-8", newline="") as f:
+                write_report(f, names, indices, weights, report)
+    except (OSError, KeyError, ValueError) as e:
+        print(f"Fout: {e}", file=sys.stderr)
+        return 2
+    print(f"{len(indices)} decks; beste verwachte score {report['expected'].max():.3f}",
+          file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,347 @@
+"""Reproduceerbare benchmarks en regressiecontrole voor scoring en advies.
+
+Meet single-deck latency, batch-throughput en piekgeheugen van de scoring-
+engines, de adviesfuncties en (met een klein lokaal T5-model als stand-in)
+de LLM-adviesketen. Controleert daarnaast op willekeurige decks dat elke
+snellere engine exact dezelfde metrics geeft als evaluate_deck.
+
+Uitvoer is JSON: {"meta": {...}, "results": {naam: {"value", "unit", "better"}},
+"check": {...}}. Met --baseline wordt elke meting vergeleken met een eerdere
+run; de exitcode is 1 bij een regressie groter dan --threshold of bij een
+afwijking van de referentie.
+
+    python -m perf_bench -o bench.json
+    python -m perf_bench --baseline bench.json --threshold 0.15
+    python -m perf_bench --quick --skip-llm
+"""
+import argparse
+import json
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from card_index import CARD_ID, CARD_NAMES, DB_VERSION, N_CARDS
+from heuristics import (evaluate_deck, evaluate_deck_fast, evaluate_decks_batch,
+                        evaluate_ids, names_to_indices, normalize_deck, suggest_improvements)
+from recommender import rule_based_candidates
+from score_table import load_score_table
+from swap_eval import DeckCounter, rank_swaps
+
+DEFAULT_SIZES = (1_000, 100_000, 1_000_000)
+QUICK_SIZES = (1_000, 100_000)
+
+Results = Dict[str, Dict[str, Any]]
+
+
+def random_decks(n: int, seed: int = 0) -> np.ndarray:
+    """(n, 8) int16-matrix met unieke kaart-ID's per rij (zelfde sampler als deck_space)."""
+    rng = np.random.default_rng(seed)
+    out = np.empty((n, 8), dtype=np.int16)
+    for s in range(0, n, 100_000):
+        m = min(100_000, n - s)
+        out[s:s + m] = rng.random((m, N_CARDS)).argpartition(8, axis=1)[:, :8]
+    return out
+
+
+def _names(row) -> List[str]:
+    return [CARD_NAMES[i] for i in row if i >= 0]
+
+
+def _put(results: Results, name: str, value: float, unit: str, better: str = "lower") -> None:
+    results[name] = {"value": value, "unit": unit, "better": better}
+
+
+# ---------- metingen ----------
+def bench_latency(results: Results, decks: List[List[str]], calls: int) -> None:
+    """Mediaan en p99 per aanroep, in microseconden."""
+    table = load_score_table()
+    parsed = []
+    for names in decks:
+        deck = normalize_deck(names)
+        r = evaluate_deck(names)
+        parsed.append((deck, r["metrics"], r["avg_elixir"]))
+    id_decks = [[CARD_ID[n] for n in names] for names in decks]
+    cases: Dict[str, Callable[[int], Any]] = {
+        "normalize_deck": lambda k: normalize_deck(decks[k]),
+        "evaluate_deck": lambda k: evaluate_deck(decks[k]),
+        "evaluate_deck_fast": lambda k: evaluate_deck_fast(decks[k]),
+        "evaluate_ids": lambda k: evaluate_ids(id_decks[k]),
+        "score_table.lookup_ids": lambda k: table.lookup_ids(id_decks[k]),
+        "suggest_improvements": lambda k: suggest_improvements(*parsed[k]),
+        "rule_based_candidates": lambda k: rule_based_candidates(decks[k], avg_now=parsed[k][2]),
+        "rank_swaps": lambda k: rank_swaps(decks[k], top=3),
+    }
+    for name, fn in cases.items():
+        for k in range(min(50, calls)):  # opwarmen
+            fn(k % len(decks))
+        samples = np.empty(calls)
+        for k in range(calls):
+            t0 = time.perf_counter_ns()
+            fn(k % len(decks))
+            samples[k] = time.perf_counter_ns() - t0
+        _put(results, f"latency.{name}.p50", float(np.median(samples)) / 1e3, "us")
+        _put(results, f"latency.{name}.p99", float(np.percentile(samples, 99)) / 1e3, "us")
+
+
+def _best_of(fn: Callable[[], Any], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def _peak_bytes(fn: Callable[[], Any]) -> int:
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def bench_throughput(results: Results, sizes: Sequence[int], reference_max: int, repeat: int,
+                     seed: int) -> None:
+    """Decks per seconde per engine en grootte; piekgeheugen (tracemalloc) voor de vectorengines."""
+    table = load_score_table()
+    for n in sizes:
+        idx = random_decks(n, seed)
+        vector = {"batch": lambda: evaluate_decks_batch(idx),
+                  "score_table": lambda: table.lookup_batch(idx)}
+        for engine, fn in vector.items():
+            _put(results, f"throughput.{engine}.{n}", n / _best_of(fn, repeat), "decks/s", "higher")
+            _put(results, f"memory.{engine}.{n}", _peak_bytes(fn) / 2**20, "MiB")
+        if n <= reference_max:
+            names = [_names(row) for row in idx.tolist()]
+            ids = idx.tolist()
+            scalar = {"reference": lambda: [evaluate_deck(d) for d in names],
+                      "fast": lambda: [evaluate_deck_fast(d) for d in names],
+                      "ids": lambda: [evaluate_ids(d) for d in ids]}
+            for engine, fn in scalar.items():
+                _put(results, f"throughput.{engine}.{n}", n / _best_of(fn, 1), "decks/s", "higher")
+
+
+def tiny_t5_pipeline(model: str):
+    """Klein, willekeurig geïnitialiseerd T5-model met byte-tokenizer: geen downloads nodig.
+
+    De uitvoer is onzin, maar de generatie doorloopt dezelfde code (tokenizer, beam search,
+    pipeline-batching) als flan-t5, zodat regressies in de keten zichtbaar worden.
+    """
+    import torch
+    from transformers import ByT5Tokenizer, T5Config, T5ForConditionalGeneration, pipeline
+    torch.manual_seed(0)
+    config = T5Config(vocab_size=384, d_model=64, d_ff=128, d_kv=16, num_layers=2,
+                      num_decoder_layers=2, num_heads=4, decoder_start_token_id=0,
+                      pad_token_id=0, eos_token_id=1)
+    return pipeline("text2text-generation", model=T5ForConditionalGeneration(config).eval(),
+                    tokenizer=ByT5Tokenizer(), device=-1)
+
+
+def bench_llm(results: Results, decks: List[List[str]], repeat: int) -> Optional[str]:
+    """LLM-adviesketen met tiny_t5_pipeline; geeft een reden terug als het niet kan draaien."""
+    try:
+        import transformers  # noqa: F401
+    except ImportError as e:
+        return f"overgeslagen: {e}"
+    from advice_cache import AdviceCache
+    from llm_advice import (GEN_KWARGS, AdviceOrchestrator, build_prompt, build_score_prompt,
+                            option_texts)
+    from llm_service import InferenceService
+
+    prompts = [build_prompt(d, rule_based_candidates(d)) for d in decks[:8]]
+    service = InferenceService("tiny-t5", pipeline_factory=tiny_t5_pipeline)
+    try:
+        t0 = time.perf_counter()
+        service.warm_up()
+        service.generate(prompts[0], timeout=600, **GEN_KWARGS)
+        _put(results, "llm.load_and_first", time.perf_counter() - t0, "s")
+        _put(results, "llm.generate_single",
+             _best_of(lambda: service.generate(prompts[0], timeout=600, **GEN_KWARGS), repeat), "s")
+
+        def burst():
+            futs = [service.submit(p, **GEN_KWARGS) for p in prompts]
+            for f in futs:
+                f.result(timeout=600)
+        _put(results, "llm.batch8_prompts_per_s", len(prompts) / _best_of(burst, repeat),
+             "prompts/s", "higher")
+
+        options = [(build_score_prompt(d, c), option_texts(c))
+                   for d, c in ((d, rule_based_candidates(d)) for d in decks[:8])]
+        _put(results, "llm.score_single",
+             _best_of(lambda: service.score(*options[0]).result(timeout=600), repeat), "s")
+
+        def score_burst():
+            futs = [service.score(p, o) for p, o in options]
+            for f in futs:
+                f.result(timeout=600)
+        _put(results, "llm.score_batch8_prompts_per_s", len(options) / _best_of(score_burst, repeat),
+             "prompts/s", "higher")
+
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = AdviceCache(Path(tmp) / "advice.sqlite")
+            orch = AdviceOrchestrator(service, cache)
+            deck = decks[0]
+            cands = rule_based_candidates(deck)
+            t0 = time.perf_counter()
+            orch.advise(deck, cands, deadline_s=600)
+            _put(results, "llm.advise_miss", time.perf_counter() - t0, "s")
+            _put(results, "llm.advise_hit",
+                 _best_of(lambda: orch.advise(deck, cands, deadline_s=600), repeat) * 1e3, "ms")
+            cache.close()
+    finally:
+        service.close()
+    return None
+
+
+# ---------- correctheid ----------
+def cross_check(n: int, seed: int) -> Dict[str, Any]:
+    """Vergelijkt alle engines met evaluate_deck op willekeurige (ook onvolledige) decks.
+
+    De decks bevatten ook onbekende namen, dubbele kaarten en meer dan 8 kaarten,
+    zodat normalize_deck-randgevallen meegetest worden. Per deck wordt ook één
+    willekeurige DeckCounter.swap_metrics vergeleken met evaluate_ids.
+    """
+    rng = random.Random(seed)
+    pool = list(CARD_NAMES) + ["Onbekende Kaart"]
+    decks = []
+    for _ in range(n):
+        if rng.random() < 0.7:
+            decks.append(rng.sample(CARD_NAMES, 8))
+        else:
+            decks.append([rng.choice(pool) for _ in range(rng.randint(0, 10))])
+    table = load_score_table()
+    idx = names_to_indices(decks)
+    batch = evaluate_decks_batch(idx)
+    looked_up = table.lookup_batch(idx)
+    fields = batch.dtype.names
+    mismatches: Dict[str, int] = {}
+    examples: List[Dict[str, Any]] = []
+
+    def record(engine, deck, got, want):
+        mismatches[engine] = mismatches.get(engine, 0) + 1
+        if len(examples) < 5:
+            examples.append({"engine": engine, "deck": deck, "got": got, "want": want})
+
+    for r, deck in enumerate(decks):
+        ref = evaluate_deck(deck)
+        want = {"avg_elixir": ref["avg_elixir"], **ref["metrics"]}
+        fast = evaluate_deck_fast(deck)
+        candidates = {
+            "fast": {"avg_elixir": fast["avg_elixir"], **fast["metrics"]},
+            "batch": dict(zip(fields, batch[r].tolist())),
+            "score_table.batch": dict(zip(fields, looked_up[r].tolist())),
+        }
+        ids = idx[r][idx[r] >= 0].tolist()
+        lk = table.lookup_ids(ids)
+        candidates["score_table.ids"] = {"avg_elixir": lk["avg_elixir"], **lk["metrics"]}
+        if ids:
+            counter = DeckCounter(ids)
+            candidates["deck_counter"] = {"avg_elixir": counter.avg_elixir(), **counter.metrics()}
+        for engine, got in candidates.items():
+            if got != want:
+                record(engine, deck, got, want)
+        if ids:
+            # Incrementele swap (rank_swaps) tegen een volledige evaluatie van het nieuwe deck.
+            pos = rng.randrange(len(ids))
+            card = rng.choice([c for c in range(len(CARD_NAMES)) if c not in ids])
+            swapped = ids[:pos] + [card] + ids[pos + 1:]
+            got, want = counter.swap_metrics(pos, card), evaluate_ids(swapped)["metrics"]
+            if got != want:
+                record("deck_counter.swap", [CARD_NAMES[i] for i in swapped], got, want)
+    return {"decks": n, "mismatches": mismatches, "examples": examples}
+
+
+# ---------- baseline ----------
+def compare(results: Results, baseline: Results, threshold: float) -> List[str]:
+    """Metingen die meer dan `threshold` (fractie) slechter zijn dan de baseline."""
+    regressions = []
+    for name, cur in sorted(results.items()):
+        base = baseline.get(name)
+        if not base or base.get("unit") != cur["unit"] or not base["value"]:
+            continue
+        ratio = cur["value"] / base["value"]
+        worse = ratio - 1 if cur["better"] == "lower" else 1 - ratio
+        if worse > threshold:
+            regressions.append(f"{name}: {base['value']:.4g} -> {cur['value']:.4g} {cur['unit']} "
+                               f"({worse:+.0%} slechter)")
+    return regressions
+
+
+def _meta(args: argparse.Namespace) -> Dict[str, Any]:
+    return {"created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(), "numpy": np.__version__,
+            "platform": platform.platform(), "machine": platform.machine(),
+            "db_version": DB_VERSION, "seed": args.seed, "sizes": args.sizes}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    p = argparse.ArgumentParser(description="Benchmarks en regressiecontrole voor scoring en advies.")
+    p.add_argument("-o", "--output", default="-", help="JSON-bestand, of - voor stdout (default)")
+    p.add_argument("--baseline", help="eerdere JSON-uitvoer om mee te vergelijken")
+    p.add_argument("--threshold", type=float, default=0.15,
+                   help="toegestane verslechtering als fractie (default 0.15)")
+    p.add_argument("--sizes", type=lambda s: [int(x) for x in s.split(",")],
+                   help="batchgroottes, bv. 1000,100000,1000000")
+    p.add_argument("--reference-max", type=int, default=100_000,
+                   help="grootste batch voor de niet-gevectoriseerde engines")
+    p.add_argument("--calls", type=int, default=2000, help="aanroepen per latency-meting")
+    p.add_argument("--repeat", type=int, default=3, help="herhalingen per throughput-meting (beste telt)")
+    p.add_argument("--check-decks", type=int, default=20_000)
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--quick", action="store_true", help="kleinere groottes en minder herhalingen")
+    p.add_argument("--skip-llm", action="store_true")
+    args = p.parse_args(argv)
+    if args.quick:
+        args.sizes = args.sizes or list(QUICK_SIZES)
+        args.calls, args.repeat = min(args.calls, 300), 1
+        args.check_decks = min(args.check_decks, 5_000)
+    args.sizes = args.sizes or list(DEFAULT_SIZES)
+
+    baseline = None
+    if args.baseline:
+        try:
+            baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))["results"]
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Fout: baseline niet leesbaar: {e}", file=sys.stderr)
+            return 2
+
+    rng = random.Random(args.seed)
+    decks = [rng.sample(CARD_NAMES, 8) for _ in range(256)]
+    results: Results = {}
+    bench_latency(results, decks, args.calls)
+    bench_throughput(results, args.sizes, args.reference_max, args.repeat, args.seed)
+    llm_note = "overgeslagen: --skip-llm" if args.skip_llm else bench_llm(results, decks, args.repeat)
+    check = cross_check(args.check_decks, args.seed)
+
+    report = {"meta": _meta(args), "results": results, "check": check}
+    if llm_note:
+        report["meta"]["llm"] = llm_note
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output == "-":
+        print(text)
+    else:
+        Path(args.output).write_text(text + "\n", encoding="utf-8")
+
+    failed = False
+    if check["mismatches"]:
+        print(f"Afwijkingen van evaluate_deck: {check['mismatches']}", file=sys.stderr)
+        failed = True
+    if baseline is not None:
+        regressions = compare(results, baseline, args.threshold)
+        for line in regressions:
+            print(f"Regressie: {line}", file=sys.stderr)
+        failed = failed or bool(regressions)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,233 @@
+"""Regelgebaseerde vervangadviezen ("VERVANG: uit -> in — reden").
+
+Kijkt welke kernrollen een deck mist (building, tank killer, wincon, support,
+spells, anti-air) en stelt per gat één vervanging voor. Alle indexen worden
+één keer bij import opgebouwd uit card_index, zodat een aanvraag alleen nog
+bitmaskers combineert en per kaart een vooraf berekende rang opzoekt.
+CARDS_BY_TAG, CARDS_BY_ROLE, BUILDINGS, WINCONS en GAP_OPTIONS (voorkeursvolgorde
+per gat) zijn bedoeld voor UI, batchjobs en de API.
+Gebruikt door de Streamlit-app, maar zonder Streamlit-afhankelijkheid.
+"""
+from typing import Dict, FrozenSet, Iterable, List, Optional, Sequence, Tuple
+
+from card_db import CARD_DB
+from card_index import CARD_ID, CARD_NAMES, ELIXIR, ROLE_BIT, TAG_MASK, ROLE_MASK, TAGS, tag_bit
+from instrument import timed
+
+Candidate = Tuple[str, str, str]  # (uit, in, reden)
+
+# Kaarten die nooit als "uit" worden voorgesteld.
+UNTOUCHABLES: FrozenSet[str] = frozenset(
+    {"Fireball", "Poison", "Rocket", "Lightning", "Inferno Tower", "Zap", "The Log"})
+# Goedkope cycle-kaarten: alleen "uit" als er niets anders over is.
+_CHEAP_CYCLE = frozenset({"Skeletons", "Ice Spirit", "Fire Spirit", "Electro Spirit"})
+
+# Vaste voorkeurslijsten per gat, in volgorde van voorkeur.
+WINCONS_FAST = ("Hog Rider", "Miner", "Goblin Barrel", "Mortar")
+WINCONS_HEAVY = ("Royal Giant", "Balloon", "Graveyard", "Goblin Drill", "Battle Ram")
+SUPPORTS = ("Musketeer", "Firecracker", "Valkyrie", "Electro Wizard", "Baby Dragon")
+SMALL_SPELLS = ("Zap", "The Log", "Giant Snowball", "Arrows", "Barbarian Barrel", "Royal Delivery")
+BIG_SPELLS = ("Fireball", "Poison", "Rocket", "Lightning", "Earthquake")
+ANTI_AIRS = ("Musketeer", "Firecracker", "Dart Goblin", "Electro Wizard", "Mega Minion",
+             "Flying Machine")
+BUILDINGS_PREF = ("Bomb Tower", "Tesla", "Cannon")
+
+# ---------- indexen ----------
+_B_BUILDING = tag_bit("building")
+_B_WINCON = tag_bit("wincon")
+_B_TANK_KILLER = tag_bit("tank_killer")
+_B_SMALL_SPELL = tag_bit("small_spell")
+_B_BIG_OR_MEDIUM = tag_bit("medium_spell") | tag_bit("big_spell")
+_B_ANTI_AIR = tag_bit("anti_air")
+_R_SUPPORT = ROLE_BIT.get("support", 0)
+
+CARDS_BY_TAG: Dict[str, Tuple[str, ...]] = {
+    t: tuple(sorted((n for i, n in enumerate(CARD_NAMES) if TAG_MASK[i] & tag_bit(t)),
+                    key=lambda n: (CARD_DB[n]["elixir"], n)))
+    for t in TAGS
+}
+CARDS_BY_ROLE: Dict[str, Tuple[str, ...]] = {
+    r: tuple(n for i, n in enumerate(CARD_NAMES) if ROLE_MASK[i] & b) for r, b in ROLE_BIT.items()
+}
+BUILDINGS: FrozenSet[str] = frozenset(CARDS_BY_TAG.get("building", ()))
+WINCONS: FrozenSet[str] = frozenset(CARDS_BY_TAG.get("wincon", ()))
+
+# Voorkeursvolgorde per gat als (naam, bit van het kaart-ID); best_* nemen de eerste kaart
+# waarvan het bit niet in het deckmasker staat.
+_CARD_BIT: Dict[str, int] = {n: 1 << i for i, n in enumerate(CARD_NAMES)}
+GAP_OPTIONS: Dict[str, Tuple[Tuple[str, int], ...]] = {
+    gap: tuple((n, _CARD_BIT[n]) for n in names)
+    for gap, names in (("wincon_fast", WINCONS_FAST), ("wincon_heavy", WINCONS_HEAVY),
+                       ("support", SUPPORTS), ("small_spell", SMALL_SPELLS),
+                       ("big_spell", BIG_SPELLS), ("anti_air", ANTI_AIRS),
+                       ("building", BUILDINGS_PREF))
+}
+
+
+def _dense_rank(key) -> List[int]:
+    """Rang per kaart-ID volgens `key`; gelijke sleutels krijgen dezelfde rang."""
+    keys = sorted({key(i) for i in range(len(CARD_NAMES))})
+    pos = {k: r for r, k in enumerate(keys)}
+    return [pos[key(i)] for i in range(len(CARD_NAMES))]
+
+
+# Volgorde waarin pick_out_card kaarten opoffert: duur eerst (buildings als laatste),
+# of goedkoop eerst (cycle-kaarten als laatste). Gelijke rang -> volgorde in het deck.
+_RANK_HEAVY = _dense_rank(lambda i: (-ELIXIR[i], bool(TAG_MASK[i] & _B_BUILDING)))
+_RANK_LIGHT = _dense_rank(lambda i: (ELIXIR[i], bool(TAG_MASK[i] & tag_bit("cycle"))))
+_PROTECTED = [bool(TAG_MASK[i] & _B_WINCON) or n in UNTOUCHABLES for i, n in enumerate(CARD_NAMES)]
+_CHEAP = [n in _CHEAP_CYCLE for n in CARD_NAMES]
+# Eén sorteersleutel per kaart voor pick_out_card: beschermd, dan cycle-kaart, dan rang.
+# Zonder het beschermd-deel (sleutel % _PROTECTED_STEP) voor als alles verboden is.
+_CHEAP_STEP = len(CARD_NAMES)
+_PROTECTED_STEP = 2 * _CHEAP_STEP
+_OUT_KEY_HEAVY, _OUT_KEY_LIGHT = (
+    [_PROTECTED[i] * _PROTECTED_STEP + _CHEAP[i] * _CHEAP_STEP + rank[i]
+     for i in range(len(CARD_NAMES))] for rank in (_RANK_HEAVY, _RANK_LIGHT))
+
+
+def _ids(names: Iterable[str]) -> List[int]:
+    return [CARD_ID[n] for n in names]
+
+
+def _tag_union(ids: Iterable[int]) -> int:
+    m = 0
+    for i in ids:
+        m |= TAG_MASK[i]
+    return m
+
+
+def avg_elixir_of(names: Sequence[str]) -> float:
+    return round(sum(CARD_DB[n]["elixir"] for n in names) / len(names), 2) if names else 0.0
+
+
+def missing_core(names: Sequence[str]) -> Dict[str, bool]:
+    ids = _ids(names)
+    tags = _tag_union(ids)
+    return {
+        "building": not tags & _B_BUILDING,
+        "tank_killer": not tags & _B_TANK_KILLER,
+        "wincon": not tags & _B_WINCON,
+        "support": sum(1 for i in ids if ROLE_MASK[i] & _R_SUPPORT) < 2,
+        "small_spell": not tags & _B_SMALL_SPELL,
+        "big_spell": not tags & _B_BIG_OR_MEDIUM,
+        "anti_air": not tags & _B_ANTI_AIR,
+    }
+
+
+def _first_missing(gap: str, names: Iterable[str]) -> Optional[str]:
+    present = 0
+    for n in names:
+        present |= _CARD_BIT.get(n, 0)
+    return next((n for n, bit in GAP_OPTIONS[gap] if not present & bit), None)
+
+
+def best_wincon(names: Sequence[str], avg_val: float) -> Optional[str]:
+    return _first_missing("wincon_fast" if avg_val <= 3.3 else "wincon_heavy", names)
+
+
+def best_support(names: Sequence[str]) -> Optional[str]:
+    return _first_missing("support", names)
+
+
+def best_small_spell(names: Sequence[str]) -> Optional[str]:
+    return _first_missing("small_spell", names)
+
+
+def best_big_spell(names: Sequence[str]) -> Optional[str]:
+    return _first_missing("big_spell", names)
+
+
+def best_anti_air(names: Sequence[str]) -> Optional[str]:
+    return _first_missing("anti_air", names)
+
+
+def pick_out_card(deck_names: Sequence[str], prefer_heavy: bool = False,
+                  forbid: Iterable[str] = ()) -> str:
+    """Kies een kaart om te vervangen, zonder wincons/untouchables.
+       'forbid' = kaarten die we NIET als out mogen kiezen (bv. al gebruikt)."""
+    forbid = set(forbid)
+    key = _OUT_KEY_HEAVY if prefer_heavy else _OUT_KEY_LIGHT
+    best = min(((key[CARD_ID[n]], p) for p, n in enumerate(deck_names) if n not in forbid),
+               default=None)
+    if best is None:  # alles verboden: dan telt beschermd niet meer mee
+        best = min((key[CARD_ID[n]] % _PROTECTED_STEP, p) for p, n in enumerate(deck_names))
+    return deck_names[best[1]]
+
+
+@timed("candidates")
+def rule_based_candidates(deck_names: Sequence[str],
+                          avg_now: Optional[float] = None) -> List[Candidate]:
+    """
+    Bepaalt welke kaarten vervangen moeten worden op basis van missende rollen.
+    Als alle kernvereisten oké zijn -> geen vervang-adviezen.
+    Elke kaart komt hooguit één keer voor als 'uit' en als 'in'.
+    """
+    proposals: List[Candidate] = []
+    used_out = set()
+    used_in = set()
+
+    gaps = missing_core(deck_names)
+    if avg_now is None:
+        avg_now = avg_elixir_of(deck_names)
+    n_buildings = sum(1 for n in deck_names if n in BUILDINGS)
+
+    def safe_append(out_name, in_name, reason):
+        if not out_name or not in_name or out_name == in_name:
+            return False
+        if out_name not in deck_names or out_name in UNTOUCHABLES:
+            return False
+        # Laatste building niet wegruilen voor iets dat geen building is.
+        if out_name in BUILDINGS and in_name not in BUILDINGS and n_buildings == 1:
+            return False
+        if out_name in used_out or in_name in used_in:
+            return False
+        proposals.append((out_name, in_name, reason))
+        used_out.add(out_name)
+        used_in.add(in_name)
+        return True
+
+    def fresh(card):
+        return card and card not in deck_names and card not in used_in
+
+    if gaps["tank_killer"]:
+        out_n = pick_out_card(deck_names, prefer_heavy=True, forbid=used_out)
+        safe_append(out_n, "Inferno Tower", "counter tanks (tank killer + building)")
+
+    if gaps["wincon"]:
+        wc = best_wincon(deck_names, avg_now)
+        if fresh(wc):
+            out_n = pick_out_card(deck_names, prefer_heavy=(avg_now > 4.0), forbid=used_out)
+            safe_append(out_n, wc, "duidelijke win condition")
+
+    if gaps["support"]:
+        sup = best_support(deck_names)
+        if fresh(sup):
+            out_n = pick_out_card(deck_names, prefer_heavy=False, forbid=used_out)
+            safe_append(out_n, sup, "ondersteuning/anti-air/splash")
+
+    if gaps["building"]:
+        for b, _ in GAP_OPTIONS["building"]:
+            if fresh(b):
+                out_n = pick_out_card(deck_names, prefer_heavy=True, forbid=used_out)
+                if safe_append(out_n, b, "defensieve building"):
+                    break
+
+    if gaps["small_spell"]:
+        ss = best_small_spell(deck_names)
+        if fresh(ss):
+            out_n = pick_out_card(deck_names, prefer_heavy=False, forbid=used_out)
+            safe_append(out_n, ss, "altijd 1 kleine spell nodig")
+    if gaps["big_spell"]:
+        bs = best_big_spell(deck_names)
+        if fresh(bs):
+            out_n = pick_out_card(deck_names, prefer_heavy=True, forbid=used_out)
+            safe_append(out_n, bs, "minstens 1 medium/big spell nodig")
+
+    if gaps["anti_air"]:
+        aa = best_anti_air(deck_names)
+        if fresh(aa):
+            out_n = pick_out_card(deck_names, prefer_heavy=False, forbid=used_out)
+            safe_append(out_n, aa, "anti-air ontbreekt")
+
+    return proposals
@@ -0,0 +1,256 @@
+"""Headless batch-scoring van deckbestanden.
+
+Leest decks stroomsgewijs uit CSV, JSONL of stdin, scoort ze per chunk en
+schrijft direct weg als CSV, JSONL of Parquet in de kolomindeling van
+data/benchmarks.csv. Het geheugengebruik hangt alleen af van --chunk-size.
+
+Invoer:
+  CSV   kolom "Deck" (optioneel) plus "Cards" ("A;B;...") of Card1..Card8
+  JSONL {"name": "...", "cards": ["...", ...]} per regel
+
+Voorbeelden:
+    python -m score_decks data/benchmark_decks.csv -o data/benchmarks.csv
+    zcat ladder.jsonl.gz | python -m score_decks - --in-format jsonl -o scores.parquet
+"""
+import argparse
+import csv
+import io
+import json
+import sys
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from heuristics import evaluate_deck, evaluate_deck_fast, evaluate_decks_batch, names_to_indices
+
+COLUMNS = ["Deck", "AvgElixir", "Overall", "Balance", "Coverage", "Spells", "Wincon", "Synergy"]
+_METRIC_COLUMNS = [("Overall", "overall"), ("Balance", "balance"), ("Coverage", "coverage"),
+                   ("Spells", "spells"), ("Wincon", "wincon"), ("Synergy", "synergy")]
+FORMATS = ("csv", "jsonl", "parquet")
+ENGINES = ("batch", "fast", "reference", "pairs", "table")
+MAX_WARNINGS = 20  # daarna worden onleesbare regels alleen nog geteld
+
+Deck = Tuple[str, List[str]]
+
+
+def _format_of(path: str, explicit: Optional[str]) -> str:
+    if explicit:
+        return explicit
+    for fmt in FORMATS:
+        if path.endswith("." + fmt) or path.endswith(".json") and fmt == "jsonl":
+            return fmt
+    return "csv"
+
+
+# ---------- lezen ----------
+def _skip(counts: Dict[str, int], line_no: int, reason: str) -> None:
+    """Telt een onleesbare invoerregel (counts["bad_lines"]) en meldt hem op stderr."""
+    counts["bad_lines"] = counts.get("bad_lines", 0) + 1
+    if counts["bad_lines"] <= MAX_WARNINGS:
+        print(f"Waarschuwing: regel {line_no} overgeslagen: {reason}", file=sys.stderr)
+    if counts["bad_lines"] == MAX_WARNINGS:
+        print("Waarschuwing: verdere onleesbare regels worden alleen geteld.", file=sys.stderr)
+
+
+def read_csv(f: Iterable[str], counts: Optional[Dict[str, int]] = None) -> Iterator[Deck]:
+    """Decks uit een CSV; onleesbare of te korte/lange rijen worden overgeslagen en geteld."""
+    counts = {} if counts is None else counts
+    reader = csv.DictReader(f)
+    fields = reader.fieldnames or []
+    lower = {c.lower(): c for c in fields}
+    name_col = lower.get("deck") or lower.get("name")
+    cards_col = lower.get("cards")
+    card_cols = [c for c in fields if c.lower().startswith("card") and c != cards_col]
+    if not cards_col and not card_cols:
+        raise ValueError("CSV mist een 'Cards'-kolom of Card1..Card8-kolommen.")
+    rows = iter(reader)
+    i = 0
+    while True:
+        try:
+            row = next(rows)
+        except StopIteration:
+            return
+        except csv.Error as e:
+            _skip(counts, reader.line_num + 1, str(e))  # line_num telt de foute regel niet mee
+            continue
+        i += 1
+        # Te veel velden komen onder de sleutel None, te weinig als None-waarden.
+        if None in row or (cards_col and row[cards_col] is None):
+            _skip(counts, reader.line_num, f"{len(fields)} kolommen verwacht")
+            continue
+        if cards_col:
+            cards = [c.strip() for c in (row[cards_col] or "").split(";") if c.strip()]
+        else:
+            cards = [row[c].strip() for c in card_cols if row.get(c)]
+        yield (row[name_col] if name_col else str(i)), cards
+
+
+def read_jsonl(f: Iterable[str], counts: Optional[Dict[str, int]] = None) -> Iterator[Deck]:
+    """Decks uit JSONL; onleesbare regels worden overgeslagen en geteld."""
+    counts = {} if counts is None else counts
+    for i, line in enumerate(f, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            obj = json.loads(line)
+        except json.JSONDecodeError as e:
+            _skip(counts, i, f"geen JSON ({e})")
+            continue
+        cards = (obj.get("cards") or obj.get("deck") or []) if isinstance(obj, dict) else None
+        if not isinstance(cards, list) or not all(isinstance(c, str) for c in cards):
+            _skip(counts, i, "verwacht een object met een lijst kaartnamen in 'cards'")
+            continue
+        yield str(obj.get("name", i)), cards
+
+
+def read_decks(f: Iterable[str], fmt: str,
+               counts: Optional[Dict[str, int]] = None) -> Iterator[Deck]:
+    if fmt == "csv":
+        return read_csv(f, counts)
+    if fmt == "jsonl":
+        return read_jsonl(f, counts)
+    raise ValueError(f"Invoerformaat niet ondersteund: {fmt}")
+
+
+# ---------- scoren ----------
+def score_chunk(decks: List[Deck], engine: str = "batch") -> List[tuple]:
+    """Scoort een chunk decks tot rijen in COLUMNS-volgorde (onafgerond)."""
+    if engine in ("batch", "pairs", "table"):
+        idx = names_to_indices([cards for _, cards in decks])
+        if engine == "pairs":
+            # Paar-synergy uit synergy_matrix i.p.v. synergy_score (zelfde kolommen).
+            from synergy_matrix import evaluate_decks_pairs
+            res = evaluate_decks_pairs(idx)
+        elif engine == "table":
+            from score_table import shared_table
+            res = shared_table().lookup_batch(idx)
+        else:
+            res = evaluate_decks_batch(idx)
+        # BATCH_FIELDS-volgorde: avg, balance, coverage, spells, wincon, synergy, overall
+        return [(name, avg, ovr, bal, cov, spl, wc, syn)
+                for (name, _), (avg, bal, cov, spl, wc, syn, ovr) in zip(decks, res.tolist())]
+    evaluate = evaluate_deck if engine == "reference" else evaluate_deck_fast
+    rows = []
+    for name, cards in decks:
+        r = evaluate(cards)
+        rows.append((name, r["avg_elixir"]) + tuple(r["metrics"][k] for _, k in _METRIC_COLUMNS))
+    return rows
+
+
+def round_row(row: tuple) -> tuple:
+    """Afronding zoals in benchmarks.csv: elixir op 2, metrics op 3 decimalen."""
+    return (row[0], round(row[1], 2)) + tuple(round(v, 3) for v in row[2:])
+
+
+# ---------- schrijven ----------
+class CsvSink:
+    def __init__(self, f, raw: bool = False):
+        self.writer = csv.writer(f, lineterminator="\n")
+        self.writer.writerow(COLUMNS)
+        # %g geeft "1" en "0.667", zoals in benchmarks.csv; met --raw de volledige float (repr).
+        self.fmt = repr if raw else (lambda v: "%g" % v)
+
+    def write(self, rows: List[tuple]) -> None:
+        fmt = self.fmt
+        self.writer.writerows([r[0]] + [fmt(v) for v in r[1:]] for r in rows)
+
+    def close(self) -> None:
+        pass
+
+
+class JsonlSink:
+    def __init__(self, f):
+        self.f = f
+
+    def write(self, rows: List[tuple]) -> None:
+        self.f.writelines(json.dumps(dict(zip(COLUMNS, r)), ensure_ascii=False) + "\n"
+                          for r in rows)
+
+    def close(self) -> None:
+        pass
+
+
+class ParquetSink:
+    def __init__(self, path: str):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        self._pa = pa
+        self.schema = pa.schema([("Deck", pa.string())] +
+                                [(c, pa.float64()) for c in COLUMNS[1:]])
+        self.writer = pq.ParquetWriter(path, self.schema)
+
+    def write(self, rows: List[tuple]) -> None:
+        cols = {c: list(v) for c, v in zip(COLUMNS, zip(*rows))}
+        cols["AvgElixir"] = [float(v) for v in cols["AvgElixir"]]
+        self.writer.write_table(self._pa.table(cols, schema=self.schema))
+
+    def close(self) -> None:
+        self.writer.close()
+
+
+def score_stream(decks: Iterable[Deck], sink, engine: str = "batch", chunk_size: int = 50_000,
+                 raw: bool = False) -> int:
+    """Scoort `decks` per chunk en schrijft elke chunk meteen naar `sink`. Geeft het aantal decks."""
+    it = iter(decks)
+    total = 0
+    while True:
+        chunk = list(islice(it, chunk_size))
+        if not chunk:
+            return total
+        rows = score_chunk(chunk, engine)
+        sink.write(rows if raw else [round_row(r) for r in rows])
+        total += len(chunk)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    p = argparse.ArgumentParser(description="Scoor deckbestanden zonder de Streamlit-app.")
+    p.add_argument("input", help="invoerbestand, of - voor stdin")
+    p.add_argument("-o", "--output", default="-", help="uitvoerbestand, of - voor stdout (default)")
+    p.add_argument("--in-format", choices=("csv", "jsonl"))
+    p.add_argument("--out-format", choices=FORMATS)
+    p.add_argument("--engine", choices=ENGINES, default="batch",
+                   help="batch (NumPy, default), fast (bitmaskers), reference (evaluate_deck), "
+                        "pairs (batch met paar-synergy uit synergy_matrix) of table "
+                        "(signatuurtabel uit score_table: zelfde uitkomst als batch, sneller)")
+    p.add_argument("--chunk-size", type=int, default=50_000)
+    p.add_argument("--raw", action="store_true", help="niet afronden zoals benchmarks.csv")
+    args = p.parse_args(argv)
+
+    in_fmt = _format_of(args.input, args.in_format)
+    out_fmt = _format_of(args.output, args.out_format)
+    if out_fmt == "parquet" and args.output == "-":
+        p.error("Parquet kan niet naar stdout; geef -o <bestand>.parquet")
+
+    src = (io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8-sig") if args.input == "-"
+           else open(args.input, encoding="utf-8-sig", newline=""))
+    out = None
+    counts: Dict[str, int] = {}
+    try:
+        if out_fmt == "parquet":
+            sink = ParquetSink(args.output)
+        else:
+            # Zelfde BOM als de bestaande benchmarks.csv, niet op stdout.
+            out = (sys.stdout if args.output == "-" else
+                   open(args.output, "w", encoding="utf-8-sig" if out_fmt == "csv" else "utf-8",
+                        newline=""))
+            sink = CsvSink(out, args.raw) if out_fmt == "csv" else JsonlSink(out)
+        n = score_stream(read_decks(src, in_fmt, counts), sink, args.engine, args.chunk_size, args.raw)
+        sink.close()
+    except ValueError as e:
+        print(f"Fout: {e}", file=sys.stderr)
+        return 2
+    except BrokenPipeError:  # bv. `| head`
+        return 0
+    finally:
+        if src is not sys.stdin:
+            src.close()
+        if out is not None and out is not sys.stdout:
+            out.close()
+    bad = counts.get("bad_lines", 0)
+    print(f"{n} decks gescoord" + (f", {bad} onleesbare regels overgeslagen." if bad else "."),
+          file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,364 @@
+"""HTTP-service voor scoring en regeladvies (tornado).
+
+Endpoints (JSON in, JSON uit):
+
+  POST /evaluate          {"cards": [...]}                      -> avg_elixir + metrics
+  POST /evaluate/batch    {"decks": [[...], ...]}               -> {"results": [...]}
+  POST /advice            {"cards": [...]}                      -> vervangkandidaten + tips
+  POST /swap-suggestions  {"cards": [...], "top": 10, "pool": [...]}
+  GET  /health, GET /metrics (Prometheus, via instrument)
+
+Losse /evaluate-aanvragen worden een paar milliseconden verzameld en samen
+gescoord (micro-batching), standaard via de gedeelde signatuurtabel van
+score_table (mmap; geforkte workers delen dezelfde pagina's) of met
+--engine batch via evaluate_decks_batch. Identieke aanvragen die
+tegelijk binnenkomen delen één berekening (coalescing) en antwoorden worden
+per proces in een LRU-cache bewaard. Onbekende kaartnamen vallen weg, net als
+in normalize_deck, en worden teruggegeven onder "unknown".
+
+    python -m score_service serve --port 8765 --workers 4
+    python -m score_service loadtest --url http://127.0.0.1:8765 -n 20000 -c 64
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import numpy as np
+from cachetools import LRUCache
+from tornado import httpserver, netutil, process, web
+
+import instrument
+from card_index import CARD_ID, CARD_NAMES, DB_VERSION
+from heuristics import (BATCH_FIELDS, evaluate_decks_batch, names_to_indices, normalize_deck,
+                        suggest_improvements)
+from recommender import rule_based_candidates
+from swap_eval import rank_swaps
+
+MAX_BATCH_DECKS = 100_000
+_METRICS = BATCH_FIELDS[1:]
+
+
+def _result(names: List[str], row: Tuple[float, ...]) -> Dict[str, Any]:
+    """Rij in BATCH_FIELDS-volgorde -> zelfde velden als evaluate_deck (deck als namen)."""
+    return {"deck": names, "avg_elixir": row[0], "metrics": dict(zip(_METRICS, row[1:]))}
+
+
+def _cards(body: Dict[str, Any], field: str = "cards") -> Tuple[List[str], List[str]]:
+    """(bekende kaarten, max 8; onbekende namen) uit het verzoek; 400 bij een ongeldige vorm."""
+    cards = body.get(field)
+    if not isinstance(cards, list) or not all(isinstance(c, str) for c in cards):
+        raise web.HTTPError(400, reason=f"'{field}' moet een lijst kaartnamen zijn")
+    return [c for c in cards if c in CARD_ID][:8], [c for c in cards if c not in CARD_ID]
+
+
+def _evaluator(engine: str) -> Callable[[np.ndarray], np.ndarray]:
+    """(N, 8) indices -> BATCH_DTYPE-array; "table" gebruikt de signatuurtabel van dit proces."""
+    if engine == "table":
+        from score_table import shared_table
+        return shared_table().lookup_batch
+    return evaluate_decks_batch
+
+
+class MicroBatcher:
+    """Verzamelt losse decks tot `max_batch` of `window` seconden en scoort ze als batch."""
+
+    def __init__(self, window: float = 0.002, max_batch: int = 512,
+                 evaluate: Callable[[np.ndarray], np.ndarray] = evaluate_decks_batch):
+        self.window = window
+        self.max_batch = max_batch
+        self.evaluate = evaluate
+        self._pending: List[Tuple[List[str], asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def submit(self, names: List[str]) -> "asyncio.Future":
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self._pending.append((names, fut))
+        if len(self._pending) >= self.max_batch:
+            self.flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self.flush)
+        return fut
+
+    def flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        instrument.inc("service_microbatches")
+        instrument.inc("service_microbatch_decks", len(batch))
+        try:
+            rows = self.evaluate(names_to_indices([n for n, _ in batch])).tolist()
+        except Exception as e:
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        for (names, fut), row in zip(batch, rows):
+            if not fut.done():
+                fut.set_result(_result(names, row))
+
+
+class ResponseCache:
+    """LRU-cache van JSON-antwoorden met coalescing van gelijktijdige identieke aanvragen."""
+
+    def __init__(self, maxsize: int = 100_000):
+        self.lru: LRUCache = LRUCache(maxsize=maxsize)
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+
+    async def get(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> bytes:
+        body = self.lru.get(key)
+        if body is not None:
+            instrument.inc("service_cache", result="hit")
+            return body
+        fut = self._inflight.get(key)
+        if fut is not None:
+            instrument.inc("service_cache", result="coalesced")
+            return await asyncio.shield(fut)
+        instrument.inc("service_cache", result="miss")
+        fut = asyncio.get_running_loop().create_future()
+        self._inflight[key] = fut
+        try:
+            body = json.dumps(await compute(), ensure_ascii=False).encode("utf-8")
+        except Exception as e:
+            fut.set_exception(e)
+            fut.exception()  # gemarkeerd als opgehaald, ook zonder andere wachtenden
+            raise
+        finally:
+            del self._inflight[key]
+        self.lru[key] = body
+        fut.set_result(body)
+        return body
+
+
+class _JsonHandler(web.RequestHandler):
+    def initialize(self, batcher: MicroBatcher, cache: ResponseCache) -> None:
+        self.batcher = batcher
+        self.cache = cache
+
+    def json_body(self) -> Dict[str, Any]:
+        try:
+            body = json.loads(self.request.body or b"{}")
+        except ValueError:
+            raise web.HTTPError(400, reason="body is geen geldige JSON")
+        if not isinstance(body, dict):
+            raise web.HTTPError(400, reason="body moet een JSON-object zijn")
+        return body
+
+    def send_json(self, payload: Any) -> None:
+        self.set_header("Content-Type", "application/json; charset=utf-8")
+        self.finish(payload if isinstance(payload, bytes) else
+                    json.dumps(payload, ensure_ascii=False).encode("utf-8"))
+
+    def write_error(self, status_code: int, **kwargs) -> None:
+        self.send_json({"error": self._reason})
+
+
+class EvaluateHandler(_JsonHandler):
+    async def post(self) -> None:
+        with instrument.stage("service_evaluate"):
+            names, unknown = _cards(self.json_body())
+
+            async def compute():
+                return {**await self.batcher.submit(names), "unknown": unknown}
+            key = ("evaluate", tuple(names), tuple(unknown))
+            self.send_json(await self.cache.get(key, compute))
+
+
+class BatchHandler(_JsonHandler):
+    def post(self) -> None:
+        with instrument.stage("service_evaluate_batch"):
+            decks = self.json_body().get("decks")
+            if not isinstance(decks, list) or not all(isinstance(d, list) for d in decks):
+                raise web.HTTPError(400, reason="'decks' moet een lijst van kaartlijsten zijn")
+            if len(decks) > MAX_BATCH_DECKS:
+                raise web.HTTPError(413, reason=f"maximaal {MAX_BATCH_DECKS} decks per aanvraag")
+            names = [_cards({"cards": d})[0] for d in decks]
+            rows = self.batcher.evaluate(names_to_indices(names)).tolist()
+            self.send_json({"results": [_result(n, r) for n, r in zip(names, rows)]})
+
+
+class AdviceHandler(_JsonHandler):
+    async def post(self) -> None:
+        with instrument.stage("service_advice"):
+            names, unknown = _cards(self.json_body())
+
+            async def compute():
+                res = await self.batcher.submit(names)
+                tips = suggest_improvements(normalize_deck(names), res["metrics"],
+                                            res["avg_elixir"])
+                cands = rule_based_candidates(names, avg_now=res["avg_elixir"]) if names else []
+                return {"deck": names, "unknown": unknown, "tips": tips,
+                        "candidates": [{"out": o, "in": i, "reason": r} for o, i, r in cands]}
+            self.send_json(await self.cache.get(("advice", tuple(names), tuple(unknown)), compute))
+
+
+class SwapHandler(_JsonHandler):
+    async def post(self) -> None:
+        with instrument.stage("service_swaps"):
+            body = self.json_body()
+            names, unknown = _cards(body)
+            top = body.get("top", 10)
+            if not isinstance(top, int) or not 0 < top <= 1000:
+                raise web.HTTPError(400, reason="'top' moet een geheel getal tussen 1 en 1000 zijn")
+            pool = body.get("pool")
+            if pool is not None and (not isinstance(pool, list)
+                                     or not all(isinstance(c, str) for c in pool)):
+                raise web.HTTPError(400, reason="'pool' moet een lijst kaartnamen zijn")
+
+            async def compute():
+                return {"deck": names, "unknown": unknown,
+                        "swaps": rank_swaps(names, pool=pool, top=top)}
+            key = ("swaps", tuple(names), tuple(unknown), top,
+                   None if pool is None else tuple(pool))
+            self.send_json(await self.cache.get(key, compute))
+
+
+class HealthHandler(web.RequestHandler):
+    def initialize(self, cache: ResponseCache) -> None:
+        self.cache = cache
+
+    def get(self) -> None:
+        self.finish({"status": "ok", "pid": os.getpid(), "db_version": DB_VERSION,
+                     "cache_entries": len(self.cache.lru)})
+
+
+class MetricsHandler(web.RequestHandler):
+    def get(self) -> None:
+        self.set_header("Content-Type", "text/plain; version=0.0.4")
+        self.finish(instrument.prometheus_text())
+
+
+def make_app(batch_window: float = 0.002, max_batch: int = 512,
+             cache_size: int = 100_000, engine: str = "table") -> web.Application:
+    """Eén app per proces; batcher en cache leven in de event loop van dat proces."""
+    batcher = MicroBatcher(batch_window, max_batch, _evaluator(engine))
+    cache = ResponseCache(cache_size)
+    deps = {"batcher": batcher, "cache": cache}
+    return web.Application([
+        (r"/evaluate", EvaluateHandler, deps),
+        (r"/evaluate/batch", BatchHandler, deps),
+        (r"/advice", AdviceHandler, deps),
+        (r"/swap-suggestions", SwapHandler, deps),
+        (r"/health", HealthHandler, {"cache": cache}),
+        (r"/metrics", MetricsHandler),
+    ])
+
+
+def serve(port: int, host: str = "127.0.0.1", workers: int = 1, **app_kwargs) -> None:
+    """Start de service; bij workers > 1 delen geforkte processen dezelfde socket."""
+    sockets = netutil.bind_sockets(port, host)
+    if app_kwargs.get("engine", "table") == "table":
+        # Vóór de fork openen: de tabel wordt één keer gebouwd en de workers erven de mmap.
+        from score_table import shared_table
+        shared_table()
+    if workers != 1:
+        process.fork_processes(workers if workers > 0 else None)
+
+    async def run():
+        server = httpserver.HTTPServer(make_app(**app_kwargs), xheaders=True)
+        server.add_sockets(sockets)
+        await asyncio.Event().wait()
+    asyncio.run(run())
+
+
+# ---------- lokale loadtest ----------
+async def _keepalive_worker(host: str, port: int, path: str, bodies: List[bytes], todo,
+                            latencies: List[float]) -> int:
+    """Eén keep-alive verbinding die aanvragen uit `todo` afwerkt; geeft het aantal fouten."""
+    reader, writer = await asyncio.open_connection(host, port)
+    errors = 0
+    try:
+        for i in todo:
+            body = bodies[i % len(bodies)]
+            t0 = time.perf_counter()
+            writer.write(f"POST {path} HTTP/1.1\r\nHost: {host}\r\n"
+                         f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n"
+                         .encode("ascii") + body)
+            await writer.drain()
+            head = (await reader.readuntil(b"\r\n\r\n")).decode("latin-1").split("\r\n")
+            length = next(int(h.split(":", 1)[1]) for h in head
+                          if h.lower().startswith("content-length"))
+            await reader.readexactly(length)
+            latencies.append(time.perf_counter() - t0)
+            errors += not head[0].split()[1].startswith("2")
+    finally:
+        writer.close()
+    return errors
+
+
+async def loadtest(url: str, endpoint: str = "/evaluate", requests: int = 10_000,
+                   concurrency: int = 64, distinct: int = 1_000, seed: int = 0) -> Dict[str, Any]:
+    """`requests` aanvragen over `concurrency` keep-alive verbindingen.
+
+    `distinct` (aantal verschillende decks) bepaalt de cache-hitrate. Draait de client
+    op dezelfde cores als de service, dan meet je beide samen.
+    """
+    rng = random.Random(seed)
+    bodies = [json.dumps({"cards": rng.sample(CARD_NAMES, 8)}).encode("utf-8")
+              for _ in range(distinct)]
+    target = urlsplit(url)
+    todo = iter(range(requests))
+    latencies: List[float] = []
+    t0 = time.perf_counter()
+    errors = await asyncio.gather(*(
+        _keepalive_worker(target.hostname, target.port or 80, endpoint, bodies, todo, latencies)
+        for _ in range(concurrency)))
+    elapsed = time.perf_counter() - t0
+    lat = np.array(latencies) * 1e3
+    return {"endpoint": endpoint, "requests": len(latencies), "concurrency": concurrency,
+            "errors": sum(errors), "seconds": round(elapsed, 3),
+            "rps": round(len(latencies) / elapsed, 1),
+            "p50_ms": round(float(np.percentile(lat, 50)), 3),
+            "p99_ms": round(float(np.percentile(lat, 99)), 3)}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    p = argparse.ArgumentParser(description="HTTP-service voor deck-scoring en regeladvies.")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    s = sub.add_parser("serve", help="start de service")
+    s.add_argument("--host", default="127.0.0.1")
+    s.add_argument("--port", type=int, default=8765)
+    s.add_argument("--workers", type=int, default=1, help="aantal processen (0 = aantal cores)")
+    s.add_argument("--batch-window-ms", type=float, default=2.0)
+    s.add_argument("--max-batch", type=int, default=512)
+    s.add_argument("--cache-size", type=int, default=100_000, help="antwoorden per proces")
+    s.add_argument("--engine", choices=("table", "batch"), default="table",
+                   help="table (gedeelde signatuurtabel, default) of batch (evaluate_decks_batch)")
+    s.add_argument("--metrics", action="store_true", help="instrumentatie aanzetten (/metrics)")
+    lt = sub.add_parser("loadtest", help="lokale loadtest tegen een draaiende service")
+    lt.add_argument("--url", default="http://127.0.0.1:8765")
+    lt.add_argument("--endpoint", default="/evaluate",
+                    choices=("/evaluate", "/advice", "/swap-suggestions"))
+    lt.add_argument("-n", "--requests", type=int, default=10_000)
+    lt.add_argument("-c", "--concurrency", type=int, default=64)
+    lt.add_argument("--distinct", type=int, default=1_000, help="aantal verschillende decks")
+    args = p.parse_args(argv)
+
+    if args.cmd == "loadtest":
+        print(json.dumps(asyncio.run(loadtest(args.url, args.endpoint, args.requests,
+                                              args.concurrency, args.distinct)), indent=2))
+        return 0
+    if args.metrics:
+        instrument.enable()
+    try:
+        serve(args.port, args.host, args.workers, batch_window=args.batch_window_ms / 1000,
+              max_batch=args.max_batch, cache_size=args.cache_size, engine=args.engine)
+    except OSError as e:
+        print(f"Fout: {e}", file=sys.stderr)
+        return 2
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
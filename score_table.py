@@ -0,0 +1,184 @@
+"""Signatuur-cache voor deckscores, als memory-mapped tabel op schijf.
+
+Alle uitkomsten van evaluate_deck voor een deck van 8 kaarten hangen alleen af
+van de signatuur: offense−defense, aantal wincons (max 2), de aanwezige
+scorende tags (SCORE_TAGS zonder wincon, dat volgt uit de telling) en de
+elixirsom. Van die elixirsom telt alleen de klasse (synergy-bonus en
+elixir-penalty). De tabel bevat één rij BATCH_FIELDS per signatuur, wordt één
+keer gebouwd en als .npy weggeschreven met SCORE_VERSION in de bestandsnaam;
+worker-processen openen hem read-only via mmap en delen zo dezelfde pagina's.
+
+De sleutel kost per kaart één optelling en één OR: offense−defense, wincons en
+elixir zitten samen in één opgeteld getal per kaart (_PACK), waaruit één
+opzoektabel het signatuurdeel en de gemiddelde elixir haalt. Een batch is
+daarmee twee gathers, een take van hele rijen en geen metric-rekenwerk.
+"""
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from card_index import DEFENSE, ELIXIR, N_CARDS, OFFENSE, SCORE_BIT, SCORE_MASK, WINCON
+from heuristics import (BATCH_DTYPE, BATCH_FIELDS, SCORE_VERSION, _AVG_TABLE, elixir_penalty,
+                        evaluate_decks_batch, evaluate_ids, signature_metrics)
+
+DEFAULT_CACHE_DIR = Path(__file__).resolve().parent / "data" / "cache"
+METRIC_FIELDS = BATCH_FIELDS[1:]  # balance ... overall
+TABLE_FORMAT = 2  # kolommen/volgorde van de tabel; hoort in de bestandsnaam
+
+_DELTA = [o - d for o, d in zip(OFFENSE, DEFENSE)]
+_DMIN, _DMAX = 8 * min(_DELTA), 8 * max(_DELTA)
+_N_DIFF = _DMAX - _DMIN + 1
+_WINCON_BIT = SCORE_BIT["wincon"]
+_N_TAGMASKS = _WINCON_BIT  # maskers zonder het wincon-bit (hoogste bit)
+_TAG_BITS = _N_TAGMASKS - 1
+
+
+def _elixir_classes():
+    """Elixirsommen met gelijke synergy-bonus en penalty vallen in dezelfde klasse."""
+    avg = _AVG_TABLE[8]
+    bonus = np.where(avg <= 3.1, 0.2, np.where(avg <= 4.0, 0.1, 0.0))
+    penalty = elixir_penalty(avg)
+    keys = list(zip(bonus.tolist(), penalty.tolist()))
+    first: Dict[tuple, int] = {}
+    cls = np.empty(len(keys), dtype=np.int64)
+    reps: List[int] = []
+    for e, k in enumerate(keys):
+        if k not in first:
+            first[k] = len(reps)
+            reps.append(e)
+        cls[e] = first[k]
+    return cls, np.array(reps, dtype=np.int64)
+
+
+_ECLASS, _EREP = _elixir_classes()
+N_SIGNATURES = _N_DIFF * 3 * len(_EREP) * _N_TAGMASKS
+
+# Per kaart één getal: (delta - min) * _W_BASE * _E_BASE + wincon * _E_BASE + elixir. De som over
+# 8 kaarten bevat zo de drie sommen zonder overloop. Een leeg slot (-1, de laatste rij) telt
+# _PACK_LIMIT op, dus elke rij met een leeg slot valt buiten het bereik.
+_E_BASE = 8 * max(ELIXIR) + 1
+_W_BASE = 8 * max(WINCON) + 1
+_PACK_LIMIT = _N_DIFF * _W_BASE * _E_BASE
+_PACK = np.array([(d - min(_DELTA)) * _W_BASE * _E_BASE + w * _E_BASE + e
+                  for d, w, e in zip(_DELTA, WINCON, ELIXIR)] + [_PACK_LIMIT], dtype=np.int64)
+_SMASK = np.array(SCORE_MASK + [0], dtype=np.int64)
+
+
+def _pack_tables():
+    """Per opgeteld getal: sleuteldeel (zonder tagmasker) en gemiddelde elixir.
+
+    Index _PACK_LIMIT is de (geknipte) waarde voor onvolledige rijen: sleutel 0, avg 0.
+    """
+    p = np.arange(_PACK_LIMIT)
+    esum, wincons, diff = p % _E_BASE, (p // _E_BASE) % _W_BASE, p // (_W_BASE * _E_BASE)
+    base = ((diff * 3 + np.minimum(wincons, 2)) * len(_EREP) + _ECLASS[esum]) * _N_TAGMASKS
+    return np.append(base, 0), np.append(_AVG_TABLE[8][esum], 0.0)
+
+
+_KEY_BASE, _AVG_PACKED = _pack_tables()
+_PACK_L, _SMASK_L = _PACK.tolist(), SCORE_MASK
+_KEY_BASE_L, _AVG_PACKED_L = _KEY_BASE.tolist(), _AVG_PACKED.tolist()
+
+
+def signature(ids: List[int]) -> Optional[int]:
+    """Signatuur-sleutel van een deck van precies 8 kaart-ID's, anders None."""
+    if len(ids) != 8:
+        return None
+    p = m = 0
+    for i in ids:
+        p += _PACK_L[i]
+        m |= _SMASK_L[i]
+    return _KEY_BASE_L[p] + (m & _TAG_BITS)
+
+
+def _packed_batch(indices: np.ndarray):
+    """(opgeteld getal geknipt op _PACK_LIMIT, sleutels) voor een (N, 8) matrix."""
+    cols = np.ascontiguousarray(np.asarray(indices).T)  # per kolom optellen is veel sneller
+    packed = np.minimum(_PACK[cols].sum(axis=0), _PACK_LIMIT)
+    keys = _KEY_BASE[packed] + (np.bitwise_or.reduce(_SMASK[cols], axis=0) & _TAG_BITS)
+    return packed, keys
+
+
+def signatures_batch(indices: np.ndarray) -> np.ndarray:
+    """Signatuur-sleutels voor een (N, 8) matrix van kaart-ID's; -1 voor rijen met lege slots."""
+    packed, keys = _packed_batch(indices)
+    return np.where(packed < _PACK_LIMIT, keys, -1)
+
+
+def build_table() -> np.ndarray:
+    """(N_SIGNATURES, 7) float64-tabel met BATCH_FIELDS per signatuur (avg_elixir is NaN)."""
+    d, w, e, m = np.meshgrid(np.arange(_DMIN, _DMAX + 1), np.arange(3), np.arange(len(_EREP)),
+                             np.arange(_N_TAGMASKS), indexing="ij")
+    smask = m | np.where(w > 0, _WINCON_BIT, 0)
+    metrics = signature_metrics(d.ravel(), w.ravel(), smask.ravel(), _AVG_TABLE[8][_EREP[e.ravel()]])
+    # avg_elixir hangt van de exacte elixirsom af, niet van de klasse; komt uit _AVG_PACKED.
+    return np.column_stack([np.full(N_SIGNATURES, np.nan)] + [metrics[f] for f in METRIC_FIELDS])
+
+
+class ScoreTable:
+    """Read-only signatuurtabel; lookups geven dezelfde uitvoer als evaluate_ids/-_decks_batch."""
+
+    def __init__(self, table: np.ndarray):
+        if table.shape != (N_SIGNATURES, len(BATCH_FIELDS)):
+            raise ValueError(f"Tabel heeft shape {table.shape}, verwacht "
+                             f"{(N_SIGNATURES, len(BATCH_FIELDS))}")
+        self.table = table
+        self._rows = np.asarray(table).view(BATCH_DTYPE).reshape(N_SIGNATURES)
+
+    def lookup_ids(self, ids: List[int]) -> Dict[str, Any]:
+        if len(ids) != 8:
+            return evaluate_ids(ids)
+        p = m = 0
+        for i in ids:
+            p += _PACK_L[i]
+            m |= _SMASK_L[i]
+        row = self._rows.item(_KEY_BASE_L[p] + (m & _TAG_BITS))
+        return {"ids": ids, "avg_elixir": _AVG_PACKED_L[p],
+                "metrics": dict(zip(METRIC_FIELDS, row[1:]))}
+
+    def lookup_batch(self, indices: np.ndarray) -> np.ndarray:
+        """Zelfde uitvoer als evaluate_decks_batch; onvolledige rijen worden gewoon berekend."""
+        idx = np.asarray(indices)
+        if idx.ndim != 2 or idx.shape[1] != 8 or not len(idx):
+            return evaluate_decks_batch(idx)
+        if idx.max() >= N_CARDS:
+            raise ValueError("onbekend kaart-ID in indices")
+        packed, keys = _packed_batch(idx)
+        # np.take op de float-rijen is ~10x sneller dan fancy indexing op de structured array.
+        out = np.take(self.table, keys, axis=0).view(BATCH_DTYPE).reshape(len(idx))
+        out["avg_elixir"] = _AVG_PACKED[packed]
+        partial = packed == _PACK_LIMIT
+        if partial.any():
+            out[partial] = evaluate_decks_batch(idx[partial])
+        return out
+
+
+def table_path(cache_dir: Optional[Path] = None) -> Path:
+    # Naam hangt ook af van de gewichten: na een refit wordt een nieuwe tabel gebouwd.
+    return (Path(cache_dir or DEFAULT_CACHE_DIR)
+            / f"score_table_v{TABLE_FORMAT}_{SCORE_VERSION}.npy")
+
+
+def load_score_table(cache_dir: Optional[Path] = None) -> ScoreTable:
+    """Opent de tabel voor de huidige CARD_DB en gewichten via mmap; bouwt hem zo nodig eerst."""
+    path = table_path(cache_dir)
+    if not path.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp, "wb") as f:
+            np.save(f, build_table())
+        os.replace(tmp, path)  # atomisch: parallelle workers zien nooit een half bestand
+    return ScoreTable(np.load(path, mmap_mode="r"))
+
+
+_SHARED: Optional[ScoreTable] = None
+
+
+def shared_table() -> ScoreTable:
+    """De tabel van dit proces (DEFAULT_CACHE_DIR), bij het eerste gebruik geopend."""
+    global _SHARED
+    if _SHARED is None:
+        _SHARED = load_score_table()
+    return _SHARED
@@ -0,0 +1,224 @@
+"""Exacte top-K deck-aanvulling met branch-and-bound.
+
+Gegeven 0–7 vaste kaarten zoekt de solver de K 8-kaart decks met de hoogste
+`overall`. Alle metrics in heuristics hangen alleen af van een kleine
+signatuur: offense−defense, aantal wincons, aanwezigheid van 9 scorende tags
+en de elixirsom. Kaarten met dezelfde (tags, balansbijdrage, wincon) vormen
+een groep; binnen een groep is goedkoper nooit slechter.
+
+Per query wordt achterwaarts over de groepen een tabel opgebouwd met de
+minimale elixir om met r kaarten een gegeven balansverschuiving, wincon-telling
+en tag-superset toe te voegen. Daaruit volgt per zoekknoop een *exacte*
+bovengrens, zodat alleen takken die de top-K kunnen halen doorzocht worden.
+
+Gebruik:
+    python solver.py --lock "Hog Rider" --lock "The Log" -k 5 --max-elixir 3.3
+"""
+import argparse
+import heapq
+import json
+import sys
+from itertools import combinations
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from card_index import (CARD_ID, CARD_NAMES, DEFENSE, ELIXIR, OFFENSE, SCORE_BIT,
+                        SCORE_MASK, SCORE_TAGS, TAG_MASK, WINCON, tag_bit)
+from heuristics import _AVG_TABLE, evaluate_ids, signature_metrics
+
+_N_MASKS = 1 << len(SCORE_TAGS)
+_INF = np.int16(10_000)
+
+_DELTA = [OFFENSE[i] - DEFENSE[i] for i in range(len(CARD_NAMES))]
+_DMIN, _DMAX = 8 * min(_DELTA), 8 * max(_DELTA)
+_ND = _DMAX - _DMIN + 1  # aantal mogelijke balansverschuivingen
+_AVG8 = _AVG_TABLE[8]
+
+
+def _card_ids(names: Iterable[str], what: str) -> List[int]:
+    ids = []
+    for n in names:
+        if n not in CARD_ID:
+            raise ValueError(f"Onbekende kaart bij {what}: {n!r}")
+        ids.append(CARD_ID[n])
+    return ids
+
+
+def _groups(pool: Iterable[int]) -> List[List[int]]:
+    """Groepeer op (tags, balansbijdrage, wincon); veel scorende tags eerst, binnen groep goedkoop eerst."""
+    by_key: Dict[tuple, List[int]] = {}
+    for i in pool:
+        by_key.setdefault((SCORE_MASK[i], _DELTA[i], WINCON[i]), []).append(i)
+    groups = [sorted(v, key=lambda i: (ELIXIR[i], CARD_NAMES[i])) for v in by_key.values()]
+    groups.sort(key=lambda g: (-bin(SCORE_MASK[g[0]]).count("1"), -WINCON[g[0]],
+                               ELIXIR[g[0]], CARD_NAMES[g[0]]))
+    return groups
+
+
+def _completion_tables(groups: List[List[int]]) -> List[np.ndarray]:
+    """tables[g][r, dd, w, M] = minimale elixir om met r kaarten uit groups[g:] een
+    balansverschuiving dd (+_DMIN), w wincons (max 2) en een tag-superset van M toe te voegen."""
+    all_masks = np.arange(_N_MASKS)
+    nxt = np.full((9, _ND, 3, _N_MASKS), _INF, dtype=np.int16)
+    nxt[0, -_DMIN, 0, 0] = 0
+    tables = [nxt]
+    for grp in reversed(groups):
+        m, d, w = SCORE_MASK[grp[0]], _DELTA[grp[0]], WINCON[grp[0]]
+        cur = nxt.copy()  # c = 0: groep overslaan
+        gather = all_masks & ~m
+        cost = 0
+        for c in range(1, min(len(grp), 8) + 1):
+            cost += ELIXIR[grp[c - 1]]
+            shifted = nxt[:9 - c][..., gather]
+            shift = c * d
+            src = slice(max(0, -shift), _ND - max(0, shift))
+            dst = slice(max(0, shift), _ND - max(0, -shift))
+            for w_old in range(3):
+                w_new = min(2, w_old + c * w)
+                block = shifted[:, src, w_old, :] + np.int16(cost)
+                target = cur[c:, dst, w_new, :]
+                np.minimum(target, block, out=target)
+        np.minimum(cur, _INF, out=cur)
+        tables.append(cur)
+        nxt = cur
+    tables.reverse()
+    return tables
+
+
+def complete_deck(locked: Sequence[str] = (), banned: Iterable[str] = (), k: int = 10,
+                  max_avg_elixir: Optional[float] = None,
+                  require_tags: Iterable[str] = ()) -> List[Dict[str, Any]]:
+    """Geeft de K beste aanvullingen van `locked` tot 8 kaarten, hoogste overall eerst.
+
+    Elk resultaat heeft dezelfde vorm als evaluate_deck ("deck" als lijst namen).
+    `require_tags` (bv. "small_spell") en `max_avg_elixir` zijn harde eisen.
+    """
+    lock = _card_ids(locked, "locked")
+    if len(set(lock)) != len(lock):
+        raise ValueError("Dubbele kaarten in locked.")
+    if len(lock) > 8:
+        raise ValueError("Maximaal 8 vaste kaarten.")
+    if k < 1:
+        return []
+    ban = set(_card_ids(banned, "banned"))
+    required = 0  # compacte tags, in de bovengrens meegenomen
+    extra_required = []  # overige tags, alleen bij complete decks gecontroleerd
+    for t in require_tags:
+        if t in SCORE_BIT:
+            required |= SCORE_BIT[t]
+        elif tag_bit(t):
+            extra_required.append(tag_bit(t))
+        else:
+            raise ValueError(f"Onbekende tag: {t!r}")
+
+    groups = _groups(i for i in range(len(CARD_NAMES)) if i not in ban and i not in lock)
+    tables = _completion_tables(groups)
+    # Ruimste elixirsom waarvoor de (afgeronde) gemiddelde elixir binnen de limiet valt.
+    max_esum = len(_AVG8) - 1
+    if max_avg_elixir is not None:
+        ok = np.flatnonzero(_AVG8 <= max_avg_elixir)
+        max_esum = int(ok.max()) if ok.size else -1
+
+    # Per (groep, r) alleen de haalbare entries, als platte arrays.
+    sparse: List[List[Optional[tuple]]] = []
+    for tab in tables:
+        per_r: List[Optional[tuple]] = []
+        for r in range(9):
+            dd, w, mm = np.nonzero(tab[r] < _INF)
+            per_r.append((dd + _DMIN, w, mm, tab[r][dd, w, mm].astype(np.int64)))
+        sparse.append(per_r)
+
+    heap: List[tuple] = []  # (overall, -volgnummer, ids); heap[0] is de K-de beste
+    seq = 0
+
+    def upper_bound(g, r, diff, wincons, cmask, esum):
+        dd, w, mm, e = sparse[g][r]
+        total = esum + e
+        final = cmask | mm
+        ok = (total <= max_esum) & ((final & required) == required)
+        if not ok.any():
+            return None
+        total = total[ok]
+        return signature_metrics(diff + dd[ok], wincons + w[ok], final[ok],
+                                 _AVG8[total])["overall"].max()
+
+    def push(ids):
+        nonlocal seq
+        for b in extra_required:
+            if not any(TAG_MASK[i] & b for i in ids):
+                return
+        res = evaluate_ids(ids)
+        score = res["metrics"]["overall"]
+        seq += 1
+        item = (score, -seq, tuple(ids))
+        if len(heap) < k:
+            heapq.heappush(heap, item)
+        elif score > heap[0][0]:
+            heapq.heapreplace(heap, item)
+
+    def search(g, ids, r, diff, wincons, cmask, esum):
+        if r == 0:
+            push(ids)
+            return
+        if g == len(groups):
+            return
+        grp = groups[g]
+        m, d, w = SCORE_MASK[grp[0]], _DELTA[grp[0]], WINCON[grp[0]]
+        for c in range(min(len(grp), r), -1, -1):
+            d2, w2 = diff + c * d, wincons + c * w
+            cm2 = cmask | m if c else cmask
+            for chosen in combinations(grp, c):
+                e2 = esum + sum(ELIXIR[i] for i in chosen)
+                ub = upper_bound(g + 1, r - c, d2, w2, cm2, e2)
+                if ub is None or (len(heap) == k and ub <= heap[0][0]):
+                    continue
+                ids.extend(chosen)
+                search(g + 1, ids, r - c, d2, w2, cm2, e2)
+                del ids[len(ids) - c:]
+
+    diff = sum(_DELTA[i] for i in lock)
+    wincons = sum(WINCON[i] for i in lock)
+    cmask = 0
+    for i in lock:
+        cmask |= SCORE_MASK[i]
+    esum = sum(ELIXIR[i] for i in lock)
+    if upper_bound(0, 8 - len(lock), diff, wincons, cmask, esum) is not None:
+        search(0, list(lock), 8 - len(lock), diff, wincons, cmask, esum)
+
+    results = []
+    for score, _, ids in sorted(heap, reverse=True):
+        res = evaluate_ids(list(ids))
+        results.append({"deck": [CARD_NAMES[i] for i in ids],
+                        "avg_elixir": res["avg_elixir"], "metrics": res["metrics"]})
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    p = argparse.ArgumentParser(description="Vul een deck aan tot de K beste 8-kaart decks.")
+    p.add_argument("--lock", action="append", default=[], help="vaste kaart (herhaalbaar)")
+    p.add_argument("--ban", action="append", default=[], help="verboden kaart (herhaalbaar)")
+    p.add_argument("-k", type=int, default=5, help="aantal decks (default 5)")
+    p.add_argument("--max-elixir", type=float, default=None, help="max gemiddelde elixir")
+    p.add_argument("--require", action="append", default=[],
+                   help="verplichte tag, bv. small_spell (herhaalbaar)")
+    p.add_argument("--json", action="store_true", help="output als JSON")
+    args = p.parse_args(argv)
+    try:
+        results = complete_deck(args.lock, args.ban, args.k, args.max_elixir, args.require)
+    except ValueError as e:
+        print(f"Fout: {e}", file=sys.stderr)
+        return 2
+    if args.json:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+        return 0
+    if not results:
+        print("Geen deck voldoet aan de eisen.")
+    for r in results:
+        print(f"{r['metrics']['overall']:.3f}  ({r['avg_elixir']} elixir)  {', '.join(r['deck'])}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
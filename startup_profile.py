@@ -0,0 +1,173 @@
+"""Meet de koude start van de app.
+
+  imports        import-tijd van de modules die app.py laadt, in een vers proces,
+                 plus controle dat torch/transformers daarbij niet geladen worden
+  first_render   één volledige run van app.py via streamlit.testing (AppTest)
+  first_advice   model laden (warm-up) en de eerste LLM-aanvraag voor een voorbeelddeck, in
+                 de modus van de app (CRDA_LLM_MODE: score = opties rangschikken,
+                 generate = vrije generatie) of --mode
+
+Voorbeelden:
+    python -m startup_profile
+    python -m startup_profile --skip-llm --json
+    CRDA_LLM_PATH=models/flan-t5-base python -m startup_profile
+"""
+import argparse
+import ast
+import json
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parent
+
+
+def app_modules(path: Path = ROOT / "app.py") -> List[str]:
+    """Eigen modules die app.py op topniveau importeert (in volgorde), zonder streamlit zelf.
+
+    Afgeleid uit app.py zelf, zodat de meting meeloopt als de app nieuwe modules laadt.
+    """
+    found: List[str] = []
+    for node in ast.parse(path.read_text(encoding="utf-8")).body:
+        if isinstance(node, ast.Import):
+            names = [a.name for a in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            names = [node.module]
+        else:
+            continue
+        for name in names:
+            top = name.split(".")[0]
+            if (ROOT / f"{top}.py").exists() and top not in found:
+                found.append(top)
+    return found
+
+
+# Wat app.py (direct of indirect) bij het starten importeert.
+APP_MODULES = app_modules()
+HEAVY_MODULES = ["torch", "transformers", "tokenizers", "sentencepiece"]
+
+_IMPORTS_SNIPPET = """
+import json, sys, time
+t0 = time.perf_counter()
+for m in {modules!r}:
+    __import__(m)
+elapsed = time.perf_counter() - t0
+print(json.dumps({{"seconds": elapsed,
+                  "heavy_loaded": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+_RENDER_SNIPPET = """
+import json, sys, time
+from streamlit.testing.v1 import AppTest
+t0 = time.perf_counter()
+at = AppTest.from_file("app.py", default_timeout=120)
+at.run()
+elapsed = time.perf_counter() - t0
+print(json.dumps({{"seconds": elapsed, "exceptions": [str(e.value) for e in at.exception],
+                  "heavy_loaded": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def _run_snippet(code: str) -> Dict[str, Any]:
+    proc = subprocess.run([sys.executable, "-c", code], cwd=str(ROOT), capture_output=True,
+                          text=True)
+    if proc.returncode != 0:
+        lines = proc.stderr.strip().splitlines()
+        return {"error": lines[-1] if lines else f"exit {proc.returncode}"}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def measure_imports() -> Dict[str, Any]:
+    return _run_snippet(_IMPORTS_SNIPPET.format(modules=APP_MODULES, heavy=HEAVY_MODULES))
+
+
+def measure_first_render() -> Dict[str, Any]:
+    return _run_snippet(_RENDER_SNIPPET.format(heavy=HEAVY_MODULES))
+
+
+# Deck met gaten (geen building, geen kleine spell), zodat er opties in de prompt staan.
+SAMPLE_DECK = ["Giant", "Wizard", "Barbarians", "Archers", "Knight", "Minions", "Fireball",
+               "Mega Minion"]
+
+
+def _first_request(service, mode: str, timeout: float) -> None:
+    """De LLM-aanvraag die de app in `mode` voor SAMPLE_DECK doet."""
+    from llm_advice import GEN_KWARGS, SCORE, build_prompt, build_score_prompt, option_texts
+    from recommender import rule_based_candidates
+    candidates = rule_based_candidates(SAMPLE_DECK)
+    if mode == SCORE:
+        service.score(build_score_prompt(SAMPLE_DECK, candidates),
+                      option_texts(candidates)).result(timeout=timeout)
+    else:
+        service.generate(build_prompt(SAMPLE_DECK, candidates), timeout=timeout, **GEN_KWARGS)
+
+
+def measure_first_advice(model: Optional[str] = None, timeout: float = 600.0,
+                         mode: Optional[str] = None) -> Dict[str, Any]:
+    """Warm-up tot `ready`, daarna de eerste aanvraag in `mode` (default: CRDA_LLM_MODE, zoals
+    de app); tijden in seconden."""
+    from llm_advice import LLM_MODE
+    from llm_service import FAILED, READY, InferenceService, default_model
+
+    mode = mode or LLM_MODE
+
+    service = InferenceService(model or default_model())
+    try:
+        t0 = time.perf_counter()
+        service.warm_up()
+        while service.state not in (READY, FAILED):
+            if time.perf_counter() - t0 > timeout:
+                return {"model": service.model, "mode": mode, "error": "warm-up timeout"}
+            time.sleep(0.05)
+        if service.state == FAILED:
+            return {"model": service.model, "mode": mode, "error": repr(service.load_error)}
+        t1 = time.perf_counter()
+        _first_request(service, mode, timeout)
+        t2 = time.perf_counter()
+        return {"model": service.model, "mode": mode, "load_seconds": t1 - t0,
+                "request_seconds": t2 - t1, "seconds": t2 - t0}
+    finally:
+        service.close()
+
+
+def _report(results: Dict[str, Dict[str, Any]]) -> List[str]:
+    lines = []
+    for name, r in results.items():
+        if "error" in r:
+            lines.append(f"{name:<13} niet gemeten: {r['error']}")
+            continue
+        extra = ""
+        if r.get("heavy_loaded"):
+            extra = f"  LET OP: geladen: {', '.join(r['heavy_loaded'])}"
+        if "load_seconds" in r:
+            step = "scoren" if r["mode"] == "score" else "genereren"
+            extra = f"  (laden {r['load_seconds']:.2f} s, {step} {r['request_seconds']:.2f} s)"
+        lines.append(f"{name:<13} {r['seconds']:8.3f} s{extra}")
+    return lines
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    p = argparse.ArgumentParser(description="Meet import-tijd, eerste render en eerste advies.")
+    p.add_argument("--skip-llm", action="store_true", help="model niet laden")
+    p.add_argument("--model", help="modelnaam of lokaal pad (default: CRDA_LLM_PATH of de hub)")
+    p.add_argument("--mode", choices=("score", "generate"),
+                   help="LLM-modus van de eerste aanvraag (default: CRDA_LLM_MODE, zoals de app)")
+    p.add_argument("--json", action="store_true")
+    args = p.parse_args(argv)
+
+    results = {"imports": measure_imports(), "first_render": measure_first_render()}
+    if not args.skip_llm:
+        results["first_advice"] = measure_first_advice(args.model, mode=args.mode)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print("\n".join(_report(results)))
+    heavy = results["imports"].get("heavy_loaded") or results["first_render"].get("heavy_loaded")
+    return 1 if heavy else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
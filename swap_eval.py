@@ -0,0 +1,115 @@
+"""Incrementele evaluatie van één-kaart swaps.
+
+DeckCounter houdt per deck de tag-tellers, offense/defense/wincon-tellers en de
+elixirsom bij, zodat het scoren van een swap O(1) kost in plaats van een
+volledige evaluate_deck. rank_swaps scoort daarmee alle 8 × (pool − 8) swaps.
+"""
+from typing import Any, Dict, Iterable, List, Optional
+
+from card_index import (CARD_ID, CARD_NAMES, DEFENSE, ELIXIR, OFFENSE, TAG_MASK, TAGS,
+                        WINCON, to_ids)
+from heuristics import average_elixir_sum, metrics_from_counts, overall_score
+
+# Tag-indices per kaart, zodat een swap alleen de tags van in/uit-kaart aanraakt.
+_CARD_TAG_IDX: List[List[int]] = [[t for t in range(len(TAGS)) if TAG_MASK[i] >> t & 1]
+                                  for i in range(len(CARD_NAMES))]
+# Een andere optelvolgorde geeft verschillen van ~1e-16; pas daarboven telt een swap als winst.
+GAIN_EPS = 1e-9
+
+
+class DeckCounter:
+    """Tellers van een deck (kaart-ID's) voor O(1) swap-evaluatie."""
+
+    def __init__(self, ids: Iterable[int]):
+        self.ids = list(ids)
+        self.tag_counts = [0] * len(TAGS)
+        self.tags = 0
+        self.offense = self.defense = self.wincons = self.elixir = 0
+        for i in self.ids:
+            self._add(i, 1)
+
+    @classmethod
+    def from_names(cls, names: Iterable[str]) -> "DeckCounter":
+        return cls(to_ids(names))
+
+    def _add(self, card: int, sign: int) -> None:
+        for t in _CARD_TAG_IDX[card]:
+            self.tag_counts[t] += sign
+            if self.tag_counts[t]:
+                self.tags |= 1 << t
+            else:
+                self.tags &= ~(1 << t)
+        self.offense += sign * OFFENSE[card]
+        self.defense += sign * DEFENSE[card]
+        self.wincons += sign * WINCON[card]
+        self.elixir += sign * ELIXIR[card]
+
+    def avg_elixir(self) -> float:
+        return average_elixir_sum(self.elixir, len(self.ids))
+
+    def metrics(self) -> Dict[str, float]:
+        return metrics_from_counts(self.offense, self.defense, self.wincons, self.tags,
+                                   self.avg_elixir())
+
+    def swap_metrics(self, pos: int, card: int) -> Dict[str, float]:
+        """Metrics na het vervangen van self.ids[pos] door `card`, zonder het deck te wijzigen."""
+        out = self.ids[pos]
+        tags = self.tags
+        for t in _CARD_TAG_IDX[out]:
+            if self.tag_counts[t] == 1:
+                tags &= ~(1 << t)
+        tags |= TAG_MASK[card]
+        avg = average_elixir_sum(self.elixir - ELIXIR[out] + ELIXIR[card], len(self.ids))
+        return metrics_from_counts(self.offense - OFFENSE[out] + OFFENSE[card],
+                                   self.defense - DEFENSE[out] + DEFENSE[card],
+                                   self.wincons - WINCON[out] + WINCON[card], tags, avg)
+
+    def apply_swap(self, pos: int, card: int) -> None:
+        self._add(self.ids[pos], -1)
+        self.ids[pos] = card
+        self._add(card, 1)
+
+
+def _with_pair_synergy(m: Dict[str, float], pair_sum: float, avg: float) -> Dict[str, float]:
+    from synergy_matrix import synergy_from_pairs
+    m["synergy"] = synergy_from_pairs(pair_sum, avg)
+    m["overall"] = overall_score(m, avg)
+    return m
+
+
+def rank_swaps(names: List[str], pool: Optional[Iterable[str]] = None, top: int = 10,
+               min_gain: float = 0.0, pairs: Optional[Any] = None) -> List[Dict[str, Any]]:
+    """Scoort elke swap (deckkaart -> poolkaart buiten het deck) en geeft de `top`
+    swaps waarvan overall met meer dan `min_gain` (+ GAIN_EPS) stijgt, grootste winst eerst.
+
+    Met `pairs` (een matrix uit synergy_matrix) telt de paar-synergy i.p.v.
+    synergy_score; de paarsom per swap komt uit één swap_deltas-tabel.
+    Elk resultaat: {"out", "in", "metrics", "delta"} met delta per metric.
+    """
+    counter = DeckCounter.from_names(names)
+    base = counter.metrics()
+    if pairs is not None:
+        from synergy_matrix import deck_pair_sum, swap_deltas
+        base_sum = deck_pair_sum(counter.ids, pairs)
+        deltas = swap_deltas(counter.ids, pairs)
+        base = _with_pair_synergy(base, base_sum, counter.avg_elixir())
+    in_deck = set(counter.ids)
+    pool_ids = range(len(CARD_NAMES)) if pool is None else [CARD_ID[n] for n in pool if n in CARD_ID]
+    pool_ids = [c for c in pool_ids if c not in in_deck]
+
+    scored = []
+    for pos in range(len(counter.ids)):
+        for c in pool_ids:
+            m = counter.swap_metrics(pos, c)
+            if pairs is not None:
+                avg = average_elixir_sum(counter.elixir - ELIXIR[counter.ids[pos]] + ELIXIR[c],
+                                         len(counter.ids))
+                m = _with_pair_synergy(m, base_sum + float(deltas[pos, c]), avg)
+            gain = m["overall"] - base["overall"]
+            if gain > min_gain + GAIN_EPS:
+                scored.append((gain, pos, c, m))
+    scored.sort(key=lambda s: (-s[0], s[1], CARD_NAMES[s[2]]))
+
+    return [{"out": CARD_NAMES[counter.ids[pos]], "in": CARD_NAMES[c], "metrics": m,
+             "delta": {k: m[k] - base[k] for k in m}}
+            for gain, pos, c, m in scored[:top]]
@@ -0,0 +1,214 @@
+"""Synergy als som over kaartparen (opt-in engine naast synergy_score).
+
+synergy_score kijkt alleen of bepaalde tags ergens in het deck zitten; het
+kan niet uitdrukken dat Hog Rider en Ice Spirit samen sterker zijn dan elk
+apart. Hier krijgt elk kaartpaar een waarde in een N_CARDS x N_CARDS matrix:
+
+  - afgeleid uit tagparen (PAIR_RULES): elke wincon naast een building,
+    elke splash naast een swarm, ... krijgt de waarde van de regel;
+  - overschreven door benoemde paren uit een CSV (data/card_pairs.csv,
+    kolommen CardA,CardB,Value[,Reason]; of CRDA_PAIRS=<pad>).
+
+De matrix wordt één keer geladen. Deck-synergy is dan de som over de 28
+paren plus dezelfde elixirbonus als synergy_score, geknipt op [0, 1]. In
+batch is dat een gather over de 28 paarposities (score_decks --engine pairs);
+een swap kost O(8) (of O(8 x N_CARDS) voor alle swaps tegelijk, rank_swaps met
+pairs=...). solver.complete_deck gebruikt het niet: zijn bovengrens rekent met
+signatuurgroepen (tags, balans, wincon) en die zeggen niets over welke kaarten
+samen in het deck zitten. evaluate_deck en de benchmarks veranderen niet.
+
+    python -m synergy_matrix deck "Hog Rider;Ice Spirit;Musketeer;Cannon;..."
+    python -m synergy_matrix partners "Balloon" -k 10
+"""
+import argparse
+import csv
+import os
+import sys
+from itertools import combinations
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from card_index import CARD_ID, CARD_NAMES, N_CARDS, TAG_MASK, tag_bit
+from heuristics import evaluate_decks_batch, names_to_indices
+
+PAIRS_PATH = os.environ.get(
+    "CRDA_PAIRS", str(Path(__file__).resolve().parent / "data" / "card_pairs.csv"))
+
+# (tag kaart A, tag kaart B, waarde per paar); de volgorde binnen het paar maakt niet uit.
+PAIR_RULES: Tuple[Tuple[str, str, float], ...] = (
+    ("wincon", "building", 0.08),
+    ("wincon", "small_spell", 0.08),
+    ("splash", "swarm", 0.04),
+    ("tank_killer", "splash", 0.04),
+    ("wincon", "cycle", 0.02),
+    ("wincon", "wincon", -0.05),  # twee wincons concurreren om dezelfde elixir
+)
+
+# Paarposities binnen een deck van 8 (28 paren).
+PAIR_I, PAIR_J = (np.array(p) for p in zip(*combinations(range(8), 2)))
+
+
+def rule_matrix(rules: Sequence[Tuple[str, str, float]] = PAIR_RULES) -> np.ndarray:
+    """(N_CARDS, N_CARDS) symmetrische matrix uit tagregels, nul op de diagonaal."""
+    masks = np.array(TAG_MASK, dtype=np.int64)
+    P = np.zeros((N_CARDS, N_CARDS))
+    for a, b, value in rules:
+        has_a = (masks & tag_bit(a)) != 0
+        has_b = (masks & tag_bit(b)) != 0
+        P += value * (np.outer(has_a, has_b) | np.outer(has_b, has_a))
+    np.fill_diagonal(P, 0.0)
+    return P
+
+
+def read_overrides(path: str) -> List[Tuple[str, str, float]]:
+    """Benoemde paren (CardA, CardB, Value) uit een CSV; onbekende kaarten geven ValueError."""
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        rows = [(r["CardA"].strip(), r["CardB"].strip(), float(r["Value"]))
+                for r in csv.DictReader(f)]
+    unknown = sorted({c for a, b, _ in rows for c in (a, b) if c not in CARD_ID})
+    if unknown:
+        raise ValueError(f"{path}: onbekende kaart(en): {', '.join(unknown)}")
+    return rows
+
+
+def build_pair_matrix(overrides: Sequence[Tuple[str, str, float]] = ()) -> np.ndarray:
+    """rule_matrix met de benoemde paren erover (vervangen, niet opgeteld).
+
+    Heeft een extra nulrij en -kolom (index N_CARDS) voor lege slots (-1).
+    """
+    P = np.zeros((N_CARDS + 1, N_CARDS + 1))
+    P[:N_CARDS, :N_CARDS] = rule_matrix()
+    for a, b, value in overrides:
+        if a != b:
+            P[CARD_ID[a], CARD_ID[b]] = P[CARD_ID[b], CARD_ID[a]] = value
+    P.setflags(write=False)
+    return P
+
+
+_MATRIX: Optional[np.ndarray] = None
+
+
+def pair_matrix() -> np.ndarray:
+    """De gedeelde matrix: regels + PAIRS_PATH (als dat bestand bestaat), één keer geladen."""
+    global _MATRIX
+    if _MATRIX is None:
+        _MATRIX = build_pair_matrix(read_overrides(PAIRS_PATH) if os.path.exists(PAIRS_PATH)
+                                    else ())
+    return _MATRIX
+
+
+def _slots(indices: np.ndarray) -> np.ndarray:
+    idx = np.asarray(indices)
+    return np.where(idx >= 0, idx, N_CARDS)
+
+
+# ---------- Deck-synergy ----------
+def deck_pair_sum(ids: Sequence[int], P: Optional[np.ndarray] = None) -> float:
+    """Som van de paarwaarden over alle paren in het deck (kaart-ID's)."""
+    P = pair_matrix() if P is None else P
+    return float(sum(P[a, b] for a, b in combinations(ids, 2)))
+
+
+def pair_sums(indices: np.ndarray, P: Optional[np.ndarray] = None) -> np.ndarray:
+    """deck_pair_sum per rij van een (n, 8) indexmatrix (-1 = leeg)."""
+    P = pair_matrix() if P is None else P
+    g = _slots(indices)
+    if g.shape[1] < 8:
+        g = np.pad(g, ((0, 0), (0, 8 - g.shape[1])), constant_values=N_CARDS)
+    return P[g[:, PAIR_I], g[:, PAIR_J]].sum(axis=1)
+
+
+def synergy_from_pairs(pair_sum, avg_elixir):
+    """Synergy-metric: paarsom + elixirbonus van synergy_score, geknipt op [0, 1]."""
+    if isinstance(pair_sum, float) and isinstance(avg_elixir, (int, float)):
+        bonus = 0.2 if avg_elixir <= 3.1 else 0.1 if avg_elixir <= 4.0 else 0.0
+        return max(0.0, min(1.0, pair_sum + bonus))
+    avg = np.asarray(avg_elixir)
+    bonus = np.where(avg <= 3.1, 0.2, np.where(avg <= 4.0, 0.1, 0.0))
+    return np.clip(np.asarray(pair_sum) + bonus, 0.0, 1.0)
+
+
+def evaluate_decks_pairs(indices: np.ndarray, P: Optional[np.ndarray] = None) -> np.ndarray:
+    """evaluate_decks_batch met de paar-synergy in plaats van synergy_score."""
+    from weights import feature_matrix, rescore
+    out = evaluate_decks_batch(indices)
+    out["synergy"] = synergy_from_pairs(pair_sums(indices, P), out["avg_elixir"])
+    out["overall"] = rescore(feature_matrix(out))
+    return out
+
+
+# ---------- Incrementeel ----------
+def swap_delta(ids: Sequence[int], pos: int, card: int, P: Optional[np.ndarray] = None) -> float:
+    """Verandering van de paarsom als ids[pos] door `card` vervangen wordt: O(8)."""
+    P = pair_matrix() if P is None else P
+    out = ids[pos]
+    return float(sum(P[card, c] - P[out, c] for j, c in enumerate(ids) if j != pos))
+
+
+def swap_deltas(ids: Sequence[int], P: Optional[np.ndarray] = None) -> np.ndarray:
+    """(len(ids), N_CARDS) met swap_delta voor elke positie en elke kaart tegelijk.
+
+    Voor kaarten die al in het deck zitten is de waarde zinloos (dubbele kaart).
+    """
+    P = pair_matrix() if P is None else P
+    ids = np.asarray(ids)
+    row = P[:N_CARDS, ids].sum(axis=1)         # som met het hele deck per kandidaat
+    out = row[None, :] - P[:N_CARDS, ids].T     # zonder de kaart die eruit gaat
+    out -= (P[ids][:, ids].sum(axis=1))[:, None]  # paren van de uitgaande kaart vervallen
+    return out
+
+
+# ---------- CLI ----------
+def _deck_report(names: List[str], P: np.ndarray) -> Dict[str, object]:
+    idx = names_to_indices([names])
+    ids = [int(i) for i in idx[0] if i >= 0]
+    res = evaluate_decks_pairs(idx, P)[0]
+    base = evaluate_decks_batch(idx)[0]
+    pairs = sorted(((P[a, b], CARD_NAMES[a], CARD_NAMES[b]) for a, b in combinations(ids, 2)
+                    if P[a, b]), reverse=True)
+    return {"pairs": pairs, "pair_sum": deck_pair_sum(ids, P),
+            "synergy": (base["synergy"], res["synergy"]),
+            "overall": (base["overall"], res["overall"])}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    p = argparse.ArgumentParser(description="Paar-synergy van kaarten en decks.")
+    p.add_argument("--pairs", default=PAIRS_PATH, help="CSV met benoemde paren (CardA,CardB,Value)")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    d = sub.add_parser("deck", help="paren en synergy van één deck")
+    d.add_argument("cards", help='"Kaart1;Kaart2;..."')
+    q = sub.add_parser("partners", help="beste partners van een kaart")
+    q.add_argument("card")
+    q.add_argument("-k", type=int, default=10)
+    args = p.parse_args(argv)
+
+    try:
+        P = build_pair_matrix(read_overrides(args.pairs) if os.path.exists(args.pairs) else ())
+        if args.cmd == "deck":
+            names = [c.strip() for c in args.cards.split(";") if c.strip()]
+            unknown = [c for c in names if c not in CARD_ID]
+            if unknown:
+                raise ValueError(f"onbekende kaart(en): {', '.join(unknown)}")
+            rep = _deck_report(names, P)
+            for value, a, b in rep["pairs"]:
+                print(f"{value:+.2f}  {a} + {b}")
+            print(f"paarsom {rep['pair_sum']:.2f}; synergy {rep['synergy'][0]:.2f} -> "
+                  f"{rep['synergy'][1]:.2f}; overall {rep['overall'][0]:.3f} -> "
+                  f"{rep['overall'][1]:.3f}")
+        else:
+            if args.card not in CARD_ID:
+                raise ValueError(f"onbekende kaart: {args.card}")
+            row = P[CARD_ID[args.card], :N_CARDS]
+            for c in np.argsort(-row, kind="stable")[:args.k]:
+                if row[c] > 0:
+                    print(f"{row[c]:+.2f}  {CARD_NAMES[c]}")
+    except (OSError, KeyError, ValueError) as e:
+        print(f"Fout: {e}", file=sys.stderr)
+        return 2
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
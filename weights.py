@@ -0,0 +1,272 @@
+"""Overall herberekenen met andere gewichten, en gewichten fitten op uitkomsten.
+
+overall is een lineaire combinatie van vijf deelcijfers min een elixir-penalty
+(heuristics.OVERALL_WEIGHTS, PENALTY_FROM/SLOPE/MAX). De deelcijfers hangen
+niet van de gewichten af, dus ze worden één keer per deck berekend en als
+featurebestand (.npz) bewaard:
+
+  X  (N, 6) float64, kolommen FEATURES: balance, coverage, spells, wincon,
+     synergy, avg_elixir (kolomsgewijs opgeslagen)
+  y  optioneel, de uitkomst per deck (bv. winrate)
+  w  optioneel, een gewicht per deck (bv. aantal potjes)
+
+rescore() geeft overall voor een willekeurige Weights als één matrix-vector-
+product (kolom voor kolom opgeteld, zodat de standaardgewichten bitgelijk zijn
+aan evaluate_deck). fit() zoekt gewichten en penalty-parameters die de
+gewogen kwadratische fout tegen y minimaliseren: per penalty-combinatie uit
+een raster zijn de optimale gewichten een 5x5-stelsel, en omdat de penalty
+alleen van avg_elixir afhangt (hooguit een paar honderd unieke waarden)
+kosten alle rastercombinaties samen alleen kleine matrixproducten. Alleen het
+opbouwen van de sufficient statistics loopt één keer over alle rijen.
+
+    python -m weights features decks_with_winrate.csv -o feats.npz --outcome WinRate --weight Games
+    python -m weights fit feats.npz -o weights.json
+    python -m weights rescore feats.npz --weights weights.json -o overall.npy
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from heuristics import (OVERALL_WEIGHTS, PENALTY_FROM, PENALTY_MAX, PENALTY_SLOPE,
+                        elixir_penalty, evaluate_decks_batch, names_to_indices)
+
+METRICS = ("balance", "coverage", "spells", "wincon", "synergy")
+FEATURES = METRICS + ("avg_elixir",)
+# Kolomnamen zoals score_decks ze schrijft.
+_TABLE_COLUMNS = {"Balance": "balance", "Coverage": "coverage", "Spells": "spells",
+                  "Wincon": "wincon", "Synergy": "synergy", "AvgElixir": "avg_elixir"}
+
+# Standaardraster voor fit(): penalty-start, helling en maximum.
+GRID_FROM = tuple(np.round(np.arange(3.0, 6.01, 0.1), 2))
+GRID_SLOPE = tuple(np.round(np.arange(0.0, 0.501, 0.02), 2))
+GRID_MAX = tuple(np.round(np.arange(0.05, 0.501, 0.05), 2))
+
+
+class Weights(NamedTuple):
+    balance: float
+    coverage: float
+    spells: float
+    wincon: float
+    synergy: float
+    penalty_from: float
+    penalty_slope: float
+    penalty_max: float
+
+    @property
+    def vector(self) -> np.ndarray:
+        return np.array(self[:len(METRICS)], dtype=np.float64)
+
+    def to_json(self) -> Dict[str, Any]:
+        return {"weights": dict(zip(METRICS, self[:len(METRICS)])),
+                "penalty": {"from": self.penalty_from, "slope": self.penalty_slope,
+                            "max": self.penalty_max}}
+
+    @classmethod
+    def from_json(cls, d: Dict[str, Any]) -> "Weights":
+        p = d.get("penalty", {})
+        return cls(*(float(d["weights"][m]) for m in METRICS),
+                   float(p.get("from", PENALTY_FROM)), float(p.get("slope", PENALTY_SLOPE)),
+                   float(p.get("max", PENALTY_MAX)))
+
+
+DEFAULT = Weights(*(OVERALL_WEIGHTS[m] for m in METRICS), PENALTY_FROM, PENALTY_SLOPE, PENALTY_MAX)
+
+
+# ---------- features ----------
+def feature_matrix(metrics) -> np.ndarray:
+    """(N, 6) featurematrix uit een BATCH_DTYPE-array, DataFrame of dict met kolommen."""
+    return np.column_stack([np.asarray(metrics[f], dtype=np.float64) for f in FEATURES]) \
+        .copy(order="F")
+
+
+def features_from_table(path: str, outcome: Optional[str] = None,
+                        weight: Optional[str] = None) -> Tuple[np.ndarray, Optional[np.ndarray],
+                                                               Optional[np.ndarray]]:
+    """Features (en uitkomst/gewicht) uit een tabel of een .decks-corpus.
+
+    Tabellen (CSV/JSONL/Parquet) met een kolom Cards ("A;B;...") of Card1..Card8
+    worden opnieuw gescoord; anders worden de afgeronde metrickolommen van
+    score_decks gebruikt.
+    """
+    if path.endswith(".decks"):
+        from deck_corpus import load_corpus
+        if outcome or weight:
+            raise ValueError(".decks-bestanden hebben geen uitkomstkolom; gebruik een tabel.")
+        return feature_matrix(load_corpus(path).metrics()), None, None
+    import pandas as pd
+    if path.endswith(".parquet"):
+        df = pd.read_parquet(path)
+    elif path.endswith((".jsonl", ".ndjson")):
+        df = pd.read_json(path, lines=True)
+    else:
+        df = pd.read_csv(path, encoding="utf-8-sig")
+    card_cols = [f"Card{i}" for i in range(1, 9)]
+    if "Cards" in df.columns or all(c in df.columns for c in card_cols):
+        decks = (df["Cards"].fillna("").map(lambda s: [c.strip() for c in s.split(";")
+                                                        if c.strip()])
+                 if "Cards" in df.columns
+                 else df[card_cols].fillna("").apply(lambda r: [c for c in r if c], axis=1))
+        X = feature_matrix(evaluate_decks_batch(names_to_indices(decks.tolist())))
+    elif all(c in df.columns for c in _TABLE_COLUMNS):
+        X = feature_matrix({f: df[c] for c, f in _TABLE_COLUMNS.items()})
+    else:
+        raise ValueError(f"{path}: geen Cards/Card1..Card8 of metrickolommen gevonden.")
+
+    def column(name: Optional[str]) -> Optional[np.ndarray]:
+        if name is None:
+            return None
+        if name not in df.columns:
+            raise ValueError(f"{path}: kolom {name!r} ontbreekt.")
+        return df[name].to_numpy(dtype=np.float64)
+    return X, column(outcome), column(weight)
+
+
+def save_features(path: str, X: np.ndarray, y: Optional[np.ndarray] = None,
+                  w: Optional[np.ndarray] = None) -> None:
+    arrays = {"X": X, "columns": np.array(FEATURES)}
+    if y is not None:
+        arrays["y"] = y
+    if w is not None:
+        arrays["w"] = w
+    np.savez(path, **arrays)
+
+
+def load_features(path: str) -> Tuple[np.ndarray, Optional[np.ndarray], Optional[np.ndarray]]:
+    with np.load(path) as z:
+        if tuple(z["columns"]) != FEATURES:
+            raise ValueError(f"{path}: onverwachte kolommen {tuple(z['columns'])}")
+        return (np.asfortranarray(z["X"]), z["y"] if "y" in z else None,
+                z["w"] if "w" in z else None)
+
+
+# ---------- herberekenen ----------
+def rescore(X: np.ndarray, weights: Weights = DEFAULT) -> np.ndarray:
+    """overall per rij van X voor de gegeven gewichten."""
+    base = X[:, 0] * weights.balance
+    for j, wj in enumerate(weights.vector[1:], 1):
+        base += X[:, j] * wj
+    base -= elixir_penalty(X[:, 5], weights.penalty_from, weights.penalty_slope,
+                           weights.penalty_max)
+    return np.clip(base, 0.0, 1.0, out=base)
+
+
+def evaluate(overall: np.ndarray, y: np.ndarray,
+             w: Optional[np.ndarray] = None) -> Dict[str, float]:
+    """Gewogen kwadratische fout en correlatie van overall tegen de uitkomst."""
+    w = np.ones(len(y)) if w is None else w
+    mse = float(np.average((overall - y) ** 2, weights=w))
+    mo, my = np.average(overall, weights=w), np.average(y, weights=w)
+    cov = np.average((overall - mo) * (y - my), weights=w)
+    var = np.average((overall - mo) ** 2, weights=w) * np.average((y - my) ** 2, weights=w)
+    return {"mse": mse, "corr": float(cov / np.sqrt(var)) if var > 0 else 0.0}
+
+
+# ---------- fitten ----------
+def fit(X: np.ndarray, y: np.ndarray, w: Optional[np.ndarray] = None,
+        grid_from: Sequence[float] = GRID_FROM, grid_slope: Sequence[float] = GRID_SLOPE,
+        grid_max: Sequence[float] = GRID_MAX) -> Tuple[Weights, Dict[str, Any]]:
+    """Kleinste-kwadraten-fit van de vijf gewichten, per penalty-combinatie uit het raster.
+
+    Minimaliseert sum(w * (F @ v - P - y)^2) zonder de clip naar [0, 1]; het
+    rapport bevat voor de winnaar en voor DEFAULT ook de fout mét clip.
+    """
+    keep = np.isfinite(y) if w is None else np.isfinite(y) & np.isfinite(w) & (w > 0)
+    X, y = X[keep], y[keep]
+    w = np.ones(len(y)) if w is None else w[keep]
+    if not len(y):
+        raise ValueError("geen rijen met een geldige uitkomst.")
+    F = X[:, :len(METRICS)]
+    levels, group = np.unique(X[:, 5], return_inverse=True)
+
+    # Sufficient statistics: één pass over de rijen.
+    Fw = F * w[:, None]
+    G = F.T @ Fw                                                   # (5, 5)
+    b_y = Fw.T @ y                                                 # (5,)
+    S = np.column_stack([np.bincount(group, weights=Fw[:, j], minlength=len(levels))
+                         for j in range(F.shape[1])])              # (K, 5)
+    n_k = np.bincount(group, weights=w, minlength=len(levels))     # (K,)
+    y_k = np.bincount(group, weights=w * y, minlength=len(levels))  # (K,)
+    yy = float(w @ (y * y))
+
+    grid = np.array(np.meshgrid(grid_from, grid_slope, grid_max, indexing="ij")).reshape(3, -1).T
+    P = elixir_penalty(levels[None, :], grid[:, :1], grid[:, 1:2], grid[:, 2:3])  # (M, K)
+    B = b_y[None, :] + P @ S                                       # F'W(y + P) per combinatie
+    V = B @ np.linalg.pinv(G)                                      # G is symmetrisch
+    loss = yy + 2 * P @ y_k + (P * P) @ n_k - np.einsum("mj,mj->m", B, V)
+    best = int(np.argmin(loss))
+    fitted = Weights(*V[best].tolist(), *grid[best].tolist())
+
+    report = {
+        "rows": int(len(y)), "grid": int(len(grid)),
+        "fitted": {**fitted.to_json(), **evaluate(rescore(X, fitted), y, w),
+                   "mse_unclipped": float(loss[best] / w.sum())},
+        "default": {**DEFAULT.to_json(), **evaluate(rescore(X, DEFAULT), y, w)},
+    }
+    return fitted, report
+
+
+def _load_weights(spec: Optional[str]) -> Weights:
+    """--weights: een JSON-bestand van fit of 'b,c,s,w,syn[,van,helling,max]'."""
+    if not spec:
+        return DEFAULT
+    if Path(spec).is_file():
+        d = json.loads(Path(spec).read_text(encoding="utf-8"))
+        return Weights.from_json(d.get("fitted", d))
+    vals = [float(v) for v in spec.split(",")]
+    if len(vals) not in (5, 8):
+        raise ValueError("--weights verwacht 5 gewichten (plus optioneel 3 penalty-parameters).")
+    return Weights(*vals, *DEFAULT[len(vals):])
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    p = argparse.ArgumentParser(description="Overall herwegen en gewichten fitten.")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    pf = sub.add_parser("features", help="featurebestand (.npz) maken uit een tabel of .decks")
+    pf.add_argument("input")
+    pf.add_argument("-o", "--output", required=True)
+    pf.add_argument("--outcome", help="kolom met de uitkomst (bv. WinRate)")
+    pf.add_argument("--weight", help="kolom met een gewicht per rij (bv. Games)")
+    pr = sub.add_parser("rescore", help="overall voor andere gewichten")
+    pr.add_argument("features")
+    pr.add_argument("--weights", help="fit-JSON of 'b,c,s,w,syn[,van,helling,max]'")
+    pr.add_argument("-o", "--output", help="overall als .npy")
+    pt = sub.add_parser("fit", help="gewichten en penalty fitten op de uitkomst")
+    pt.add_argument("features")
+    pt.add_argument("-o", "--output", help="rapport met de gefitte gewichten (JSON)")
+    args = p.parse_args(argv)
+
+    try:
+        if args.cmd == "features":
+            X, y, w = features_from_table(args.input, args.outcome, args.weight)
+            save_features(args.output, X, y, w)
+            print(f"{len(X)} decks -> {args.output}", file=sys.stderr)
+            return 0
+        X, y, w = load_features(args.features)
+        if args.cmd == "rescore":
+            overall = rescore(X, _load_weights(args.weights))
+            if args.output:
+                np.save(args.output, overall)
+            out = {"rows": len(overall), "mean": float(overall.mean()) if len(overall) else 0.0}
+            if y is not None:
+                out.update(evaluate(overall, y, w))
+            print(json.dumps(out, indent=2))
+            return 0
+        if y is None:
+            raise ValueError(f"{args.features} bevat geen uitkomst; maak het met --outcome.")
+        _, report = fit(X, y, w)
+    except (OSError, KeyError, ValueError) as e:
+        print(f"Fout: {e}", file=sys.stderr)
+        return 2
+    text = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(text, encoding="utf-8")
+    print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())